@@ -0,0 +1,197 @@
+"""
+准入控制 - CPU/上游密集型接口的有界队列与背压
+
+每类工作（抠图推理、语音识别、TTS）一个 AdmissionGate：
+- 最多 concurrency 个任务同时执行，另有 queue_size 个排队名额
+- 名额用完时立即拒绝（Overloaded → 429 + Retry-After），而不是把请求都收进来一起拖慢
+- 单次请求超过队列总容量时重试也不会成功，返回 413（不带 Retry-After），提示分批提交
+- 根据最近任务的平均耗时估算排队等待时间，/queue_status 返回给前端显示
+
+批量接口按任务数占用名额（例如 50 张图片占 50 个推理名额），一次请求不能超过队列总容量。
+
+用法：
+    with get_gate('inference').admit(units=len(urls)):
+        ...                                  # 同步代码：只占名额，并发由推理线程池限制
+
+    @limited('tts')
+    async def synthesize_speech_data(data):  # 异步代码：占名额并等待执行槽位
+        ...
+"""
+
+import math
+import time
+import asyncio
+import weakref
+import functools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+import config
+from metrics import QUEUE_DEPTH, ADMISSION_REJECTS
+
+
+class Overloaded(Exception):
+    """队列已满，请求被拒绝（HTTP 429）；retry_after 为 None 表示请求超过队列总容量（HTTP 413，不应重试）"""
+
+    def __init__(self, gate, units: int, retry_after: int = None):
+        self.gate = gate
+        self.units = units
+        self.retry_after = retry_after
+        self.status_code = 429 if retry_after is not None else 413
+        if retry_after is None:
+            message = f'一次最多处理 {gate.capacity} 个任务，请分批提交'
+        else:
+            message = f'服务繁忙，前面还有 {gate.inflight} 个任务，请约 {retry_after} 秒后重试'
+        super().__init__(message)
+
+    def to_dict(self) -> dict:
+        return {
+            'success': False,
+            'error': str(self),
+            'queue': self.gate.name,
+            'retry_after': self.retry_after,
+            'status': self.gate.status(),
+        }
+
+
+class AdmissionGate:
+    """单类工作的准入控制（线程安全，可同时用于同步线程和多个事件循环）"""
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, initial_seconds: float):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.capacity = self.concurrency + self.queue_size
+        self.inflight = 0                   # 已接收（执行中 + 排队中）的任务数
+        self.running = 0                    # 执行中的任务数（仅 slot() 统计）
+        self.avg_seconds = initial_seconds  # 单个任务平均耗时（指数滑动平均）
+        self._lock = threading.Lock()
+        self._semaphores = weakref.WeakKeyDictionary()   # 每个事件循环一个信号量
+        QUEUE_DEPTH.set_function(lambda: self.inflight, queue=name)
+
+    def eta(self, units: int = 0) -> float:
+        """估算再加入 units 个任务后，最后一个任务完成还需要的秒数"""
+        return math.ceil((self.inflight + units) / self.concurrency) * self.avg_seconds
+
+    def _retry_after(self, units: int) -> int:
+        # 至少要等到足够多的任务完成腾出名额
+        excess = self.inflight + units - self.capacity
+        return max(1, math.ceil(max(1, excess) / self.concurrency * self.avg_seconds))
+
+    def try_acquire(self, units: int = 1):
+        """占用 units 个名额，名额不足时抛出 Overloaded"""
+        if units > self.capacity:
+            ADMISSION_REJECTS.inc(queue=self.name)
+            print(f"请求超过队列容量，拒绝: {self.name} (容量 {self.capacity}, 请求 {units})", flush=True)
+            raise Overloaded(self, units)
+        with self._lock:
+            if self.inflight + units > self.capacity:
+                retry_after = self._retry_after(units)
+            else:
+                self.inflight += units
+                return
+        ADMISSION_REJECTS.inc(queue=self.name)
+        print(f"队列已满，拒绝请求: {self.name} ({self.inflight}/{self.capacity}, 请求 {units})", flush=True)
+        raise Overloaded(self, units, retry_after)
+
+    def release(self, units: int = 1, elapsed: float = None):
+        """归还名额；elapsed 为这批任务的总耗时，用于更新平均耗时"""
+        with self._lock:
+            self.inflight = max(0, self.inflight - units)
+            if elapsed is not None and units > 0:
+                # 同一批任务并发执行，单个任务耗时按并发度折算
+                per_unit = elapsed * min(units, self.concurrency) / units
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * per_unit
+
+    @contextmanager
+    def admit(self, units: int = 1):
+        """同步代码中占用名额（执行并发由调用方自己的线程池限制）"""
+        self.try_acquire(units)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(units, time.perf_counter() - start)
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def slot(self):
+        """异步代码中占用名额并等待执行槽位（最多 concurrency 个同时执行）"""
+        self.try_acquire(1)
+        try:
+            async with self._semaphore():
+                with self._lock:
+                    self.running += 1
+                start = time.perf_counter()
+                try:
+                    yield
+                finally:
+                    with self._lock:
+                        self.running -= 1
+                    elapsed = time.perf_counter() - start
+        except BaseException:
+            self.release(1)
+            raise
+        self.release(1, elapsed)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'concurrency': self.concurrency,
+                'capacity': self.capacity,
+                'inflight': self.inflight,
+                'running': self.running,
+                'available': max(0, self.capacity - self.inflight),
+                'avg_seconds': round(self.avg_seconds, 2),
+                'eta_seconds': round(self.eta(), 1),
+            }
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def _gate_settings(name: str) -> dict:
+    settings = dict(config.ADMISSION_CONFIG[name])
+    if name == 'inference' and not settings.get('concurrency'):
+        # 默认与推理线程池大小一致
+        from host_tuning import load_tuning
+        settings['concurrency'] = load_tuning()['inference_workers']
+    return settings
+
+
+def get_gate(name: str) -> AdmissionGate:
+    """获取指定类别的准入控制（'inference'、'asr'、'tts'）"""
+    gate = _gates.get(name)
+    if gate is None:
+        with _gates_lock:
+            gate = _gates.get(name)
+            if gate is None:
+                settings = _gate_settings(name)
+                gate = AdmissionGate(name, settings['concurrency'], settings['queue_size'],
+                                     settings['initial_seconds'])
+                _gates[name] = gate
+    return gate
+
+
+def limited(name: str):
+    """异步函数装饰器：在 name 类别的执行槽位中运行"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with get_gate(name).slot():
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def queue_status() -> dict:
+    """所有类别的队列状态（前端据此显示预计等待时间）"""
+    return {name: get_gate(name).status() for name in config.ADMISSION_CONFIG}
@@ -14,12 +14,17 @@ import json
 import time
 import tempfile
 import subprocess
-import httpx
+import asyncio
 import hashlib
 import hmac
 import base64
 import urllib.parse
 from datetime import datetime, timezone
+from http_transport import get_async_client, get_client
+from metrics import stage, UPSTREAM_ERRORS
+from job_store import get_job_store
+from circuit_breaker import get_breaker, CircuitOpen
+from video_cache import cache_key
 
 # 阿里云配置 - 请通过环境变量设置
 ALIYUN_ACCESS_KEY_ID = os.getenv('ALIYUN_ACCESS_KEY_ID', '')
@@ -82,24 +87,30 @@ class AliyunASR:
             'X-NLS-Token': token,
         }
 
-        response = httpx.post(
-            url,
-            content=audio_data,
-            headers=headers,
-            timeout=180.0
-        )
+        with get_breaker('aliyun_asr').guard(), stage('asr_chunk'):
+            response = get_client('aliyun').post(
+                url,
+                content=audio_data,
+                headers=headers,
+                timeout=180.0
+            )
 
-        result = response.json()
+            result = response.json()
 
-        if result.get('status') == 20000000:
-            return result.get('result', '')
-        else:
-            raise Exception(f"阿里云ASR错误: {result.get('message', '未知错误')} (状态码: {result.get('status')})")
+            if result.get('status') == 20000000:
+                return result.get('result', '')
+            else:
+                UPSTREAM_ERRORS.inc(service='aliyun_asr')
+                raise Exception(f"阿里云ASR错误: {result.get('message', '未知错误')} (状态码: {result.get('status')})")
 
-    def transcribe_short(self, audio_path: str) -> str:
+    def transcribe_short(self, audio_path: str, job=None) -> str:
         """
         一句话识别（支持长音频分段处理）
         使用 RESTful API
+
+        Args:
+            audio_path: 视频/音频文件路径
+            job: 持久化任务（job_store.DurableJob），传入时逐段记录识别结果，中断后再次识别跳过已完成的分段
         """
         if not self.access_key_id or not self.access_key_secret or not self.appkey:
             raise ValueError("请先设置阿里云配置")
@@ -108,7 +119,8 @@ class AliyunASR:
         try:
             # 提取音频
             print(f"正在提取音频: {audio_path}", flush=True)
-            wav_path = self.extract_audio(audio_path)
+            with stage('audio_extract'):
+                wav_path = self.extract_audio(audio_path)
 
             # 读取音频文件
             with open(wav_path, 'rb') as f:
@@ -139,9 +151,17 @@ class AliyunASR:
                 # 长音频，分段处理
                 num_chunks = (len(pcm_data) + max_chunk_size - 1) // max_chunk_size
                 print(f"音频较长，将分成 {num_chunks} 段处理...", flush=True)
+                if job is not None:
+                    job.set_total(num_chunks)
 
                 results = []
                 for i in range(num_chunks):
+                    # 上次中断前已识别的分段
+                    done = job.item(i) if job is not None else None
+                    if done is not None:
+                        results.append(done['text'])
+                        continue
+
                     start = i * max_chunk_size
                     end = min((i + 1) * max_chunk_size, len(pcm_data))
                     chunk_pcm = pcm_data[start:end]
@@ -153,6 +173,11 @@ class AliyunASR:
                     try:
                         text = self.transcribe_chunk(chunk_wav, token)
                         results.append(text)
+                        if job is not None:
+                            job.save_item(i, {'text': text})
+                    except CircuitOpen:
+                        # 熔断中后续分段也会失败，直接结束（已完成的分段保留在任务记录中）
+                        raise
                     except Exception as e:
                         print(f"第 {i+1} 段处理失败: {e}", flush=True)
                         results.append("")
@@ -234,7 +259,7 @@ class AliyunASR:
         params['Signature'] = signature
 
         # 发送请求
-        response = httpx.get(url, params=params, timeout=30)
+        response = get_client('aliyun').get(url, params=params, timeout=30)
         result = response.json()
 
         if 'Token' in result:
@@ -255,14 +280,14 @@ class AliyunASR:
 
         try:
             print(f"正在下载视频: {video_url[:80]}...", flush=True)
-            async with httpx.AsyncClient(follow_redirects=True, timeout=180.0) as client:
-                async with client.stream('GET', video_url, headers=headers) as response:
-                    if response.status_code >= 400:
-                        raise Exception(f"HTTP {response.status_code}")
-                    total = 0
-                    async for chunk in response.aiter_bytes(chunk_size=8192):
-                        temp_file.write(chunk)
-                        total += len(chunk)
+            client = get_async_client('cdn')
+            async with client.stream('GET', video_url, headers=headers) as response:
+                if response.status_code >= 400:
+                    raise Exception(f"HTTP {response.status_code}")
+                total = 0
+                async for chunk in response.aiter_bytes(chunk_size=8192):
+                    temp_file.write(chunk)
+                    total += len(chunk)
             temp_file.close()
             print(f"视频下载完成，大小: {total / 1024 / 1024:.2f} MB", flush=True)
             return temp_path
@@ -273,17 +298,41 @@ class AliyunASR:
             raise Exception(f"下载视频失败: {str(e)}")
 
     async def transcribe_from_url(self, video_url: str) -> str:
-        """从视频URL转录语音"""
+        """
+        从视频URL转录语音
+
+        长视频的分段识别结果记录在任务记录中（按视频ID），worker 中断后再次识别同一视频时从断点继续
+        """
+        job = await asyncio.to_thread(
+            get_job_store().open, 'aliyun_asr', {'video': cache_key(video_url)})
+        if job.all_done:
+            text = ''.join(job.item(i)['text'] for i in range(job.total))
+            await asyncio.to_thread(job.finish, {'length': len(text)})
+            return text
+
         temp_path = None
         try:
+            # 熔断中不再下载视频和提取音频
+            get_breaker('aliyun_asr').ensure_available()
+
             # 下载视频
-            temp_path = await self.download_video(video_url)
+            with stage('video_download'):
+                temp_path = await self.download_video(video_url)
 
-            # 转录音频
-            text = self.transcribe_short(temp_path)
+            # 转录音频（同步调用，放到线程中执行，避免阻塞事件循环）
+            text = await asyncio.to_thread(self.transcribe_short, temp_path, job)
 
+            # 有分段失败时保留进度，下次只重试失败的分段
+            if job.total is not None and not job.all_done:
+                await asyncio.to_thread(job.fail, '部分分段识别失败')
+            else:
+                await asyncio.to_thread(job.finish, {'length': len(text)})
             return text
 
+        except Exception as e:
+            await asyncio.to_thread(job.fail, str(e))
+            raise
+
         finally:
             # 清理临时文件
             if temp_path and os.path.exists(temp_path):
@@ -13,6 +13,9 @@ import base64
 import urllib.parse
 from datetime import datetime, timezone
 import httpx
+from http_transport import get_async_client
+from metrics import stage, UPSTREAM_ERRORS
+from circuit_breaker import get_breaker
 
 
 # 阿里云配置（已内置，无需配置）
@@ -113,22 +116,22 @@ class AliyunTTS:
             signature = self._generate_signature(params, 'GET')
             params['Signature'] = signature
 
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(TOKEN_URL, params=params)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    if 'Token' in data and 'Id' in data['Token']:
-                        self.token = data['Token']['Id']
-                        # token有效期为24小时，这里设置为23小时后过期
-                        self.token_expire_time = current_time + 23 * 3600
-                        print(f"✅ Token获取成功，有效期至: {datetime.fromtimestamp(self.token_expire_time).strftime('%Y-%m-%d %H:%M:%S')}")
-                        return self.token
-                    else:
-                        raise Exception(f"Token响应格式错误: {data}")
+            client = get_async_client('aliyun')
+            response = await client.get(TOKEN_URL, params=params, timeout=10.0)
+
+            if response.status_code == 200:
+                data = response.json()
+                if 'Token' in data and 'Id' in data['Token']:
+                    self.token = data['Token']['Id']
+                    # token有效期为24小时，这里设置为23小时后过期
+                    self.token_expire_time = current_time + 23 * 3600
+                    print(f"✅ Token获取成功，有效期至: {datetime.fromtimestamp(self.token_expire_time).strftime('%Y-%m-%d %H:%M:%S')}")
+                    return self.token
                 else:
-                    error_msg = response.text[:300]
-                    raise Exception(f"获取Token失败 (HTTP {response.status_code}): {error_msg}")
+                    raise Exception(f"Token响应格式错误: {data}")
+            else:
+                error_msg = response.text[:300]
+                raise Exception(f"获取Token失败 (HTTP {response.status_code}): {error_msg}")
 
         except httpx.RequestError as e:
             raise Exception(f"获取Token网络请求失败: {str(e)}")
@@ -178,10 +181,13 @@ class AliyunTTS:
             'pitch_rate': pitch_rate,
         }
 
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
+        # 熔断中直接失败，不再等待超时
+        with get_breaker('aliyun_tts').guard():
+            try:
+                client = get_async_client('aliyun')
                 # 使用GET请求
-                response = await client.get(TTS_URL, params=params)
+                with stage('tts_segment'):
+                    response = await client.get(TTS_URL, params=params, timeout=60.0)
 
                 if response.status_code == 200:
                     # 检查返回的内容类型
@@ -190,6 +196,7 @@ class AliyunTTS:
                     # 如果返回的是JSON，说明有错误
                     if 'json' in content_type:
                         error_data = response.json()
+                        UPSTREAM_ERRORS.inc(service='aliyun_tts')
                         raise Exception(f"TTS合成失败: {error_data}")
 
                     # 返回音频数据
@@ -204,12 +211,27 @@ class AliyunTTS:
                     except:
                         error_msg = response.text[:200]
 
+                    UPSTREAM_ERRORS.inc(service='aliyun_tts')
                     raise Exception(f"TTS请求失败 (HTTP {response.status_code}): {error_msg}")
 
-        except httpx.TimeoutException:
-            raise Exception("TTS请求超时，请稍后重试")
-        except httpx.RequestError as e:
-            raise Exception(f"TTS网络请求失败: {str(e)}")
+            except httpx.TimeoutException:
+                UPSTREAM_ERRORS.inc(service='aliyun_tts')
+                raise Exception("TTS请求超时，请稍后重试")
+            except httpx.RequestError as e:
+                UPSTREAM_ERRORS.inc(service='aliyun_tts')
+                raise Exception(f"TTS网络请求失败: {str(e)}")
+
+
+# 全局实例（复用Token，避免每次合成都重新获取）
+_aliyun_tts = None
+
+
+def get_aliyun_tts() -> AliyunTTS:
+    """获取全局阿里云TTS实例"""
+    global _aliyun_tts
+    if _aliyun_tts is None:
+        _aliyun_tts = AliyunTTS()
+    return _aliyun_tts
 
 
 async def text_to_speech(
@@ -232,7 +254,7 @@ async def text_to_speech(
     返回:
         MP3音频数据
     """
-    tts = AliyunTTS()
+    tts = get_aliyun_tts()
     return await tts.synthesize(
         text=text,
         voice=voice,
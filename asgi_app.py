@@ -0,0 +1,242 @@
+"""
+ASGI 服务入口 - 与 web_app 相同的路由，I/O 密集接口原生异步
+
+用法：
+    SERVER_MODE=asgi gunicorn -c gunicorn.conf.py
+    或 uvicorn asgi_app:app --host 0.0.0.0 --port 7860
+
+- 解析 / 语音识别 / TTS / 代理下载 在事件循环上直接 await，
+  一个慢请求（如 Playwright 渲染商品页，最长约 60 秒）不会阻塞其他用户
+- 抠图等 CPU 密集接口仍由 Flask 处理（挂载为 WSGI 子应用，在线程池中运行），
+  推理本身提交到 image_processor.get_inference_executor()（或 INFERENCE_BACKEND=broker 时的推理 worker）
+"""
+
+import time
+import json
+import asyncio
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import config
+import web_app
+import metrics
+import request_timing
+from admission import Overloaded
+from http_transport import get_async_client
+from image_fetcher import get_image_fetcher
+from audio_cache import get_audio_cache
+from video_info_cache import get_video_info_cache
+from video_cache import get_video_cache, cache_key, is_full_request, expected_length, proxy_headers
+from zip_stream import ZipStreamWriter
+
+# WSGI 子应用的线程数：同时处理的同步请求上限
+WSGI_WORKERS = 16
+
+
+def timed(route: str, handler):
+    """统计原生异步路由的请求耗时并写入 Server-Timing（Flask 路由由 web_app 自己处理）"""
+    async def wrapper(request):
+        start = time.perf_counter()
+        status = 500
+        recorder, token = request_timing.start_request()
+        try:
+            try:
+                response = await handler(request)
+            except Overloaded as e:
+                # 队列已满：与 Flask 路由一致返回 429 + Retry-After（超过队列容量返回 413）
+                response = JSONResponse(e.to_dict(), status_code=e.status_code,
+                                        headers={} if e.retry_after is None else {'Retry-After': str(e.retry_after)})
+            status = response.status_code
+            response.headers['Server-Timing'] = recorder.server_timing()
+            if (isinstance(response, JSONResponse)
+                    and request_timing.wants_timings(request.query_params, request.headers)):
+                data = json.loads(response.body)
+                if isinstance(data, dict):
+                    data['timings'] = recorder.to_dict()
+                    response.body = response.render(data)
+                    response.headers['Content-Length'] = str(len(response.body))
+            return response
+        finally:
+            request_timing.end_request(token)
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method,
+                                            status=status)
+    return wrapper
+
+
+async def _json_body(request) -> dict:
+    """读取 JSON 请求体，格式错误时返回空字典（与 Flask 的 get_json(silent=True) 一致）"""
+    try:
+        data = await request.json()
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def parse_video(request):
+    """解析抖音视频，提取视频链接和文案"""
+    data = await _json_body(request)
+    return JSONResponse(await web_app.parse_video_data(data.get('url', '')))
+
+
+async def parse_product(request):
+    """解析抖音商品页面，提取所有图片"""
+    data = await _json_body(request)
+    return JSONResponse(await web_app.parse_product_data(data.get('url', '')))
+
+
+async def _tts_response(request, synthesize):
+    """TTS 响应：默认返回 MP3 字节，失败或旧客户端返回 JSON（与 web_app.tts_response 一致）"""
+    data = await _json_body(request)
+    result = await synthesize(data)
+    if not result.get('success'):
+        return JSONResponse(result)
+    accept = parse_accept_header(request.headers.get('accept'), MIMEAccept)
+    if web_app.wants_json_audio(data, request.query_params, accept):
+        return JSONResponse(web_app.tts_json_result(result))
+
+    audio_id = get_audio_cache().put(result['audio_data'], {
+        'engine': result.get('engine'),
+        'voice': result.get('voice'),
+    })
+    # 需要 Range 分段读取时使用 X-Audio-Url（/tts_audio/<audio_id>，由 Flask 处理）
+    return Response(result['audio_data'], media_type='audio/mpeg',
+                    headers=web_app.tts_audio_headers(result, audio_id))
+
+
+async def synthesize_speech(request):
+    """文字转语音（阿里云）"""
+    return await _tts_response(request, web_app.synthesize_speech_data)
+
+
+async def synthesize_speech_tencent(request):
+    """文字转语音（腾讯云）"""
+    return await _tts_response(request, web_app.synthesize_speech_tencent_data)
+
+
+async def synthesize_speech_custom(request):
+    """文字转语音（腾讯云自定义音色）"""
+    return await _tts_response(request, web_app.synthesize_speech_custom_data)
+
+
+async def download_video(request):
+    """代理下载抖音视频（流式转发，不占用线程；缓存与 Range 处理同 web_app.download_video）"""
+    video_url = request.query_params.get('url', '')
+    if not video_url:
+        return JSONResponse({'success': False, 'error': '缺少视频URL'}, status_code=400)
+    inline = request.query_params.get('inline') == '1'
+
+    cache = get_video_cache()
+    key = cache_key(video_url)
+    cached_path = cache.get(key)
+    if cached_path:
+        return FileResponse(cached_path, media_type='video/mp4',
+                            filename=None if inline else 'douyin_video.mp4',
+                            content_disposition_type='inline' if inline else 'attachment')
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15',
+        'Referer': 'https://www.douyin.com/',
+        'Accept': '*/*',
+    }
+    range_header = request.headers.get('range')
+    full_request = is_full_request(range_header)
+    if not full_request:
+        headers['Range'] = range_header
+
+    client = get_async_client('cdn')
+    try:
+        upstream = await client.send(client.build_request('GET', video_url, headers=headers), stream=True)
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': f'下载失败: {str(e)}'}, status_code=500)
+
+    if upstream.status_code not in (200, 206):
+        await upstream.aclose()
+        video_id = request.query_params.get('video_id')
+        if upstream.status_code in (403, 404, 410) and video_id:
+            get_video_info_cache().invalidate_url(video_id, video_url)
+        return JSONResponse({'success': False, 'error': f'下载失败: HTTP {upstream.status_code}'}, status_code=400)
+
+    writer = cache.writer(key) if full_request and upstream.status_code == 200 else None
+
+    async def generate():
+        completed = False
+        try:
+            async for chunk in upstream.aiter_bytes(config.VIDEO_CACHE_CONFIG['chunk_size']):
+                if writer:
+                    # 本地磁盘顺序写入，单块耗时远小于网络读取，直接在事件循环中写
+                    writer.write(chunk)
+                yield chunk
+            completed = True
+        finally:
+            await upstream.aclose()
+            if writer:
+                if completed:
+                    writer.commit(expected_length(upstream.headers))
+                else:
+                    writer.abort()
+
+    return StreamingResponse(generate(), status_code=upstream.status_code, media_type='video/mp4',
+                             headers=proxy_headers(upstream.headers, inline))
+
+
+async def download_originals(request):
+    """打包下载选中的原始图片（并发下载，流式打包）"""
+    data = await _json_body(request)
+    image_urls = data.get('images', [])
+    if not image_urls:
+        return JSONResponse({'success': False, 'error': '没有选择图片'}, status_code=400)
+
+    print(f"下载 {len(image_urls)} 张原始图片", flush=True)
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+        'Referer': 'https://haohuo.jinritemai.com/',
+        'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+    }
+    fetcher = get_image_fetcher()
+    tasks = [asyncio.create_task(fetcher.fetch(url, headers)) for url in image_urls]
+
+    async def generate():
+        # 按输入顺序打包，前面的图片下载完成即开始输出，后面的图片同时在下载
+        writer = ZipStreamWriter()
+        try:
+            for i, (img_url, task) in enumerate(zip(image_urls, tasks)):
+                fetched = await task
+                if not fetched.ok:
+                    print(f"  第 {i+1} 张{fetched.error}", flush=True)
+                    continue
+                ext = '.jpg'
+                if 'png' in img_url.lower():
+                    ext = '.png'
+                elif 'webp' in img_url.lower():
+                    ext = '.webp'
+                yield writer.add(f'original_{i+1}{ext}', fetched.content)
+            yield writer.close()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type='application/zip', headers={
+        'Content-Disposition': 'attachment; filename="original_images.zip"'
+    })
+
+
+routes = [
+    Route('/parse_video', timed('/parse_video', parse_video), methods=['POST']),
+    Route('/parse_product', timed('/parse_product', parse_product), methods=['POST']),
+    Route('/synthesize_speech', timed('/synthesize_speech', synthesize_speech), methods=['POST']),
+    Route('/synthesize_speech_tencent', timed('/synthesize_speech_tencent', synthesize_speech_tencent),
+          methods=['POST']),
+    Route('/synthesize_speech_custom', timed('/synthesize_speech_custom', synthesize_speech_custom),
+          methods=['POST']),
+    Route('/download_video', timed('/download_video', download_video), methods=['GET']),
+    Route('/download_originals', timed('/download_originals', download_originals), methods=['POST']),
+    # 其余路由（页面、抠图、打包下载等）交给 Flask 处理
+    Mount('/', app=WSGIMiddleware(web_app.app, workers=WSGI_WORKERS)),
+]
+
+app = Starlette(routes=routes)
@@ -0,0 +1,79 @@
+"""
+异步运行时 - 进程级常驻事件循环
+
+同步的 Flask 路由通过 run_sync() 把协程提交到后台常驻事件循环执行，
+避免每个请求都 asyncio.run() 创建/销毁事件循环，
+并让共享的 httpx.AsyncClient（见 http_transport）在请求之间保持连接池。
+"""
+
+import os
+import atexit
+import asyncio
+import threading
+import concurrent.futures
+from request_timing import bind_context
+
+_loop = None
+_loop_pid = None
+_lock = threading.Lock()
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop():
+    """获取（必要时启动）后台常驻事件循环"""
+    global _loop, _loop_pid
+    # fork 出的子进程（如 gunicorn --preload）不会继承事件循环线程，需要重新创建
+    if _loop is None or _loop_pid != os.getpid():
+        with _lock:
+            if _loop is None or _loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=_run_loop, args=(loop,), name='async-runtime', daemon=True)
+                thread.start()
+                _loop = loop
+                _loop_pid = os.getpid()
+                # 常驻循环中未完成的协程数（包括等待网络的请求）
+                from metrics import QUEUE_DEPTH
+                QUEUE_DEPTH.set_function(lambda: len(asyncio.all_tasks(loop)), queue='async_tasks')
+    return _loop
+
+
+def run_sync(coro, timeout: float = None):
+    """
+    在常驻事件循环中执行协程，阻塞等待结果（供同步代码调用）
+
+    Args:
+        coro: 协程对象
+        timeout: 超时时间（秒），超时后取消协程并抛出 TimeoutError
+    """
+    future = asyncio.run_coroutine_threadsafe(bind_context(coro), get_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"异步任务执行超时（{timeout}秒）")
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """提交协程到常驻事件循环，不等待结果"""
+    return asyncio.run_coroutine_threadsafe(bind_context(coro), get_loop())
+
+
+def _shutdown():
+    """进程退出时关闭共享客户端"""
+    from http_transport import close_clients
+    close_clients()
+    if _loop is None or _loop_pid != os.getpid() or not _loop.is_running():
+        return
+    try:
+        from http_transport import aclose_clients
+        run_sync(aclose_clients(), timeout=5)
+    except Exception:
+        pass
+    _loop.call_soon_threadsafe(_loop.stop)
+
+
+atexit.register(_shutdown)
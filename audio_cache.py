@@ -0,0 +1,83 @@
+"""
+TTS 音频缓存模块
+合成结果以二进制直接返回给浏览器，同时在内存中保留一段时间，
+播放器可以通过 /tts_audio/<audio_id> 按 Range 分段读取（拖动进度条、重新下载时不再重新合成）
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+import config
+from metrics import CACHE_REQUESTS
+
+
+class AudioCache:
+    """带 TTL 和总字节数上限的音频缓存（LRU 淘汰）"""
+
+    def __init__(self, ttl: int = None, max_bytes: int = None):
+        self.ttl = ttl or config.AUDIO_CACHE_CONFIG['ttl']
+        self.max_bytes = max_bytes or config.AUDIO_CACHE_CONFIG['max_mb'] * 1024 * 1024
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, audio_data: bytes, metadata: dict = None) -> str:
+        """
+        写入缓存，返回音频ID（随机生成，不可猜测）
+
+        Args:
+            audio_data: 音频数据（MP3）
+            metadata: 音色、引擎等信息，随音频一起返回
+        """
+        audio_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[audio_id] = {
+                'audio': audio_data,
+                'metadata': metadata or {},
+                'expires_at': time.time() + self.ttl,
+            }
+            self._total_bytes += len(audio_data)
+            self._evict()
+        return audio_id
+
+    def get(self, audio_id: str):
+        """读取缓存，过期或不存在返回 None"""
+        with self._lock:
+            entry = self._entries.get(audio_id)
+            if entry is None or entry['expires_at'] < time.time():
+                if entry is not None:
+                    self._remove(audio_id)
+                CACHE_REQUESTS.inc(cache='tts_audio', result='miss')
+                return None
+            CACHE_REQUESTS.inc(cache='tts_audio', result='hit')
+            self._entries.move_to_end(audio_id)
+            return entry
+
+    def _remove(self, audio_id: str):
+        entry = self._entries.pop(audio_id)
+        self._total_bytes -= len(entry['audio'])
+
+    def _evict(self):
+        """清理过期条目，并按 LRU 淘汰超出容量的条目（至少保留最新的一条）"""
+        now = time.time()
+        for audio_id in [k for k, v in self._entries.items() if v['expires_at'] < now]:
+            self._remove(audio_id)
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# 全局实例
+_audio_cache = None
+
+
+def get_audio_cache() -> AudioCache:
+    """获取全局音频缓存实例"""
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache()
+    return _audio_cache
@@ -6,10 +6,12 @@ Audio Transcriber - Using Whisper for speech recognition
 import os
 import tempfile
 import whisper
-import httpx
+import asyncio
 import re
 import threading
 from opencc import OpenCC
+from http_transport import get_async_client
+from metrics import stage
 
 # 全局锁，防止并发转录
 _transcribe_lock = threading.Lock()
@@ -66,14 +68,14 @@ class AudioTranscriber:
 
         try:
             print(f"正在下载视频: {video_url[:100]}...")
-            async with httpx.AsyncClient(follow_redirects=True, timeout=180.0) as client:
-                async with client.stream('GET', video_url, headers=headers) as response:
-                    if response.status_code >= 400:
-                        raise Exception(f"HTTP {response.status_code}")
-                    total = 0
-                    async for chunk in response.aiter_bytes(chunk_size=8192):
-                        temp_file.write(chunk)
-                        total += len(chunk)
+            client = get_async_client('cdn')
+            async with client.stream('GET', video_url, headers=headers) as response:
+                if response.status_code >= 400:
+                    raise Exception(f"HTTP {response.status_code}")
+                total = 0
+                async for chunk in response.aiter_bytes(chunk_size=8192):
+                    temp_file.write(chunk)
+                    total += len(chunk)
             temp_file.close()
             print(f"视频下载完成，大小: {total / 1024 / 1024:.2f} MB")
             return temp_path
@@ -99,11 +101,12 @@ class AudioTranscriber:
             model = self.load_model()
 
             print(f"正在转录音频: {audio_path}")
-            result = model.transcribe(
-                audio_path,
-                language=language,
-                verbose=False
-            )
+            with stage('whisper_transcribe'):
+                result = model.transcribe(
+                    audio_path,
+                    language=language,
+                    verbose=False
+                )
 
         text = result["text"].strip()
 
@@ -206,10 +209,11 @@ class AudioTranscriber:
         try:
             # 下载视频
             print("正在下载视频...")
-            temp_path = await self.download_video(video_url)
+            with stage('video_download'):
+                temp_path = await self.download_video(video_url)
 
-            # 转录音频
-            text = self.transcribe_audio(temp_path, language)
+            # 转录音频（同步调用，放到线程中执行，避免阻塞事件循环）
+            text = await asyncio.to_thread(self.transcribe_audio, temp_path, language)
 
             return text
 
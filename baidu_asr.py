@@ -13,8 +13,11 @@ import json
 import base64
 import tempfile
 import subprocess
-import httpx
+import asyncio
 import time
+from http_transport import get_async_client, get_client
+from metrics import stage, UPSTREAM_ERRORS
+from circuit_breaker import get_breaker
 
 # 百度ASR配置
 BAIDU_API_KEY = os.getenv('BAIDU_API_KEY', 'ElTrULxvbmGUy3hm33WcSs7p')
@@ -50,7 +53,7 @@ class BaiduASR:
             "client_secret": self.secret_key
         }
 
-        response = httpx.post(TOKEN_URL, params=params, timeout=30)
+        response = get_client('baidu').post(TOKEN_URL, params=params, timeout=30)
         result = response.json()
 
         if "access_token" in result:
@@ -106,20 +109,22 @@ class BaiduASR:
             "len": audio_len
         }
 
-        response = httpx.post(
-            ASR_URL,
-            json=data,
-            timeout=180.0,
-            headers={"Content-Type": "application/json"}
-        )
+        with get_breaker('baidu_asr').guard(), stage('asr_chunk'):
+            response = get_client('baidu').post(
+                ASR_URL,
+                json=data,
+                timeout=180.0,
+                headers={"Content-Type": "application/json"}
+            )
 
-        result = response.json()
+            result = response.json()
 
-        if result.get("err_no") == 0:
-            return "".join(result.get("result", []))
-        else:
-            err_msg = result.get("err_msg", "未知错误")
-            raise Exception(f"百度ASR错误: {err_msg} (错误码: {result.get('err_no')})")
+            if result.get("err_no") == 0:
+                return "".join(result.get("result", []))
+            else:
+                err_msg = result.get("err_msg", "未知错误")
+                UPSTREAM_ERRORS.inc(service='baidu_asr')
+                raise Exception(f"百度ASR错误: {err_msg} (错误码: {result.get('err_no')})")
 
     def transcribe_audio(self, audio_path: str, language: str = "zh") -> str:
         """
@@ -139,7 +144,8 @@ class BaiduASR:
 
             # 提取并转换音频为PCM
             print(f"正在提取音频: {audio_path}")
-            pcm_path = self.extract_audio(audio_path)
+            with stage('audio_extract'):
+                pcm_path = self.extract_audio(audio_path)
 
             # 读取PCM文件
             with open(pcm_path, 'rb') as f:
@@ -210,14 +216,14 @@ class BaiduASR:
 
         try:
             print(f"正在下载视频: {video_url[:80]}...")
-            async with httpx.AsyncClient(follow_redirects=True, timeout=180.0) as client:
-                async with client.stream('GET', video_url, headers=headers) as response:
-                    if response.status_code >= 400:
-                        raise Exception(f"HTTP {response.status_code}")
-                    total = 0
-                    async for chunk in response.aiter_bytes(chunk_size=8192):
-                        temp_file.write(chunk)
-                        total += len(chunk)
+            client = get_async_client('cdn')
+            async with client.stream('GET', video_url, headers=headers) as response:
+                if response.status_code >= 400:
+                    raise Exception(f"HTTP {response.status_code}")
+                total = 0
+                async for chunk in response.aiter_bytes(chunk_size=8192):
+                    temp_file.write(chunk)
+                    total += len(chunk)
             temp_file.close()
             print(f"视频下载完成，大小: {total / 1024 / 1024:.2f} MB")
             return temp_path
@@ -232,10 +238,11 @@ class BaiduASR:
         temp_path = None
         try:
             # 下载视频
-            temp_path = await self.download_video(video_url)
+            with stage('video_download'):
+                temp_path = await self.download_video(video_url)
 
-            # 转录音频
-            text = self.transcribe_audio(temp_path, language)
+            # 转录音频（同步调用，放到线程中执行，避免阻塞事件循环）
+            text = await asyncio.to_thread(self.transcribe_audio, temp_path, language)
 
             return text
 
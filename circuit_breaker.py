@@ -0,0 +1,182 @@
+"""
+上游熔断器 - 阿里云 NLS、腾讯云 TTS、抖音各解析接口故障或变慢时快速失败/跳过
+
+不加熔断时，上游出问题后每个请求仍然等满 30~180 秒超时才回退或报错，等待的请求把 worker 占满。
+每个上游一个熔断器，统计最近一段时间窗口内的调用：
+- closed（正常）：失败率或慢调用比例超过阈值（且调用数足够）时 → open
+- open（熔断）：直接拒绝（抛出 CircuitOpen），解析策略跳到下一种；open_seconds 后 → half_open
+- half_open（探测）：只放行少量探测调用，成功 → closed，失败 → 再次 open
+
+状态导出到 /metrics：circuit_breaker_state（0=closed, 1=half_open, 2=open）、
+circuit_breaker_rejected_total、circuit_breaker_transitions_total。
+
+用法：
+    with get_breaker('aliyun_tts').guard():
+        response = await client.get(...)      # 同步、异步代码都可以用（进入/退出时不等待）
+"""
+
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import config
+from metrics import CIRCUIT_STATE, CIRCUIT_REJECTS, CIRCUIT_TRANSITIONS
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """上游熔断中，调用被直接拒绝"""
+
+    def __init__(self, breaker, retry_after: int):
+        self.breaker = breaker
+        self.retry_after = retry_after
+        super().__init__(f'上游服务 {breaker.name} 暂时不可用（熔断中），请约 {retry_after} 秒后重试')
+
+
+class CircuitBreaker:
+    """单个上游的熔断器（线程安全）"""
+
+    def __init__(self, name: str, window: float, min_calls: int, failure_rate: float,
+                 slow_call_seconds: float, slow_call_rate: float, open_seconds: float,
+                 half_open_probes: int, timeout: float = None):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self.call_timeout = timeout
+        self.state = CLOSED
+        self._calls = deque()        # (结束时间, 是否失败, 是否慢调用)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        print(f"熔断器 {self.name}: {self.state} → {state}", flush=True)
+        self.state = state
+        CIRCUIT_TRANSITIONS.inc(upstream=self.name, state=state)
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._probes = 0
+
+    def _reject(self, retry_after: float):
+        CIRCUIT_REJECTS.inc(upstream=self.name)
+        raise CircuitOpen(self, max(1, round(retry_after)))
+
+    def ensure_available(self):
+        """熔断中（冷却时间未到）时抛出 CircuitOpen，不占用探测名额；用于开始耗时的准备工作之前"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self._reject(remaining)
+
+    def acquire(self):
+        """调用前检查：熔断中抛出 CircuitOpen；half_open 时占用一个探测名额"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_seconds - time.monotonic()
+                if remaining > 0:
+                    self._reject(remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self._reject(1)
+                self._probes += 1
+
+    def record(self, failed: bool, elapsed: float):
+        """记录一次调用结果"""
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(OPEN if failed or slow else CLOSED)
+                return
+            if self.state == OPEN:
+                return
+
+            now = time.monotonic()
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+                self._transition(OPEN)
+
+    def release(self):
+        """调用被主动取消（如其他策略已经先返回）：不计入结果，归还占用的探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def timeout(self, default=None):
+        """单次调用的时间上限（配置了 timeout 时使用，超时记为失败，回退到下一种策略）"""
+        return self.call_timeout if self.call_timeout is not None else default
+
+    @contextmanager
+    def guard(self, ignore=()):
+        """
+        包裹一次上游调用：熔断中直接抛出 CircuitOpen，否则记录成功/失败和耗时
+
+        Args:
+            ignore: 不计为上游故障的异常类型（如参数错误）
+        """
+        self.acquire()
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield self
+            failed = False
+        except ignore:
+            failed = False
+            raise
+        finally:
+            self.record(failed, time.perf_counter() - start)
+
+    def status(self) -> dict:
+        with self._lock:
+            total = len(self._calls)
+            return {
+                'state': self.state,
+                'calls': total,
+                'failures': sum(1 for _, f, _ in self._calls if f),
+                'slow_calls': sum(1 for _, _, s in self._calls if s),
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取指定上游的熔断器（参数为 CIRCUIT_BREAKER_CONFIG 中 default 与该上游配置的合并）"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            settings = {**config.CIRCUIT_BREAKER_CONFIG['default'], **config.CIRCUIT_BREAKER_CONFIG.get(name, {})}
+            breaker = CircuitBreaker(name, **settings)
+            _breakers[name] = breaker
+            CIRCUIT_STATE.set_function(lambda: _STATE_VALUES[breaker.state], upstream=name)
+        return breaker
+
+
+def breaker_status() -> dict:
+    """所有已创建熔断器的状态"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
@@ -7,6 +7,9 @@ import os
 # 项目根目录
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# 主机调优结果文件（由 python host_tuning.py 生成）
+TUNING_FILE = os.getenv('HOST_TUNING_FILE', os.path.join(BASE_DIR, 'host_tuning.json'))
+
 # 目录配置
 INPUT_DIR = os.path.join(BASE_DIR, 'input')    # 输入图片目录
 OUTPUT_DIR = os.path.join(BASE_DIR, 'output')  # 输出图片目录
@@ -20,6 +23,29 @@ IMAGE_CONFIG = {
     'keep_original': True,      # 是否保留原图
 }
 
+# Web 输出目录配置（按会话隔离，后台线程按 TTL 和总配额清理）
+OUTPUT_STORE_CONFIG = {
+    'root': 'web_outputs',      # 输出根目录，每个会话一个子目录
+    'ttl': 2 * 3600,            # 会话目录多久未访问后删除（秒）
+    'max_total_mb': 2048,       # 输出目录总大小上限（MB），超过后删除最久未访问的会话
+    'janitor_interval': 300,    # 清理线程运行间隔（秒）
+}
+
+# /download_video 视频代理缓存（按视频ID缓存在本地磁盘，支持 Range）
+VIDEO_CACHE_CONFIG = {
+    'root': 'video_cache',      # 缓存目录
+    'max_total_mb': 2048,       # 缓存总大小上限（MB），超过后删除最久未访问的视频
+    'ttl': 24 * 3600,           # 视频多久未访问后删除（秒）
+    'chunk_size': 1024 * 1024,  # 转发时的读写块大小（字节）
+}
+
+# 预览缩略图配置（结果列表只加载缩略图，原图在打开/下载时才加载）
+THUMBNAIL_CONFIG = {
+    'max_size': (400, 400),    # 缩略图最大尺寸（约2倍于页面200px预览，兼顾高分屏）
+    'quality': 80,             # WebP 质量
+    'method': 4,               # WebP 编码速度/压缩率折中 (0-6)
+}
+
 # 抠图配置
 REMBG_CONFIG = {
     'model': 'u2net',              # 经过测试，u2net 对商品图片效果最好
@@ -30,6 +56,196 @@ REMBG_CONFIG = {
     'post_process_mask': True,     # 后处理，让边缘更平滑
 }
 
+# mask 缓存配置（调整后处理参数重新渲染时复用模型输出）
+MASK_CACHE_CONFIG = {
+    'ttl': 1800,               # 缓存有效期（秒），每次命中续期
+    'max_entries': 64,         # 最多缓存的图片数
+    'max_mb': 256,             # 原图 + mask 的总大小上限（MB）
+}
+
+# 抖音短链接解析缓存（短码 → 跳转后的规范链接，视频解析与商品解析共用）
+SHORT_LINK_CACHE_CONFIG = {
+    'ttl': 12 * 3600,          # 缓存有效期（秒）
+    'max_entries': 10000,      # 最多缓存的短码数
+    'max_redirects': 5,        # 最多跟随的跳转次数
+}
+
+# 视频信息缓存（按视频ID，见 video_info_cache.py）
+VIDEO_INFO_CACHE_CONFIG = {
+    'ttl': 7 * 24 * 3600,      # 标题、作者等元数据的保留时间（秒）
+    'play_url_ttl': 3600,      # 播放链接不带过期时间参数时，按获取后多久过期估算（秒）
+    'refresh_margin': 600,     # 播放链接过期前多久开始后台刷新（秒）
+    'max_entries': 5000,       # 内存中最多缓存的视频数
+    'db_path': os.getenv('VIDEO_INFO_CACHE_DB', ''),   # 持久化的 SQLite 文件（可与 jobs.db 共用），留空只缓存在内存
+}
+
+# TTS 音频缓存配置（/tts_audio/<audio_id> 分段读取）
+AUDIO_CACHE_CONFIG = {
+    'ttl': 1800,               # 缓存有效期（秒）
+    'max_mb': 64,              # 缓存的音频总大小上限（MB）
+}
+
+# mask 后处理默认参数（形态学修复）
+MASK_POSTPROCESS_CONFIG = {
+    'threshold': None,         # 二值化阈值 (0-255)，None 表示保留软边缘
+    'close_kernel': 5,         # 闭操作核大小（填补小空洞）
+    'close_iterations': 2,
+    'open_kernel': 3,          # 开操作核大小（去除小噪点）
+    'open_iterations': 1,
+}
+
+# 视频抠图配置
+VIDEO_MATTING_CONFIG = {
+    'diff_threshold': 0.02,    # 与上一关键帧的平均像素差（0-1）低于此值时复用mask
+    'max_reuse_frames': 15,    # 连续复用的最大帧数，超过后强制重新推理，防止误差累积
+    'warp_mask': True,         # 复用时用光流把关键帧mask对齐到当前帧
+    'analysis_width': 160,     # 帧差/光流计算使用的缩略宽度
+    'max_side': 1280,          # 输出视频最长边，超过则等比缩小
+    'max_duration': 60,        # 允许处理的最长视频时长（秒），超过时拒绝处理
+    'output_format': 'webm',   # 'webm'（带alpha通道）或 'png'（PNG序列zip包）
+}
+
+# 抖音请求的默认请求头（移动端 UA 拿到 iesdouyin.com 分享页和 iteminfo 接口，桌面端 UA 用于 Web 接口和网页）
+DOUYIN_MOBILE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+}
+DOUYIN_DESKTOP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Referer': 'https://www.douyin.com/',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache',
+    'Sec-Ch-Ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Windows"',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# 共享 HTTP 客户端配置（按用途区分，连接池在请求之间复用）
+HTTP_CLIENT_PROFILES = {
+    'default': {
+        'timeout': 30.0,
+        'connect_timeout': 10.0,           # 建连超时（DNS + TCP + TLS）
+        'follow_redirects': True,
+        'http2': True,                     # 服务端支持时使用 HTTP/2（需要安装 h2）
+        'retries': 2,                      # 建连失败时的重试次数（请求未发出，POST 也安全）
+        'max_connections': 100,
+        'max_keepalive_connections': 20,
+        'keepalive_expiry': 60.0,
+        'headers': None,                   # 客户端默认请求头（按请求传入的同名请求头优先）
+        'cookie_jar': None,                # 共享 Cookie 的名称，同名的客户端共用一份（进程内，跨多次请求保留）
+    },
+    # 抖音页面/接口：移动端、桌面端各自一个连接池，共用一份 Cookie（跳转时下发的 ttwid 等在多次解析之间保留）
+    'douyin_mobile': {'headers': DOUYIN_MOBILE_HEADERS, 'cookie_jar': 'douyin'},
+    'douyin_desktop': {'headers': DOUYIN_DESKTOP_HEADERS, 'cookie_jar': 'douyin'},
+    'aliyun': {'timeout': 60.0},           # 阿里云 NLS（Token / ASR / TTS）
+    'baidu': {'timeout': 60.0},            # 百度语音识别
+    'cdn': {'timeout': 180.0},             # 视频/图片 CDN 下载
+}
+
+# 压测时把所有上游请求转发到本地替身服务（见 loadtest/），例如 http://127.0.0.1:9100
+# 请求路径与 Host 头保持不变，替身服务按 Host 区分抖音/CDN/阿里云/腾讯云；留空表示直连
+UPSTREAM_OVERRIDE = os.getenv('UPSTREAM_OVERRIDE', '')
+
+# DNS 缓存（所有共享客户端共用）
+DNS_CACHE_CONFIG = {
+    'ttl': 300,           # 解析结果缓存时间（秒）
+    'max_entries': 256,   # 最多缓存的主机数
+}
+
+# 准入控制（见 admission.py）：队列已满时返回 429 + Retry-After
+ADMISSION_CONFIG = {
+    # concurrency: 同时执行数；queue_size: 额外排队名额；initial_seconds: 单个任务耗时初始估计（用于预计等待时间）
+    'inference': {'concurrency': None, 'queue_size': 60, 'initial_seconds': 2.0},   # None 表示与推理线程池一致
+    'asr': {'concurrency': 4, 'queue_size': 12, 'initial_seconds': 30.0},
+    'tts': {'concurrency': 8, 'queue_size': 32, 'initial_seconds': 5.0},
+}
+
+# 上游熔断器（见 circuit_breaker.py）：default 为通用参数，各上游可单独覆盖
+CIRCUIT_BREAKER_CONFIG = {
+    'default': {
+        'window': 60,               # 统计窗口（秒）
+        'min_calls': 5,             # 窗口内调用数达到该值才判断是否熔断
+        'failure_rate': 0.5,        # 失败比例阈值
+        'slow_call_seconds': 20.0,  # 超过该耗时视为慢调用
+        'slow_call_rate': 0.8,      # 慢调用比例阈值
+        'open_seconds': 30,         # 熔断持续时间，之后放行探测调用（秒）
+        'half_open_probes': 1,      # 探测期间同时放行的调用数
+        'timeout': None,            # 单次调用时间上限（秒），None 表示只用 HTTP 客户端自身的超时
+    },
+    # 抖音各解析策略：单个策略最多等待 timeout 秒就切换到下一种
+    'douyin_short_url': {'slow_call_seconds': 5.0, 'timeout': 10.0},
+    'douyin_share_page': {'slow_call_seconds': 5.0, 'timeout': 10.0},
+    'douyin_mobile_api': {'slow_call_seconds': 5.0, 'timeout': 10.0},
+    'douyin_web_api': {'slow_call_seconds': 5.0, 'timeout': 10.0},
+    'douyin_webpage': {'slow_call_seconds': 10.0, 'timeout': 30.0},
+    'aliyun_asr': {'slow_call_seconds': 30.0},
+    'aliyun_tts': {'slow_call_seconds': 15.0},
+    'tencent_tts': {'slow_call_seconds': 15.0},
+    'baidu_asr': {'slow_call_seconds': 30.0},
+}
+
+# 抖音视频解析策略调度（见 video_parser.py）
+VIDEO_PARSE_CONFIG = {
+    # sequential = 逐个尝试；hedged = 当前策略 hedge_delay 秒内没有结果（或失败）就启动下一种，取最先返回的有效结果；
+    # parallel = 所有策略同时启动
+    'mode': os.getenv('VIDEO_PARSE_MODE', 'hedged'),
+    'hedge_delay': float(os.getenv('VIDEO_PARSE_HEDGE_DELAY', '0.8')),
+    'adaptive_order': True,    # 按各策略的成功率和耗时调整尝试顺序
+    'min_samples': 20,         # 每种策略至少执行这么多次后才参与调整顺序
+    'latency_alpha': 0.2,      # 耗时滑动平均（EWMA）的权重
+}
+
+# 推理执行位置：local = Web 进程内的推理线程池；broker = 写入任务队列，由 inference_worker.py 独立进程执行
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'local')
+
+# 任务队列（见 job_broker.py），Web 进程和 worker 进程需要在同一台机器、同一工作目录下运行
+JOB_BROKER_CONFIG = {
+    'db_path': os.getenv('JOB_BROKER_DB', os.path.join(BASE_DIR, 'jobs.db')),
+    'spool_dir': os.path.join(BASE_DIR, 'temp', 'jobs'),  # 上传图片、mask 等中转文件
+    'heartbeat_interval': 5,     # worker 执行任务期间的心跳间隔（秒）
+    'stale_after': 60,           # 超过该时间没有心跳视为 worker 中断，任务重新排队（秒）
+    'max_attempts': 3,           # 单个任务最多执行次数
+    'poll_interval': 0.05,       # Web 进程等待结果的初始轮询间隔（秒）
+    'max_poll_interval': 1.0,    # 轮询间隔上限（秒）
+    'idle_interval': 0.2,        # worker 队列为空时的等待间隔（秒）
+    'result_ttl': 3600,          # 已结束任务记录的保留时间（秒）
+    'timeout': 600,              # Web 进程等待单个任务的最长时间（秒），排队超过该时间的任务过期不再执行
+}
+
+# 长任务进度记录（见 job_store.py）：批量抠图、分段语音识别、分段 TTS 中断后再次提交时从断点继续
+JOB_STORE_CONFIG = {
+    'db_path': JOB_BROKER_CONFIG['db_path'],                  # 与任务队列共用数据库文件
+    'spool_dir': os.path.join(BASE_DIR, 'temp', 'job_items'),  # 分段音频等中间结果
+    'stale_after': 120,          # 运行中的任务超过该时间没有进展视为已中断（秒）
+    'retention': 86400,          # 任务记录和中间文件的保留时间（秒）
+}
+
+# 子系统延迟加载（见 subsystems.py）
+SUBSYSTEM_CONFIG = {
+    # worker 启动后在后台线程中预热的子系统，可用环境变量 WARMUP_SUBSYSTEMS 覆盖（逗号分隔，none 表示不预热）
+    # 可选：numpy, cv2, rembg, content_generator, asr
+    'warmup': ['numpy', 'cv2', 'rembg', 'content_generator'],
+}
+
+# 商品图片并发下载配置
+IMAGE_FETCH_CONFIG = {
+    'max_concurrency': 16,          # 全局同时下载数
+    'per_host_concurrency': 6,      # 单个域名同时下载数
+    'retries': 3,                   # 网络错误/5xx/429 时的重试次数
+    'backoff_base': 1.0,            # 退避基数（秒），第n次重试等待约 base*2^n，带±50%抖动
+    'backoff_max': 8.0,             # 单次退避上限（秒）
+    'timeout': 30.0,                # 单次请求超时（秒）
+    'min_bytes': 1000,              # 小于此大小视为无效图片
+    'max_bytes': 20 * 1024 * 1024,  # 超过此大小拒绝下载
+}
+
 # 支持的图片格式
 SUPPORTED_FORMATS = ['.jpg', '.jpeg', '.png', '.webp', '.bmp']
 
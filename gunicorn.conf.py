@@ -0,0 +1,29 @@
+"""
+gunicorn 配置文件
+线程数来自主机调优结果（python host_tuning.py），未调优时保持单 worker 同步模式
+worker 进程数固定为 1：缓存、准入控制和 single-flight 都在进程内存中，多进程之间不共享
+SERVER_MODE=asgi 时使用 uvicorn worker 运行 asgi_app:app（I/O 接口原生异步）
+"""
+
+import os
+import host_tuning
+
+# 在 worker 进程导入 numpy/cv2 之前限制 OpenMP/BLAS 线程池（环境变量由 worker 继承）
+host_tuning.apply_thread_limits()
+
+_tuning = host_tuning.load_tuning()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+timeout = 300
+workers = int(os.getenv('GUNICORN_WORKERS', _tuning['gunicorn_workers']))
+if workers != 1:
+    print(f"警告: GUNICORN_WORKERS={workers}，{host_tuning.GUNICORN_WORKERS_NOTE}", flush=True)
+threads = int(os.getenv('GUNICORN_THREADS', _tuning['gunicorn_threads']))
+
+# 应用模块由这里决定，命令行不要再传 web_app:app（命令行参数优先于 wsgi_app）
+if os.getenv('SERVER_MODE') == 'asgi':
+    wsgi_app = 'asgi_app:app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'web_app:app'
+    worker_class = 'gthread' if threads > 1 else 'sync'
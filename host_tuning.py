@@ -0,0 +1,264 @@
+"""
+主机调优模块 - 推理并发数 × ONNX 线程数自动调优
+
+用法：
+    python host_tuning.py --images input/ --workers 1,2,4,8 --threads 1,2,4,8
+
+在样例图片上对 (推理worker数, 每个session的intra-op线程数) 组合逐一压测，
+输出吞吐量和 p95 延迟，并把最优配置写入 host_tuning.json，
+供抠图执行器（image_processor.get_inference_executor）和 gunicorn.conf.py 使用。
+
+gunicorn 固定为单进程：蒙版缓存、音频缓存、准入控制和 single-flight 都在进程内存中，
+多个进程之间不共享，请求落到别的进程就会缓存未命中、/rerender 找不到蒙版、队列上限失效。
+多核通过推理线程池（inference_workers）和 gunicorn 线程数扩展。
+
+注意：本模块在 numpy/cv2/onnxruntime 导入之前被调用，模块级不要导入这些重量级依赖。
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import subprocess
+import config
+
+# 未调优时的默认配置（与原先单 worker、onnxruntime 默认线程数的行为一致）
+DEFAULT_TUNING = {
+    'inference_workers': 1,
+    'intra_op_threads': 0,      # 0 表示使用 onnxruntime 默认值
+    'gunicorn_workers': 1,
+    'gunicorn_threads': 1,
+}
+
+# 进程内状态（缓存、准入控制、single-flight）不跨进程共享，gunicorn 只能单进程运行
+GUNICORN_WORKERS_NOTE = 'gunicorn 必须单进程：蒙版/音频缓存、准入控制和 single-flight 都在进程内存中'
+
+# 需要限制的其他线程池（OpenMP / BLAS），避免与 onnxruntime 争抢 CPU
+_THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+_tuning = None
+
+
+def load_tuning() -> dict:
+    """读取调优结果，文件不存在时返回默认配置"""
+    global _tuning
+    if _tuning is None:
+        tuning = dict(DEFAULT_TUNING)
+        if os.path.exists(config.TUNING_FILE):
+            try:
+                with open(config.TUNING_FILE, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                tuning.update({k: saved[k] for k in DEFAULT_TUNING if k in saved})
+            except Exception as e:
+                print(f"警告: 调优文件读取失败，使用默认配置: {e}", flush=True)
+            if tuning['gunicorn_workers'] != 1:
+                # 旧版调优结果按核数配置了多个进程
+                print(f"警告: 忽略调优文件中的 gunicorn_workers={tuning['gunicorn_workers']}，{GUNICORN_WORKERS_NOTE}",
+                      flush=True)
+                tuning['gunicorn_workers'] = 1
+        _tuning = tuning
+    return _tuning
+
+
+def apply_thread_limits():
+    """
+    限制 OpenMP/BLAS 线程池（必须在导入 numpy/cv2 之前调用）
+
+    只有存在调优结果时才生效，已经显式设置的环境变量不覆盖
+    """
+    if not os.path.exists(config.TUNING_FILE):
+        return
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, '1')
+
+
+def limit_cv2_threads():
+    """限制 OpenCV 内部线程池（在 cv2 导入之后调用）"""
+    if not os.path.exists(config.TUNING_FILE):
+        return
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _percentile(values, percent):
+    """计算百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def run_trial(image_paths, workers: int, threads: int, rounds: int, model_name: str) -> dict:
+    """
+    在当前进程中压测一组配置（由调优命令在独立子进程中调用）
+
+    Returns:
+        {'workers', 'threads', 'images', 'throughput', 'p50', 'p95'}
+    """
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = '1'
+
+    import io
+    from concurrent.futures import ThreadPoolExecutor
+    import cv2
+    from PIL import Image, ImageOps
+    from image_processor import create_session
+
+    cv2.setNumThreads(1)
+    session = create_session(model_name, threads)
+
+    images = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+
+    def process(image_bytes):
+        start = time.perf_counter()
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+        session.predict(image)
+        return time.perf_counter() - start
+
+    # 预热：第一次推理包含图优化等一次性开销
+    process(images[0])
+
+    jobs = images * rounds
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        wall_start = time.perf_counter()
+        latencies = list(executor.map(process, jobs))
+        wall = time.perf_counter() - wall_start
+
+    return {
+        'workers': workers,
+        'threads': threads,
+        'images': len(jobs),
+        'throughput': round(len(jobs) / wall, 3),
+        'p50': round(_percentile(latencies, 50), 3),
+        'p95': round(_percentile(latencies, 95), 3),
+    }
+
+
+def _run_trial_subprocess(image_paths, workers, threads, rounds, model_name) -> dict:
+    """在独立子进程中运行压测，保证线程池配置互不干扰"""
+    cmd = [
+        sys.executable, os.path.abspath(__file__), '--trial',
+        '--workers', str(workers), '--threads', str(threads),
+        '--rounds', str(rounds), '--model', model_name,
+        '--images', *image_paths,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"压测子进程失败: {result.stderr[-500:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def collect_images(paths) -> list:
+    """展开图片目录，返回图片文件列表"""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                if os.path.splitext(filename)[1].lower() in config.SUPPORTED_FORMATS:
+                    images.append(os.path.join(path, filename))
+        elif os.path.isfile(path):
+            images.append(path)
+    return images
+
+
+def tune(image_paths, worker_grid, thread_grid, rounds: int = 2, model_name: str = None,
+         max_p95: float = None) -> dict:
+    """
+    压测所有组合，选出最优配置
+
+    Args:
+        image_paths: 样例图片
+        worker_grid: 推理 worker 数候选
+        thread_grid: intra-op 线程数候选
+        rounds: 每组配置把样例图片跑几遍
+        model_name: 抠图模型
+        max_p95: p95 延迟上限（秒），超过的组合不参与评选
+
+    Returns:
+        写入调优文件的配置
+    """
+    model_name = model_name or config.REMBG_CONFIG['model']
+    cpu_count = os.cpu_count() or 1
+
+    results = []
+    for workers in worker_grid:
+        for threads in thread_grid:
+            if workers * threads > cpu_count:
+                print(f"跳过 workers={workers} threads={threads}（超过 {cpu_count} 核）", flush=True)
+                continue
+            print(f"压测 workers={workers} threads={threads} ...", flush=True)
+            result = _run_trial_subprocess(image_paths, workers, threads, rounds, model_name)
+            print(f"  吞吐量 {result['throughput']:.2f} 张/秒, p50 {result['p50']:.2f}s, p95 {result['p95']:.2f}s",
+                  flush=True)
+            results.append(result)
+
+    candidates = [r for r in results if max_p95 is None or r['p95'] <= max_p95] or results
+    if not candidates:
+        raise ValueError("没有可用的压测结果")
+    best = max(candidates, key=lambda r: (r['throughput'], -r['p95']))
+
+    # 单进程：多核由推理线程池（workers*threads 个核）和 gunicorn 线程数利用
+    tuning = {
+        'inference_workers': best['workers'],
+        'intra_op_threads': best['threads'],
+        'gunicorn_workers': 1,
+        'gunicorn_workers_note': GUNICORN_WORKERS_NOTE,
+        'gunicorn_threads': max(4, best['workers'] * 2),
+        'cpu_count': cpu_count,
+        'model': model_name,
+        'tuned_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+    with open(config.TUNING_FILE, 'w', encoding='utf-8') as f:
+        json.dump(tuning, f, ensure_ascii=False, indent=2)
+
+    return tuning
+
+
+def _parse_grid(value: str) -> list:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='抠图推理并发/线程数自动调优')
+    parser.add_argument('--images', nargs='+', default=[config.INPUT_DIR], help='样例图片或目录')
+    parser.add_argument('--workers', default='1,2,4,8', help='推理 worker 数候选，逗号分隔')
+    parser.add_argument('--threads', default='1,2,4,8', help='每个 session 的 intra-op 线程数候选，逗号分隔')
+    parser.add_argument('--rounds', type=int, default=2, help='每组配置把样例图片跑几遍')
+    parser.add_argument('--model', default=config.REMBG_CONFIG['model'], help='抠图模型')
+    parser.add_argument('--max-p95', type=float, default=None, help='p95 延迟上限（秒）')
+    parser.add_argument('--trial', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        trial = run_trial(args.images, int(args.workers), int(args.threads), args.rounds, args.model)
+        print(json.dumps(trial))
+        sys.exit(0)
+
+    sample_images = collect_images(args.images)
+    if not sample_images:
+        print("没有找到样例图片，请通过 --images 指定图片或目录")
+        sys.exit(1)
+
+    print("=" * 60)
+    print(f"样例图片: {len(sample_images)} 张, CPU: {os.cpu_count()} 核")
+    print("=" * 60)
+
+    tuning = tune(sample_images, _parse_grid(args.workers), _parse_grid(args.threads),
+                  rounds=args.rounds, model_name=args.model, max_p95=args.max_p95)
+
+    print("\n" + "=" * 60)
+    print(f"{'workers':>8} {'threads':>8} {'张/秒':>10} {'p50(s)':>8} {'p95(s)':>8}")
+    for r in tuning['results']:
+        print(f"{r['workers']:>8} {r['threads']:>8} {r['throughput']:>10.2f} {r['p50']:>8.2f} {r['p95']:>8.2f}")
+    print("=" * 60)
+    print(f"最优配置: 推理worker={tuning['inference_workers']}, intra-op线程={tuning['intra_op_threads']}, "
+          f"gunicorn workers={tuning['gunicorn_workers']}, threads={tuning['gunicorn_threads']}")
+    print(f"已写入: {config.TUNING_FILE}")
@@ -0,0 +1,382 @@
+"""
+共享 HTTP 传输层
+
+按用途（profile）复用 httpx 客户端，在请求之间保持连接，避免每次调用都重新解析 DNS、重新握手：
+- 连接池按主机（scheme + host + port）分别保持 keep-alive 连接，服务端支持时使用 HTTP/2
+- 所有客户端共用一份 DNS 缓存（见 DNS_CACHE_CONFIG）
+- 超时与重试策略、默认请求头统一在 config.HTTP_CLIENT_PROFILES 中配置
+- 配置了 cookie_jar 的 profile 共用一份 Cookie（如抖音移动端/桌面端客户端），跨请求保留
+- pool_stats() 返回连接池与 DNS 缓存的统计信息（/http_stats）
+- 设置 config.UPSTREAM_OVERRIDE 时所有请求转发到本地替身服务（压测用，见 loadtest/）
+
+异步客户端的连接绑定在创建它的事件循环上，因此按事件循环分别缓存：Web 服务中都运行在
+async_runtime 的常驻循环里，命令行测试代码中的 asyncio.run() 也能正常使用。
+同步客户端（get_client）是线程安全的，每个进程一组，供推理线程、to_thread 中的 SDK 调用等同步代码使用。
+"""
+
+import os
+import time
+import socket
+import asyncio
+import weakref
+import threading
+import ipaddress
+import importlib.util
+from collections import OrderedDict
+from http.cookiejar import CookieJar
+import httpx
+import httpcore
+import config
+from metrics import CACHE_REQUESTS
+
+# 每个事件循环一组异步客户端：{loop: {profile: AsyncClient}}
+_clients = weakref.WeakKeyDictionary()
+
+# 同步客户端：{profile: Client}，fork 后重新创建
+_sync_clients = {}
+_sync_pid = None
+_sync_lock = threading.Lock()
+
+# 共享 Cookie：{name: CookieJar}（CookieJar 自带锁，可跨线程、跨事件循环使用）
+_cookie_jars = {}
+_cookie_jars_lock = threading.Lock()
+
+_http2_available = importlib.util.find_spec('h2') is not None
+if not _http2_available:
+    print("提示: 未安装 h2，共享 HTTP 客户端使用 HTTP/1.1（pip install 'httpx[http2]'）", flush=True)
+
+
+class DNSCache:
+    """线程安全的 DNS 解析缓存（TTL + LRU）"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (host, port) -> (expires_at, [ip, ...])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host: str, port: int):
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                CACHE_REQUESTS.inc(cache='dns', result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache='dns', result='hit')
+            return entry[1]
+
+    def put(self, host: str, port: int, addresses: list):
+        with self._lock:
+            self._entries[(host, port)] = (time.monotonic() + self.ttl, addresses)
+            self._entries.move_to_end((host, port))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, host: str, port: int):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_dns_cache = DNSCache(config.DNS_CACHE_CONFIG['ttl'], config.DNS_CACHE_CONFIG['max_entries'])
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def _addresses(infos) -> list:
+    """getaddrinfo 结果去重，保持系统返回的优先顺序"""
+    addresses = []
+    for info in infos:
+        address = info[4][0]
+        if address not in addresses:
+            addresses.append(address)
+    return addresses
+
+
+class CachingAsyncBackend(httpcore.AsyncNetworkBackend):
+    """在 httpcore 默认网络后端外加一层 DNS 缓存（TLS 的 SNI 仍使用原始主机名）"""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if _is_ip(host):
+            return await self._backend.connect_tcp(host, port, timeout=timeout, local_address=local_address,
+                                                   socket_options=socket_options)
+
+        addresses = _dns_cache.get(host, port)
+        if addresses is None:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            except socket.gaierror as e:
+                raise httpcore.ConnectError(f"DNS 解析失败 {host}: {e}") from e
+            addresses = _addresses(infos)
+            _dns_cache.put(host, port, addresses)
+
+        last_error = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout=timeout, local_address=local_address,
+                                                       socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        # 缓存的地址都连不上，下次重新解析
+        _dns_cache.invalidate(host, port)
+        raise last_error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class CachingSyncBackend(httpcore.NetworkBackend):
+    """同步版本的 DNS 缓存网络后端"""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        if _is_ip(host):
+            return self._backend.connect_tcp(host, port, timeout=timeout, local_address=local_address,
+                                             socket_options=socket_options)
+
+        addresses = _dns_cache.get(host, port)
+        if addresses is None:
+            try:
+                infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            except socket.gaierror as e:
+                raise httpcore.ConnectError(f"DNS 解析失败 {host}: {e}") from e
+            addresses = _addresses(infos)
+            _dns_cache.put(host, port, addresses)
+
+        last_error = None
+        for address in addresses:
+            try:
+                return self._backend.connect_tcp(address, port, timeout=timeout, local_address=local_address,
+                                                 socket_options=socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                last_error = e
+        _dns_cache.invalidate(host, port)
+        raise last_error
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    def sleep(self, seconds):
+        self._backend.sleep(seconds)
+
+
+def _override_request(request: httpx.Request, origin: httpx.URL) -> httpx.Request:
+    """改写请求的目标地址（Host 头保持原样，替身服务据此区分上游）"""
+    url = request.url.copy_with(scheme=origin.scheme, host=origin.host, port=origin.port)
+    return httpx.Request(request.method, url, headers=request.headers, stream=request.stream,
+                         extensions=request.extensions)
+
+
+class OverrideAsyncTransport(httpx.AsyncBaseTransport):
+    """把请求转发到 UPSTREAM_OVERRIDE；响应仍关联原始请求，response.url 与直连时一致"""
+
+    def __init__(self, transport, origin: str):
+        self._transport = transport
+        self._origin = httpx.URL(origin)
+        self._pool = getattr(transport, '_pool', None)
+
+    async def handle_async_request(self, request):
+        return await self._transport.handle_async_request(_override_request(request, self._origin))
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class OverrideSyncTransport(httpx.BaseTransport):
+    """同步版本的上游转发"""
+
+    def __init__(self, transport, origin: str):
+        self._transport = transport
+        self._origin = httpx.URL(origin)
+        self._pool = getattr(transport, '_pool', None)
+
+    def handle_request(self, request):
+        return self._transport.handle_request(_override_request(request, self._origin))
+
+    def close(self):
+        self._transport.close()
+
+
+def _settings(profile: str) -> dict:
+    settings = dict(config.HTTP_CLIENT_PROFILES['default'])
+    settings.update(config.HTTP_CLIENT_PROFILES.get(profile, {}))
+    return settings
+
+
+def _make_transport(settings: dict, sync: bool):
+    transport_kwargs = {
+        'http2': settings['http2'] and _http2_available,
+        'retries': settings['retries'],
+        'limits': httpx.Limits(
+            max_connections=settings['max_connections'],
+            max_keepalive_connections=settings['max_keepalive_connections'],
+            keepalive_expiry=settings['keepalive_expiry'],
+        ),
+    }
+    if sync:
+        transport = httpx.HTTPTransport(**transport_kwargs)
+        backend_class = CachingSyncBackend
+    else:
+        transport = httpx.AsyncHTTPTransport(**transport_kwargs)
+        backend_class = CachingAsyncBackend
+
+    # httpx 没有暴露网络后端参数，直接替换连接池使用的后端
+    pool = getattr(transport, '_pool', None)
+    if pool is not None and hasattr(pool, '_network_backend'):
+        pool._network_backend = backend_class(pool._network_backend)
+
+    if config.UPSTREAM_OVERRIDE:
+        override_class = OverrideSyncTransport if sync else OverrideAsyncTransport
+        transport = override_class(transport, config.UPSTREAM_OVERRIDE)
+    return transport
+
+
+def get_cookie_jar(name: str) -> CookieJar:
+    """
+    获取指定名称的共享 Cookie（进程内所有同名 profile 的同步/异步客户端共用）
+
+    httpx 收到 CookieJar 时直接使用而不复制，服务端下发的 Cookie 对之后所有请求生效。
+    """
+    with _cookie_jars_lock:
+        jar = _cookie_jars.get(name)
+        if jar is None:
+            jar = CookieJar()
+            _cookie_jars[name] = jar
+        return jar
+
+
+def _client_kwargs(profile: str, sync: bool) -> dict:
+    settings = _settings(profile)
+    kwargs = {
+        'timeout': httpx.Timeout(settings['timeout'], connect=settings['connect_timeout']),
+        'follow_redirects': settings['follow_redirects'],
+        'transport': _make_transport(settings, sync),
+    }
+    if settings['headers']:
+        kwargs['headers'] = settings['headers']
+    if settings['cookie_jar']:
+        kwargs['cookies'] = get_cookie_jar(settings['cookie_jar'])
+    return kwargs
+
+
+def get_async_client(profile: str = 'default') -> httpx.AsyncClient:
+    """
+    获取当前事件循环中指定 profile 的共享 AsyncClient
+
+    共享客户端不要在调用方关闭；请求头请按请求传入（headers=...），不要修改客户端默认值。
+    """
+    loop = asyncio.get_running_loop()
+    clients = _clients.setdefault(loop, {})
+    client = clients.get(profile)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_kwargs(profile, sync=False))
+        clients[profile] = client
+    return client
+
+
+def get_client(profile: str = 'default') -> httpx.Client:
+    """
+    获取指定 profile 的共享同步 Client（线程安全，进程内共用）
+
+    用法与 get_async_client 相同：不要关闭，请求头按请求传入。
+    """
+    global _sync_pid
+    client = _sync_clients.get(profile) if _sync_pid == os.getpid() else None
+    if client is None or client.is_closed:
+        with _sync_lock:
+            if _sync_pid != os.getpid():
+                # fork 出的子进程不能复用父进程的连接
+                _sync_clients.clear()
+                _sync_pid = os.getpid()
+            client = _sync_clients.get(profile)
+            if client is None or client.is_closed:
+                client = httpx.Client(**_client_kwargs(profile, sync=True))
+                _sync_clients[profile] = client
+    return client
+
+
+async def aclose_clients():
+    """关闭当前事件循环中的所有共享客户端"""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+def close_clients():
+    """关闭所有共享同步客户端"""
+    with _sync_lock:
+        for client in _sync_clients.values():
+            client.close()
+        _sync_clients.clear()
+
+
+def _client_stats(profile: str, kind: str, client) -> dict:
+    """统计单个客户端连接池中的连接（按主机分组）"""
+    pool = getattr(getattr(client, '_transport', None), '_pool', None)
+    hosts = {}
+    for connection in list(getattr(pool, 'connections', [])):
+        origin = getattr(connection, '_origin', None)
+        host = str(origin) if origin is not None else 'unknown'
+        stats = hosts.setdefault(host, {'connections': 0, 'idle': 0, 'active': 0, 'http2': 0})
+        stats['connections'] += 1
+        if connection.is_idle():
+            stats['idle'] += 1
+        elif not connection.is_closed():
+            stats['active'] += 1
+        if 'HTTP/2' in connection.info():
+            stats['http2'] += 1
+
+    return {
+        'profile': profile,
+        'kind': kind,
+        'connections': sum(h['connections'] for h in hosts.values()),
+        'idle': sum(h['idle'] for h in hosts.values()),
+        'active': sum(h['active'] for h in hosts.values()),
+        'hosts': hosts,
+    }
+
+
+def pool_stats() -> dict:
+    """所有共享客户端的连接池统计与 DNS 缓存命中情况"""
+    clients = []
+    for loop_clients in list(_clients.values()):
+        for profile, client in list(loop_clients.items()):
+            if not client.is_closed:
+                clients.append(_client_stats(profile, 'async', client))
+    for profile, client in list(_sync_clients.items()):
+        if not client.is_closed:
+            clients.append(_client_stats(profile, 'sync', client))
+
+    return {
+        'http2': _http2_available,
+        'clients': clients,
+        'dns_cache': _dns_cache.stats(),
+        'cookie_jars': {name: len(jar) for name, jar in list(_cookie_jars.items())},
+    }
@@ -0,0 +1,165 @@
+"""
+并发图片下载器
+
+商品图片通常有几十张、分布在少数几个 CDN 域名上，逐张串行下载时大部分时间在等网络往返。
+这里在共享事件循环中并发下载：
+- 全局并发上限 + 单个域名并发上限，避免压垮 CDN 或触发限流
+- 失败时指数退避 + 随机抖动后重试，等待期间不占用线程
+- 校验响应大小和类型（过小/过大/HTML错误页视为失败）
+- 记录每个 URL 的耗时和重试次数
+"""
+
+import time
+import random
+import asyncio
+import weakref
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlsplit
+import httpx
+import config
+from http_transport import get_async_client
+from metrics import stage, UPSTREAM_ERRORS
+from single_flight import get_flight
+
+# 可以重试的 HTTP 状态码
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class FetchResult:
+    """单个图片的下载结果"""
+    url: str
+    content: Optional[bytes] = None
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    elapsed: float = 0.0      # 总耗时（秒，包含重试等待）
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.content is not None
+
+
+class _InvalidResponse(Exception):
+    """响应内容不是有效图片（不重试）"""
+
+
+class ImageFetcher:
+    """带全局/单域名并发限制的图片下载器（每个事件循环一个实例）"""
+
+    def __init__(self, settings: dict):
+        self.settings = settings
+        self._global = asyncio.Semaphore(settings['max_concurrency'])
+        self._hosts = {}
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.settings['per_host_concurrency'])
+            self._hosts[host] = semaphore
+        return semaphore
+
+    def _backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间：指数退避 + 随机抖动"""
+        delay = min(self.settings['backoff_max'], self.settings['backoff_base'] * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    async def _download(self, url: str, headers: dict) -> tuple:
+        """下载一次，返回 (状态码, 内容)；内容不符合要求时抛出 _InvalidResponse"""
+        max_bytes = self.settings['max_bytes']
+        client = get_async_client('cdn')
+        async with client.stream('GET', url, headers=headers, timeout=self.settings['timeout']) as response:
+            if response.status_code != 200:
+                return response.status_code, None
+
+            content_type = response.headers.get('Content-Type', '')
+            if content_type.startswith('text/'):
+                raise _InvalidResponse(f'不是图片 ({content_type})')
+
+            content_length = response.headers.get('Content-Length')
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise _InvalidResponse(f'图片过大 ({int(content_length) // 1024}KB)')
+
+            chunks = []
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _InvalidResponse(f'图片过大 (超过 {max_bytes // 1024}KB)')
+                chunks.append(chunk)
+
+        content = b''.join(chunks)
+        if len(content) < self.settings['min_bytes']:
+            raise _InvalidResponse('下载内容无效')
+        return 200, content
+
+    async def fetch(self, url: str, headers: dict = None) -> FetchResult:
+        """下载单张图片（带重试）"""
+        result = FetchResult(url=url)
+        start = time.perf_counter()
+        retries = self.settings['retries']
+
+        for attempt in range(retries + 1):
+            result.attempts = attempt + 1
+            retry_reason = None
+            try:
+                # 先占域名名额再占全局名额，避免排队等同一域名时占着全局名额
+                async with self._host_semaphore(url), self._global:
+                    with stage('image_download'):
+                        status_code, content = await self._download(url, headers or {})
+                result.status_code = status_code
+                if content is not None:
+                    result.content = content
+                    result.error = None
+                    break
+                result.error = f'下载失败: HTTP {status_code}'
+                if status_code in RETRY_STATUS:
+                    retry_reason = f'HTTP {status_code}'
+            except _InvalidResponse as e:
+                result.error = str(e)
+            except httpx.TransportError as e:
+                result.error = f'下载失败: {type(e).__name__}'
+                retry_reason = f'{type(e).__name__}: {str(e)[:50]}'
+            except Exception as e:
+                result.error = f'下载失败: {str(e)}'
+
+            if retry_reason is None or attempt >= retries:
+                break
+            wait_time = self._backoff(attempt)
+            print(f"  网络错误，{wait_time:.1f}秒后重试 ({attempt + 1}/{retries}): {retry_reason} {url[:60]}",
+                  flush=True)
+            # 退避期间释放并发名额，只让出事件循环，不阻塞线程
+            await asyncio.sleep(wait_time)
+
+        result.elapsed = time.perf_counter() - start
+        if not result.ok:
+            UPSTREAM_ERRORS.inc(service='image_cdn')
+        size = f"{len(result.content) // 1024}KB" if result.ok else result.error
+        print(f"  图片下载 {result.elapsed:.2f}s, {result.attempts}次, {size}: {url[:80]}", flush=True)
+        return result
+
+
+# 每个事件循环一个下载器（asyncio.Semaphore 不能跨事件循环使用）
+_fetchers = weakref.WeakKeyDictionary()
+
+
+def get_image_fetcher() -> ImageFetcher:
+    """获取当前事件循环的图片下载器"""
+    loop = asyncio.get_running_loop()
+    fetcher = _fetchers.get(loop)
+    if fetcher is None:
+        fetcher = ImageFetcher(config.IMAGE_FETCH_CONFIG)
+        _fetchers[loop] = fetcher
+    return fetcher
+
+
+async def fetch_image(url: str, headers: dict = None) -> FetchResult:
+    """下载单张图片（同一 URL 正在下载时等待同一个结果）"""
+    return await get_flight('image_fetch').run(url, get_image_fetcher().fetch, url, headers)
+
+
+async def fetch_images(urls, headers: dict = None) -> list:
+    """并发下载多张图片，结果顺序与 urls 一致"""
+    return await asyncio.gather(*(fetch_image(url, headers) for url in urls))
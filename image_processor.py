@@ -1,11 +1,270 @@
 """
 图片处理模块 - 核心抠图功能
+
+模型推理、mask 后处理、结果与缩略图编码都在这里，Web 进程（web_app.py）和
+推理 worker 进程（inference_worker.py）共用，worker 不需要导入 Flask 应用
 """
 
+import io
 import os
-from PIL import Image
-from rembg import remove
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
 import config
+import subsystems
+from host_tuning import load_tuning, limit_cv2_threads
+from metrics import QUEUE_DEPTH, stage
+from mask_cache import MaskCache, get_mask_cache
+from single_flight import get_flight
+
+
+# 模型 session 缓存（按模型名复用，避免每次处理都重新加载 ONNX 模型）
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# 抠图推理线程池
+_inference_executor = None
+
+
+def create_session(model_name, intra_op_threads=0):
+    """
+    创建 rembg session
+
+    Args:
+        model_name: 模型名
+        intra_op_threads: onnxruntime 每次推理使用的线程数，0 表示使用默认值
+    """
+    # rembg 导入时会加载 onnxruntime，放到首次创建 session 时再导入
+    if not intra_op_threads:
+        from rembg.session_factory import new_session
+        return new_session(model_name)
+
+    import onnxruntime as ort
+    from rembg.sessions import sessions_class
+
+    sess_opts = ort.SessionOptions()
+    sess_opts.intra_op_num_threads = intra_op_threads
+    sess_opts.inter_op_num_threads = 1
+
+    for session_class in sessions_class:
+        if session_class.name() == model_name:
+            return session_class(model_name, sess_opts)
+    raise ValueError(f"不支持的抠图模型: {model_name}")
+
+
+def get_session(model_name=None):
+    """获取（或创建）指定模型的 rembg session"""
+    model_name = model_name or config.REMBG_CONFIG['model']
+    session = _sessions.get(model_name)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(model_name)
+            if session is None:
+                print(f"正在加载抠图模型: {model_name}", flush=True)
+                session = create_session(model_name, load_tuning()['intra_op_threads'])
+                _sessions[model_name] = session
+    return session
+
+
+def get_inference_executor():
+    """获取抠图推理线程池（并发数来自主机调优结果，onnxruntime 推理时会释放 GIL）"""
+    global _inference_executor
+    if _inference_executor is None:
+        with _sessions_lock:
+            if _inference_executor is None:
+                _inference_executor = ThreadPoolExecutor(
+                    max_workers=load_tuning()['inference_workers'],
+                    thread_name_prefix='rembg'
+                )
+                QUEUE_DEPTH.set_function(_inference_executor._work_queue.qsize, queue='inference_executor')
+    return _inference_executor
+
+
+# ==================== 延迟加载的子系统（见 subsystems.py） ====================
+
+def _load_numpy():
+    import numpy
+    return numpy
+
+
+def _load_cv2():
+    import cv2
+    limit_cv2_threads()
+    return cv2
+
+
+def _load_rembg():
+    import rembg.bg
+    return rembg.bg
+
+
+subsystems.register('numpy', _load_numpy, 'numpy 数组运算')
+subsystems.register('cv2', _load_cv2, 'OpenCV 形态学后处理')
+subsystems.register('rembg', _load_rembg, 'rembg 后处理与 alpha matting（含 onnxruntime）')
+
+
+def postprocess_mask(image_with_alpha, threshold=None, close_kernel=5, close_iterations=2,
+                     open_kernel=3, open_iterations=1):
+    """后处理：填补mask中的小空洞，修复误删的前景"""
+    np = subsystems.get('numpy')
+    cv2 = subsystems.get('cv2')
+
+    # 转换为numpy数组
+    img_array = np.array(image_with_alpha)
+
+    # 提取alpha通道
+    if img_array.shape[2] == 4:
+        alpha = img_array[:, :, 3]
+
+        # 可选：二值化，得到硬边缘
+        if threshold is not None:
+            alpha = np.where(alpha >= threshold, 255, 0).astype(np.uint8)
+
+        # 使用形态学闭操作填补小空洞
+        if close_iterations > 0:
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (close_kernel, close_kernel))
+            alpha = cv2.morphologyEx(alpha, cv2.MORPH_CLOSE, kernel, iterations=close_iterations)
+
+        # 使用开操作去除小噪点
+        if open_iterations > 0:
+            kernel_open = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (open_kernel, open_kernel))
+            alpha = cv2.morphologyEx(alpha, cv2.MORPH_OPEN, kernel_open, iterations=open_iterations)
+
+        # 替换alpha通道
+        img_array[:, :, 3] = alpha
+
+        # 转回PIL Image
+        return Image.fromarray(img_array)
+
+    return image_with_alpha
+
+
+def render_params(overrides=None):
+    """合并默认后处理参数和用户指定的参数"""
+    params = {
+        'post_process_mask': config.REMBG_CONFIG.get('post_process_mask', False),
+        'alpha_matting': config.REMBG_CONFIG['alpha_matting'],
+        'alpha_matting_foreground_threshold': config.REMBG_CONFIG['alpha_matting_foreground_threshold'],
+        'alpha_matting_background_threshold': config.REMBG_CONFIG['alpha_matting_background_threshold'],
+        'alpha_matting_erode_size': config.REMBG_CONFIG['alpha_matting_erode_size'],
+    }
+    params.update(config.MASK_POSTPROCESS_CONFIG)
+
+    for key, value in (overrides or {}).items():
+        if key not in params:
+            continue
+        if key in ('post_process_mask', 'alpha_matting'):
+            params[key] = bool(value)
+        elif key == 'threshold':
+            params[key] = None if value in (None, '') else max(0, min(255, int(value)))
+        else:
+            params[key] = max(0, int(value))
+
+    # 形态学核大小必须为正奇数
+    for key in ('close_kernel', 'open_kernel'):
+        params[key] = max(1, params[key]) | 1
+    return params
+
+
+def predict_mask(input_image, model_name=None):
+    """运行模型推理，返回原始 mask（uint8 数组，未做任何后处理）"""
+    session = get_session(model_name)
+    return subsystems.get('numpy').array(session.predict(input_image)[0])
+
+
+def render_cutout(input_image, raw_mask, params):
+    """根据原始 mask 和后处理参数生成抠图结果（不涉及模型推理，毫秒级）"""
+    rembg_bg = subsystems.get('rembg')
+    mask = raw_mask
+    if params['post_process_mask']:
+        mask = rembg_bg.post_process(mask)
+    mask_image = Image.fromarray(mask)
+
+    output_image = None
+    if params['alpha_matting']:
+        try:
+            output_image = rembg_bg.alpha_matting_cutout(
+                input_image,
+                mask_image,
+                params['alpha_matting_foreground_threshold'],
+                params['alpha_matting_background_threshold'],
+                params['alpha_matting_erode_size'],
+            )
+        except ValueError:
+            # alpha matting 在部分图片上会失败，退回普通抠图
+            output_image = None
+
+    if output_image is None:
+        output_image = input_image.convert('RGBA')
+        output_image.putalpha(mask_image)
+
+    # 后处理：填补小空洞（轻度修复）
+    return postprocess_mask(
+        output_image,
+        threshold=params['threshold'],
+        close_kernel=params['close_kernel'],
+        close_iterations=params['close_iterations'],
+        open_kernel=params['open_kernel'],
+        open_iterations=params['open_iterations'],
+    )
+
+
+def save_thumbnail(image, thumbnail_path):
+    """基于已解码的抠图结果生成 WebP 缩略图（保留透明通道）"""
+    thumb = image.copy()
+    thumb.thumbnail(config.THUMBNAIL_CONFIG['max_size'], Image.Resampling.BILINEAR, reducing_gap=2.0)
+    thumb.save(
+        thumbnail_path,
+        format='WEBP',
+        quality=config.THUMBNAIL_CONFIG['quality'],
+        method=config.THUMBNAIL_CONFIG['method']
+    )
+
+
+def remove_background_single(input_path, output_path, model_name=None, thumbnail_path=None):
+    """去除单张图片背景（可选同时生成缩略图），返回 mask 缓存键"""
+    with open(input_path, 'rb') as f:
+        image_bytes = f.read()
+    return remove_background_bytes(image_bytes, output_path, model_name, thumbnail_path)
+
+
+def remove_background_bytes(image_bytes, output_path, model_name=None, thumbnail_path=None):
+    """
+    去除图片背景
+
+    模型输出的原始 mask 会写入缓存，之后调整后处理参数可通过 /rerender 直接重新渲染；
+    失败时抛出异常（由调用方记录并返回给用户，队列模式下写入任务的错误信息）
+
+    Returns:
+        mask 缓存键
+    """
+    # 读取图片（按EXIF修正方向）
+    with stage('image_decode'):
+        input_image = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes)))
+        input_image.load()
+
+    # 使用指定的模型或默认模型
+    selected_model = model_name if model_name else config.REMBG_CONFIG['model']
+
+    # 模型推理，原始 mask 写入缓存（同一张图片、同一模型正在推理时等待同一个结果）
+    mask_key = MaskCache.make_key(image_bytes, selected_model)
+    with stage('inference'):
+        raw_mask = get_flight('inference').run_sync(mask_key, predict_mask, input_image, selected_model)
+    get_mask_cache().put(mask_key, image_bytes, raw_mask, selected_model)
+
+    # 后处理并生成抠图结果
+    with stage('mask_postprocess'):
+        output_image = render_cutout(input_image, raw_mask, render_params())
+
+    # 保存 - PNG无损格式，最高质量
+    with stage('png_encode'):
+        output_image.save(output_path, format='PNG', compress_level=1, optimize=True)
+
+    # 同一次处理中顺带生成缩略图，复用已经解码好的结果
+    if thumbnail_path:
+        with stage('thumbnail_encode'):
+            save_thumbnail(output_image, thumbnail_path)
+    return mask_key
 
 
 class ImageProcessor:
@@ -37,6 +296,7 @@ class ImageProcessor:
 
             # 去除背景
             print("  - 正在去除背景...")
+            from rembg import remove
             output_image = remove(
                 input_image,
                 alpha_matting=config.REMBG_CONFIG['alpha_matting'],
@@ -0,0 +1,169 @@
+"""
+推理 worker - 从任务队列（job_broker.py）领取抠图、视频抠图、语音识别任务，在独立进程中执行
+
+配合 INFERENCE_BACKEND=broker 使用，需要在 Web 服务的同一台机器、同一工作目录下启动：
+
+    python inference_worker.py --processes 2
+    python inference_worker.py --processes 1 --kinds transcribe
+
+主进程只负责监控：子进程异常退出（如原生库崩溃）时自动重启，并定期把中断任务重新排队。
+每个子进程只加载一份模型，数量按 CPU 核数 / 内存调整，与 gunicorn worker 数互不影响。
+"""
+
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import traceback
+import multiprocessing
+import host_tuning
+
+# 在导入 numpy/onnxruntime 之前限制线程池（子进程继承环境变量）
+host_tuning.apply_thread_limits()
+
+import config
+from job_broker import get_job_broker
+
+
+def _handle_remove_bg(payload: dict) -> dict:
+    """抠图：结果图和缩略图直接写到 Web 进程指定的路径，原始 mask 另存为 PNG 供 Web 进程缓存"""
+    from PIL import Image
+    from image_processor import remove_background_single
+    from mask_cache import get_mask_cache
+
+    mask_key = remove_background_single(payload['image_path'], payload['output_path'],
+                                        payload.get('model_name'), payload.get('thumbnail_path'))
+    entry = get_mask_cache().get(mask_key)
+    Image.fromarray(entry['mask']).save(payload['mask_path'], format='PNG', compress_level=1)
+    return {'mask_key': mask_key, 'mask_path': payload['mask_path']}
+
+
+def _handle_remove_video_bg(payload: dict) -> dict:
+    """视频抠图：结果文件直接写到 Web 进程指定的路径，返回处理统计信息"""
+    from video_matting import remove_video_background
+    return remove_video_background(payload['video_path'], payload['output_path'],
+                                   payload.get('output_format'), model_name=payload.get('model_name'))
+
+
+def _handle_transcribe(payload: dict) -> dict:
+    """Whisper 语音识别"""
+    from audio_transcriber import transcribe_video
+    return {'text': asyncio.run(transcribe_video(payload['video_url'], payload.get('language', 'zh')))}
+
+
+# 任务类型 -> 处理函数（新增任务类型时在这里注册）
+HANDLERS = {
+    'remove_bg': _handle_remove_bg,
+    'remove_video_bg': _handle_remove_video_bg,
+    'transcribe': _handle_transcribe,
+}
+
+
+def _heartbeat_loop(broker, job_id: str, stop: threading.Event):
+    interval = config.JOB_BROKER_CONFIG['heartbeat_interval']
+    while not stop.wait(interval):
+        try:
+            broker.heartbeat(job_id)
+        except Exception as e:
+            print(f"心跳写入失败: {e}", flush=True)
+
+
+def run_job(broker, job: dict):
+    """执行一个任务（执行期间后台线程持续写心跳）"""
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(broker, job['id'], stop), daemon=True)
+    heartbeat.start()
+    start = time.perf_counter()
+    try:
+        result = HANDLERS[job['kind']](job['payload'])
+    except Exception as e:
+        traceback.print_exc()
+        broker.fail(job['id'], f'{type(e).__name__}: {e}')
+        print(f"任务失败 {job['kind']} {job['id']}: {e}", flush=True)
+    else:
+        if broker.complete(job['id'], result):
+            print(f"任务完成 {job['kind']} {job['id']} ({time.perf_counter() - start:.2f}s)", flush=True)
+        else:
+            print(f"任务已被取消，丢弃结果 {job['kind']} {job['id']}", flush=True)
+    finally:
+        stop.set()
+
+
+def worker_loop(kinds: list, index: int):
+    """子进程主循环：领取任务 → 执行 → 写回结果，队列为空时短暂等待"""
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+    broker = get_job_broker()
+    idle_interval = config.JOB_BROKER_CONFIG['idle_interval']
+    print(f"推理 worker 启动: {worker_id}, 任务类型 {kinds}", flush=True)
+    while True:
+        job = broker.claim(kinds, worker_id)
+        if job is None:
+            time.sleep(idle_interval)
+            continue
+        run_job(broker, job)
+
+
+def _purge_spool(spool_dir: str, older_than: float):
+    """删除中转目录中的旧文件（任务取消后 worker 仍写出的 mask、Web 进程异常退出遗留的图片）"""
+    deadline = time.time() - older_than
+    for name in os.listdir(spool_dir):
+        path = os.path.join(spool_dir, name)
+        try:
+            if os.path.getmtime(path) < deadline:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def supervise(kinds: list, processes: int):
+    """启动并监控子进程，退出的子进程自动重启；定期处理中断任务、清理旧记录"""
+    broker = get_job_broker()
+    settings = config.JOB_BROKER_CONFIG
+    os.makedirs(settings['spool_dir'], exist_ok=True)
+
+    def spawn(index):
+        process = multiprocessing.Process(target=worker_loop, args=(kinds, index), daemon=True)
+        process.start()
+        return process
+
+    children = [spawn(i) for i in range(processes)]
+    try:
+        while True:
+            time.sleep(settings['heartbeat_interval'])
+            for i, process in enumerate(children):
+                if not process.is_alive():
+                    print(f"推理 worker {i} 已退出 (exitcode={process.exitcode})，重新启动", flush=True)
+                    children[i] = spawn(i)
+            broker.requeue_stale()
+            broker.purge(settings['result_ttl'])
+            _purge_spool(settings['spool_dir'], settings['result_ttl'])
+    except KeyboardInterrupt:
+        print("正在停止推理 worker...", flush=True)
+        for process in children:
+            process.terminate()
+        for process in children:
+            process.join(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='推理 worker（配合 INFERENCE_BACKEND=broker 使用）')
+    parser.add_argument('--processes', type=int, default=1, help='推理子进程数')
+    parser.add_argument('--kinds', default=','.join(HANDLERS), help=f"处理的任务类型，逗号分隔（可选: {', '.join(HANDLERS)}）")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in HANDLERS]
+    if unknown or not kinds:
+        parser.error(f"未知任务类型: {', '.join(unknown) or '(空)'}")
+
+    # worker 进程不需要预热 Web 相关子系统，模型在首个任务时加载
+    os.environ.setdefault('WARMUP_SUBSYSTEMS', 'none')
+    supervise(kinds, max(1, args.processes))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
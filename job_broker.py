@@ -0,0 +1,231 @@
+"""
+本地任务队列 - 基于 SQLite 的任务分发（Web 进程与推理 worker 进程之间）
+
+INFERENCE_BACKEND=broker 时，Web 进程只负责把任务写入队列并等待结果，
+抠图、Whisper 识别等推理在独立的 worker 进程中执行（python inference_worker.py）：
+- 推理卡顿或原生库崩溃不会拖垮 Web 服务
+- Web 进程数（gunicorn workers）和推理进程数可以在同一台机器上分别调整
+
+SQLite 使用 WAL 模式，多进程并发读写；领取任务用 BEGIN IMMEDIATE 保证同一任务只被一个 worker 领取。
+worker 执行期间定时写心跳，心跳超时（进程崩溃/被杀）的任务重新排队，超过最大尝试次数后标记失败。
+
+用法：
+    broker = get_job_broker()
+    job_id = broker.enqueue('remove_bg', {'image_path': ..., 'output_path': ...})
+    result = JobFuture(broker, job_id).result(timeout=300)
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import config
+from metrics import QUEUE_DEPTH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,            -- queued / running / done / failed / cancelled
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, kind, created_at);
+"""
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """打开 SQLite 连接（WAL 模式，自动提交；事务需要显式 BEGIN）"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+class JobFailed(Exception):
+    """任务在 worker 中执行失败"""
+
+
+class JobBroker:
+    """SQLite 任务队列（线程安全、多进程安全）"""
+
+    def __init__(self, db_path: str, stale_after: float, max_attempts: int, expire_after: float = None):
+        self.db_path = db_path
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.expire_after = expire_after    # 排队超过该时间的任务已无人等待结果，不再执行
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程一个连接（fork 后重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = connect(self.db_path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        """提交任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, payload, status, created_at) VALUES (?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), 'queued', time.time()))
+        return job_id
+
+    def claim(self, kinds, worker_id: str):
+        """领取一个最早提交的任务，没有可领取的任务时返回 None"""
+        conn = self._connect()
+        placeholders = ','.join('?' * len(kinds))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self.expire_after:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND created_at < ?',
+                    ('cancelled', '排队超时，任务已过期', time.time(), 'queued', time.time() - self.expire_after))
+            row = conn.execute(
+                f'SELECT id, kind, payload, attempts FROM jobs WHERE status = ? AND kind IN ({placeholders}) '
+                f'ORDER BY created_at LIMIT 1', ('queued', *kinds)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ? '
+                'WHERE id = ?', ('running', worker_id, now, now, row['id']))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'payload': json.loads(row['payload']),
+            'attempt': row['attempts'] + 1,
+        }
+
+    def heartbeat(self, job_id: str):
+        self._connect().execute('UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = ?',
+                                (time.time(), job_id, 'running'))
+
+    def complete(self, job_id: str, result: dict) -> bool:
+        """写入结果；任务已被取消时不覆盖，返回 False"""
+        return self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ? AND status = ?',
+            ('done', json.dumps(result, ensure_ascii=False), time.time(), job_id, 'running')).rowcount > 0
+
+    def fail(self, job_id: str, error: str) -> bool:
+        return self._connect().execute(
+            'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?',
+            ('failed', error[:2000], time.time(), job_id, 'running')).rowcount > 0
+
+    def cancel(self, job_id: str, reason: str = '已取消') -> bool:
+        """取消未结束的任务（排队中的不再被领取；执行中的结果被丢弃），返回是否取消成功"""
+        return self._connect().execute(
+            'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status IN (?, ?)',
+            ('cancelled', reason, time.time(), job_id, 'queued', 'running')).rowcount > 0
+
+    def get(self, job_id: str):
+        """读取任务状态，不存在时返回 None"""
+        row = self._connect().execute(
+            'SELECT id, kind, status, result, error, attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def requeue_stale(self) -> int:
+        """心跳超时的任务重新排队（worker 崩溃），超过最大尝试次数的标记失败"""
+        conn = self._connect()
+        deadline = time.time() - self.stale_after
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            failed = conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, finished_at = ? '
+                'WHERE status = ? AND heartbeat_at < ? AND attempts >= ?',
+                ('failed', 'worker 多次中断，任务放弃', time.time(), 'running', deadline, self.max_attempts)).rowcount
+            requeued = conn.execute(
+                'UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?',
+                ('queued', 'running', deadline)).rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if failed or requeued:
+            print(f"任务队列: {requeued} 个中断任务重新排队, {failed} 个任务放弃", flush=True)
+        return requeued
+
+    def purge(self, older_than: float) -> int:
+        """删除早已结束的任务记录"""
+        return self._connect().execute(
+            'DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?',
+            ('done', 'failed', 'cancelled', time.time() - older_than)).rowcount
+
+    def depth(self, kind: str = None, status: str = 'queued') -> int:
+        if kind is None:
+            row = self._connect().execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (status,)).fetchone()
+        else:
+            row = self._connect().execute('SELECT COUNT(*) FROM jobs WHERE status = ? AND kind = ?',
+                                          (status, kind)).fetchone()
+        return row[0]
+
+
+class JobFuture:
+    """等待队列任务完成（接口与 concurrent.futures.Future.result 一致）"""
+
+    def __init__(self, broker: JobBroker, job_id: str):
+        self.broker = broker
+        self.job_id = job_id
+
+    def result(self, timeout: float = None):
+        """轮询任务状态（间隔逐渐加长），返回 worker 的结果；失败抛出 JobFailed，超时抛出 TimeoutError"""
+        settings = config.JOB_BROKER_CONFIG
+        interval = settings['poll_interval']
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.broker.get(self.job_id)
+            if job is None:
+                raise JobFailed(f'任务不存在: {self.job_id}')
+            if job['status'] == 'done':
+                return job['result']
+            if job['status'] in ('failed', 'cancelled'):
+                raise JobFailed(job['error'] or '任务失败')
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f'等待任务超时: {self.job_id}')
+            time.sleep(interval)
+            interval = min(interval * 1.5, settings['max_poll_interval'])
+
+    def cancel(self, reason: str = '等待结果超时，任务已取消') -> bool:
+        """不再等待结果时取消任务，避免 worker 执行没人需要的任务"""
+        return self.broker.cancel(self.job_id, reason)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_job_broker() -> JobBroker:
+    """获取全局任务队列实例"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                settings = config.JOB_BROKER_CONFIG
+                _broker = JobBroker(settings['db_path'], settings['stale_after'], settings['max_attempts'],
+                                    settings['timeout'])
+                QUEUE_DEPTH.set_function(lambda: _broker.depth(), queue='broker')
+    return _broker
@@ -0,0 +1,247 @@
+"""
+持久化任务记录 - 长任务的参数、逐项进度和结果指针保存在 SQLite 中（与 job_broker 共用数据库文件）
+
+批量抠图（几十张图片）、长视频语音识别（分段）、长文本 TTS（分段）都按“项”记录进度：
+每完成一项就写入一条记录，gunicorn worker 被重启（如超过 --timeout）后，
+同样的请求再次提交时找到原来的任务，从最后完成的项继续，已经完成的图片、分段不再重做。
+
+任务ID由任务类型和参数计算（相同请求对应同一个任务），也可以由调用方指定。
+较大的中间结果（如 TTS 分段音频）写入文件，记录中只保存文件路径。
+
+用法：
+    job = get_job_store().open('batch_remove_bg', {'session': sid, 'images': urls}, total=len(urls))
+    for i, url in enumerate(urls):
+        if job.item(i) is not None:
+            continue                      # 上次已完成
+        ...
+        job.save_item(i, {'processed': filename})
+    job.finish()
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+import config
+from job_broker import connect
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS durable_jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,            -- running / done / failed
+    total INTEGER,
+    result TEXT,
+    error TEXT,
+    runs INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS durable_job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_durable_jobs_updated ON durable_jobs (status, updated_at);
+"""
+
+
+def job_key(kind: str, params: dict) -> str:
+    """根据任务类型和参数生成任务ID（参数相同的请求得到相同的ID）"""
+    canonical = json.dumps(params, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(f'{kind}:{canonical}'.encode('utf-8')).hexdigest()
+
+
+class DurableJob:
+    """一个持久化任务的进度句柄"""
+
+    def __init__(self, store, job_id: str, kind: str, total, completed: dict):
+        self.store = store
+        self.id = job_id
+        self.kind = kind
+        self.total = total
+        self.completed = completed
+        self.resumed = bool(completed)
+
+    @property
+    def all_done(self) -> bool:
+        """总项数已知且全部完成（中断发生在最后汇总之前）"""
+        return self.total is not None and all(i in self.completed for i in range(self.total))
+
+    def item(self, idx: int):
+        """已完成项的结果，未完成返回 None"""
+        return self.completed.get(idx)
+
+    def save_item(self, idx: int, result: dict):
+        """记录一项已完成（同时刷新任务的更新时间）"""
+        self.completed[idx] = result
+        self.store._save_item(self.id, idx, result)
+
+    def blob_path(self, idx: int) -> str:
+        return os.path.join(self.store.spool_dir, self.id, f'{idx}.bin')
+
+    def save_blob(self, idx: int, data: bytes, **extra):
+        """较大的中间结果写入文件，记录中只保存路径"""
+        path = self.blob_path(idx)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.part', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.part', path)
+        self.save_item(idx, {'path': path, 'size': len(data), **extra})
+
+    def load_blob(self, idx: int):
+        """读取 save_blob 写入的数据，未完成或文件已丢失返回 None"""
+        result = self.item(idx)
+        if result is None:
+            return None
+        try:
+            with open(result['path'], 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return data if len(data) == result['size'] else None
+
+    def set_total(self, total: int):
+        self.total = total
+        self.store._update(self.id, total=total)
+
+    def finish(self, result: dict = None):
+        """任务完成：记录结果，删除中间文件"""
+        self.store._update(self.id, status='done', result=json.dumps(result, ensure_ascii=False))
+        shutil.rmtree(os.path.join(self.store.spool_dir, self.id), ignore_errors=True)
+
+    def fail(self, error: str):
+        """任务失败：保留已完成的项，下次提交时继续"""
+        self.store._update(self.id, status='failed', error=str(error)[:2000])
+
+
+class JobStore:
+    """持久化任务记录（线程安全、多进程安全）"""
+
+    def __init__(self, db_path: str, spool_dir: str):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        """每个线程一个连接（fork 后重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = connect(self.db_path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def open(self, kind: str, params: dict, total: int = None, job_id: str = None) -> DurableJob:
+        """
+        创建任务，或继续之前中断/失败的同一任务
+
+        已完成（done）的任务视为新的一次执行，清空之前的进度。
+
+        Args:
+            kind: 任务类型
+            params: 任务参数（可 JSON 序列化），未指定 job_id 时用于计算任务ID
+            total: 总项数（未知时可以之后 set_total）
+            job_id: 调用方指定的任务ID
+        """
+        job_id = job_id or job_key(kind, params)
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT status, total FROM durable_jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None or row['status'] == 'done':
+                conn.execute('DELETE FROM durable_job_items WHERE job_id = ?', (job_id,))
+                conn.execute(
+                    'INSERT OR REPLACE INTO durable_jobs (id, kind, params, status, total, created_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, kind, json.dumps(params, ensure_ascii=False), 'running', total, now, now))
+                completed = {}
+            else:
+                total = total if total is not None else row['total']
+                conn.execute(
+                    'UPDATE durable_jobs SET status = ?, total = COALESCE(?, total), error = NULL, '
+                    'runs = runs + 1, updated_at = ? WHERE id = ?', ('running', total, now, job_id))
+                completed = {
+                    item['idx']: json.loads(item['result'])
+                    for item in conn.execute('SELECT idx, result FROM durable_job_items WHERE job_id = ?', (job_id,))
+                }
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        if completed:
+            print(f"继续中断的任务 {kind} {job_id[:12]}：已完成 {len(completed)} 项", flush=True)
+        return DurableJob(self, job_id, kind, total, completed)
+
+    def _save_item(self, job_id: str, idx: int, result: dict):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO durable_job_items (job_id, idx, result, finished_at) VALUES (?, ?, ?, ?)',
+                (job_id, idx, json.dumps(result, ensure_ascii=False), now))
+            conn.execute('UPDATE durable_jobs SET updated_at = ? WHERE id = ?', (now, job_id))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _update(self, job_id: str, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        self._connect().execute(f'UPDATE durable_jobs SET {columns} WHERE id = ?', (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        """任务状态与进度，不存在时返回 None（运行中但长时间没有进展的任务标记为 interrupted）"""
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT id, kind, status, total, result, error, runs, created_at, updated_at '
+            'FROM durable_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        job['completed'] = conn.execute('SELECT COUNT(*) FROM durable_job_items WHERE job_id = ?',
+                                        (job_id,)).fetchone()[0]
+        stale_after = config.JOB_STORE_CONFIG['stale_after']
+        if job['status'] == 'running' and job['updated_at'] < time.time() - stale_after:
+            job['status'] = 'interrupted'
+        return job
+
+    def purge(self, older_than: float) -> int:
+        """删除长时间未更新的任务记录和中间文件"""
+        conn = self._connect()
+        deadline = time.time() - older_than
+        job_ids = [row[0] for row in conn.execute('SELECT id FROM durable_jobs WHERE updated_at < ?', (deadline,))]
+        for job_id in job_ids:
+            conn.execute('DELETE FROM durable_job_items WHERE job_id = ?', (job_id,))
+            conn.execute('DELETE FROM durable_jobs WHERE id = ?', (job_id,))
+            shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+        return len(job_ids)
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """获取全局任务记录实例（首次创建时清理过期记录）"""
+    global _job_store
+    if _job_store is None:
+        with _job_store_lock:
+            if _job_store is None:
+                settings = config.JOB_STORE_CONFIG
+                _job_store = JobStore(settings['db_path'], settings['spool_dir'])
+                _job_store.purge(settings['retention'])
+    return _job_store
@@ -0,0 +1,248 @@
+"""
+压测驱动 - 按真实比例混合请求回放到 web_app，输出各接口吞吐量与延迟分位数
+
+只依赖标准库。先启动上游替身服务和 Web 服务：
+
+    python loadtest/stub_upstreams.py --port 9100
+    UPSTREAM_OVERRIDE=http://127.0.0.1:9100 ALIYUN_ACCESS_KEY_ID=stub ALIYUN_ACCESS_KEY_SECRET=stub \\
+        ALIYUN_APPKEY=stub gunicorn -c gunicorn.conf.py web_app:app
+
+然后：
+
+    python loadtest/run_load.py --target http://127.0.0.1:7860 --duration 60 --concurrency 16
+    python loadtest/run_load.py --mix parse_video=5,batch_remove_bg=1 --batch-size 8
+
+每个虚拟用户循环按权重随机选择一个场景发请求（请求之间可加思考时间）。
+结果按接口统计：请求数、失败数（非 2xx 或 success=false）、429 次数、吞吐量、p50/p90/p99/最大延迟。
+"""
+
+import io
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import struct
+import zlib
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# 场景默认权重：大致对应线上各接口的调用比例
+DEFAULT_MIX = {
+    'parse_video': 4,
+    'synthesize_speech': 3,
+    'synthesize_speech_tencent': 1,
+    'batch_remove_bg': 1,
+    'upload': 1,
+    'queue_status': 2,
+}
+
+SAMPLE_TEXT = '这款保温杯采用双层真空设计，保冷保热十二小时，杯身轻巧，适合通勤和户外使用。'
+
+
+def _png(size: int) -> bytes:
+    """上传用的随机像素 PNG"""
+    raw = b''.join(b'\x00' + random.randbytes(size * 3) for _ in range(size))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+
+def _multipart(fields: dict, files: list) -> tuple:
+    """构造 multipart/form-data 请求体，返回 (body, content_type)"""
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, content in files:
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: image/png\r\n\r\n'.encode())
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+class Scenarios:
+    """各场景的请求构造：返回 (接口名, 方法, 路径, 请求体, 请求头)"""
+
+    def __init__(self, args):
+        self.batch_size = args.batch_size
+        self.upload_image = _png(args.upload_size)
+
+    def parse_video(self):
+        code = uuid.uuid4().hex[:8]
+        body = json.dumps({'url': f'看看这个 https://v.douyin.com/{code}/ 复制此链接'}).encode()
+        return '/parse_video', 'POST', '/parse_video', body, {'Content-Type': 'application/json'}
+
+    def synthesize_speech(self):
+        body = json.dumps({'text': SAMPLE_TEXT, 'voice': 'xiaoyun'}).encode()
+        return '/synthesize_speech', 'POST', '/synthesize_speech', body, {'Content-Type': 'application/json'}
+
+    def synthesize_speech_tencent(self):
+        body = json.dumps({'text': SAMPLE_TEXT, 'voice': '502004'}).encode()
+        return ('/synthesize_speech_tencent', 'POST', '/synthesize_speech_tencent', body,
+                {'Content-Type': 'application/json'})
+
+    def batch_remove_bg(self):
+        # 商品图分布在少数几个 CDN 域名上
+        urls = [f'https://p{random.randint(1, 3)}-item.ecombdimg.com/img/{uuid.uuid4().hex}.png'
+                for _ in range(self.batch_size)]
+        body = json.dumps({'images': urls}).encode()
+        return '/batch_remove_bg', 'POST', '/batch_remove_bg', body, {'Content-Type': 'application/json'}
+
+    def upload(self):
+        body, content_type = _multipart({'model': 'u2net'}, [('files[]', 'sample.png', self.upload_image)])
+        return '/upload', 'POST', '/upload', body, {'Content-Type': content_type}
+
+    def queue_status(self):
+        return '/queue_status', 'GET', '/queue_status', None, {}
+
+
+class Stats:
+    """按接口汇总结果（线程安全）"""
+
+    def __init__(self):
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def add(self, route: str, latency: float, ok: bool, status: int):
+        with self._lock:
+            entry = self.routes.setdefault(route, {'latencies': [], 'errors': 0, 'rejected': 0, 'statuses': {}})
+            entry['latencies'].append(latency)
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+            if status == 429:
+                entry['rejected'] += 1
+            elif not ok:
+                entry['errors'] += 1
+
+
+def _percentile(values, percent):
+    """百分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def send(target: str, method: str, path: str, body, headers: dict, timeout: float) -> tuple:
+    """发送一个请求，返回 (状态码, 是否成功)"""
+    request = urllib.request.Request(target + path, data=body, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status = response.status
+            content = response.read()
+            content_type = response.headers.get('Content-Type', '')
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code, False
+    except Exception:
+        return 0, False
+
+    ok = 200 <= status < 300
+    if ok and 'json' in content_type:
+        try:
+            data = json.loads(content)
+            if isinstance(data, dict) and data.get('success') is False:
+                ok = False
+        except ValueError:
+            ok = False
+    return status, ok
+
+
+def virtual_user(args, scenarios: Scenarios, mix: dict, stats: Stats, deadline: float):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        scenario = random.choices(names, weights)[0]
+        route, method, path, body, headers = getattr(scenarios, scenario)()
+        start = time.perf_counter()
+        status, ok = send(args.target, method, path, body, headers, args.timeout)
+        stats.add(route, time.perf_counter() - start, ok, status)
+        if args.think_time:
+            time.sleep(random.uniform(0, 2 * args.think_time))
+
+
+def report(stats: Stats, elapsed: float) -> list:
+    rows = []
+    for route, entry in sorted(stats.routes.items()):
+        latencies = entry['latencies']
+        rows.append({
+            'route': route,
+            'requests': len(latencies),
+            'errors': entry['errors'],
+            'rejected_429': entry['rejected'],
+            'rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 1),
+            'p90_ms': round(_percentile(latencies, 90) * 1000, 1),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 1),
+            'max_ms': round(max(latencies) * 1000, 1),
+            'statuses': entry['statuses'],
+        })
+    return rows
+
+
+def _parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"未知场景: {name}（可选: {', '.join(DEFAULT_MIX)}）")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description='web_app 压测驱动')
+    parser.add_argument('--target', default='http://127.0.0.1:7860', help='Web 服务地址')
+    parser.add_argument('--duration', type=float, default=60, help='压测时长（秒）')
+    parser.add_argument('--concurrency', type=int, default=16, help='虚拟用户数')
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help='场景权重，如 parse_video=4,synthesize_speech=3（默认按线上比例）')
+    parser.add_argument('--batch-size', type=int, default=4, help='batch_remove_bg 每次的图片数')
+    parser.add_argument('--upload-size', type=int, default=256, help='upload 场景图片边长（像素）')
+    parser.add_argument('--think-time', type=float, default=0.0, help='请求之间的平均思考时间（秒）')
+    parser.add_argument('--timeout', type=float, default=300, help='单个请求超时（秒）')
+    parser.add_argument('--json', help='把结果另存为 JSON 文件')
+    args = parser.parse_args()
+
+    scenarios = Scenarios(args)
+    stats = Stats()
+    print(f"压测 {args.target}: {args.concurrency} 个虚拟用户, {args.duration:.0f} 秒, 场景 {args.mix}", flush=True)
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(virtual_user, args, scenarios, args.mix, stats, deadline)
+    elapsed = time.perf_counter() - start
+
+    rows = report(stats, elapsed)
+    total = sum(row['requests'] for row in rows)
+    print(f"\n总计 {total} 个请求, {elapsed:.1f} 秒, {total / elapsed:.2f} req/s\n", flush=True)
+    print(f"{'接口':<28}{'请求':>8}{'失败':>7}{'429':>6}{'req/s':>8}{'p50(ms)':>10}{'p90(ms)':>10}"
+          f"{'p99(ms)':>10}{'max(ms)':>10}")
+    for row in rows:
+        print(f"{row['route']:<28}{row['requests']:>8}{row['errors']:>7}{row['rejected_429']:>6}{row['rps']:>8}"
+              f"{row['p50_ms']:>10}{row['p90_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'elapsed': elapsed, 'config': vars(args), 'routes': rows}, f, ensure_ascii=False, indent=2,
+                      default=str)
+        print(f"\n结果已保存: {args.json}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
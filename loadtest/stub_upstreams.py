@@ -0,0 +1,275 @@
+"""
+本地上游替身服务 - 压测时代替抖音 / CDN / 阿里云 NLS / 腾讯云 TTS
+
+只依赖标准库。Web 服务设置 UPSTREAM_OVERRIDE=http://127.0.0.1:9100 后，
+所有外部请求都会发到这里（路径和 Host 头保持原样），按 Host 头区分上游：
+
+    v.douyin.com                 短链接 → 302 到 iesdouyin 分享页
+    www.iesdouyin.com            分享页 HTML、iteminfo 接口
+    www.douyin.com               Web 详情接口、视频网页
+    nls-meta.*.aliyuncs.com      NLS Token
+    nls-gateway-*.aliyuncs.com   一句话识别（POST /stream/v1/asr）、TTS（GET /stream/v1/tts）
+    tts.tencentcloudapi.com      腾讯云 TTS（按 X-TC-Action 头识别，Host 为替身地址本身）
+    其他主机                      CDN：/video/... 返回 WAV 音频（可被 ffmpeg 提取），其余返回随机像素 PNG
+
+每个上游可以单独配置延迟和错误率：
+
+    python loadtest/stub_upstreams.py --port 9100 \\
+        --latency douyin=0.3 --latency cdn=0.05 --latency aliyun_asr=1.5 \\
+        --error-rate douyin=0.05 --jitter 0.3
+"""
+
+import re
+import io
+import sys
+import json
+import time
+import zlib
+import wave
+import base64
+import random
+import struct
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+SERVICES = ['douyin', 'cdn', 'aliyun_token', 'aliyun_asr', 'aliyun_tts', 'tencent_tts']
+
+# 默认延迟（秒），大致对应线上观测到的量级
+DEFAULT_LATENCY = {
+    'douyin': 0.3,
+    'cdn': 0.05,
+    'aliyun_token': 0.1,
+    'aliyun_asr': 1.5,
+    'aliyun_tts': 0.8,
+    'tencent_tts': 0.6,
+}
+
+
+def _png(width: int, height: int) -> bytes:
+    """随机像素的 RGB PNG（随机内容压缩不了，文件大小与真实商品图接近）"""
+    raw = b''.join(b'\x00' + random.randbytes(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 1)) + chunk(b'IEND', b'')
+
+
+def _wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """带轻微噪声的单声道 WAV"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        frames = int(seconds * sample_rate)
+        w.writeframes(b''.join(struct.pack('<h', random.randint(-200, 200)) for _ in range(frames)))
+    return buffer.getvalue()
+
+
+def _aweme(video_id: str, origin_host: str = 'stub-cdn.douyinvod.com') -> dict:
+    """iteminfo / Web 详情接口中的视频数据"""
+    return {
+        'aweme_id': video_id,
+        'desc': f'替身视频 {video_id} 的文案 #好物推荐',
+        'create_time': 1700000000,
+        'author': {'nickname': '替身作者', 'uid': '10000'},
+        'video': {
+            'duration': 15000,
+            'play_addr': {'url_list': [f'https://{origin_host}/video/{video_id}.mp4?watermark=1&playwm=1']},
+            'cover': {'url_list': [f'https://{origin_host}/img/cover_{video_id}.png']},
+        },
+        'music': {'play_url': {'url_list': []}},
+        'statistics': {'digg_count': 100, 'comment_count': 10, 'share_count': 5, 'collect_count': 8},
+    }
+
+
+class StubState:
+    """延迟/错误率配置与请求计数"""
+
+    def __init__(self, latency: dict, error_rate: dict, jitter: float, image_size: int, audio_seconds: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.image = _png(image_size, image_size)
+        self.audio = _wav(audio_seconds)
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, service: str, result: str):
+        with self._lock:
+            key = f'{service}:{result}'
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def delay(self, service: str):
+        base = self.latency.get(service, 0.0)
+        if base > 0:
+            time.sleep(base * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def should_fail(self, service: str) -> bool:
+        return random.random() < self.error_rate.get(service, 0.0)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        # 压测时请求量很大，不逐条打印
+        pass
+
+    # ---------- 响应 ----------
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _json(self, data, status: int = 200):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+    # ---------- 分发 ----------
+
+    def _service(self, host: str, path: str) -> str:
+        if self.headers.get('X-TC-Action'):
+            return 'tencent_tts'
+        if host == 'v.douyin.com' or host.endswith('douyin.com'):
+            return 'douyin'
+        if host.startswith('nls-meta.'):
+            return 'aliyun_token'
+        if host.startswith('nls-gateway'):
+            return 'aliyun_tts' if path.startswith('/stream/v1/tts') else 'aliyun_asr'
+        return 'cdn'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        url = urlsplit(self.path)
+        if url.path == '/__stats':
+            # 各上游的请求计数（不计入延迟/错误注入）
+            self._json(self.state.counts)
+            return
+
+        host = (self.headers.get('Host') or '').split(':')[0]
+        service = self._service(host, url.path)
+
+        self.state.delay(service)
+        if self.state.should_fail(service):
+            self.state.count(service, 'error')
+            self._json({'message': 'stub injected error'}, status=503)
+            return
+        self.state.count(service, 'ok')
+
+        if service == 'douyin':
+            self._douyin(host, url.path, parse_qs(url.query))
+        elif service == 'aliyun_token':
+            self._json({'Token': {'Id': 'stub-token', 'ExpireTime': int(time.time()) + 86400}})
+        elif service == 'aliyun_asr':
+            self._json({'status': 20000000, 'message': 'SUCCESS', 'result': '这是替身语音识别的结果。'})
+        elif service == 'aliyun_tts':
+            self._send(200, self.state.audio, 'audio/mpeg')
+        elif service == 'tencent_tts':
+            self._json({'Response': {
+                'Audio': base64.b64encode(self.state.audio).decode('ascii'),
+                'SessionId': 'stub',
+                'RequestId': 'stub-request',
+            }})
+        elif url.path.startswith('/video/'):
+            self._send(200, self.state.audio, 'video/mp4')
+        else:
+            self._send(200, self.state.image, 'image/png')
+
+    def _douyin(self, host: str, path: str, query: dict):
+        if host == 'v.douyin.com':
+            # 短链接：随机生成视频ID，跳转到分享页
+            video_id = str(7000000000000000000 + random.randrange(10 ** 12))
+            self._send(302, b'', 'text/html',
+                       {'Location': f'https://www.iesdouyin.com/share/video/{video_id}/'})
+            return
+
+        match = re.search(r'/video/(\d+)', path)
+        if path.startswith('/share/video/') and match:
+            aweme = _aweme(match.group(1))
+            play_url = aweme['video']['play_addr']['url_list'][0].replace('/', '\\u002F')
+            cover_url = aweme['video']['cover']['url_list'][0].replace('/', '\\u002F')
+            html = ('<html><body><script>window._ROUTER_DATA = {'
+                    f'"desc":"{aweme["desc"]}","nickname":"{aweme["author"]["nickname"]}",'
+                    f'"cover": {{"url_list": ["{cover_url}"]}},'
+                    f'"playAddr": [{{"src":"{play_url}"}}]'
+                    '}</script></body></html>')
+            self._send(200, html.encode('utf-8'), 'text/html; charset=utf-8')
+        elif path.startswith('/web/api/v2/aweme/iteminfo'):
+            video_id = (query.get('item_ids') or ['0'])[0]
+            self._json({'status_code': 0, 'item_list': [_aweme(video_id)]})
+        elif path.startswith('/aweme/v1/web/aweme/detail'):
+            video_id = (query.get('aweme_id') or ['0'])[0]
+            self._json({'status_code': 0, 'aweme_detail': _aweme(video_id)})
+        else:
+            self._send(404, b'not found', 'text/plain')
+
+    do_GET = _handle
+    do_POST = _handle
+    do_HEAD = _handle
+
+
+def _parse_pairs(values, defaults=None) -> dict:
+    """--latency douyin=0.3 → {'douyin': 0.3}；service 为 all 时应用到所有上游"""
+    result = dict(defaults or {})
+    for item in values or []:
+        name, _, value = item.partition('=')
+        names = SERVICES if name == 'all' else [name]
+        for service in names:
+            if service not in SERVICES:
+                raise SystemExit(f"未知上游: {service}（可选: {', '.join(SERVICES)}, all）")
+            result[service] = float(value)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地上游替身服务（压测用）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', action='append', metavar='SERVICE=SECONDS',
+                        help=f"上游延迟，可重复；SERVICE: {', '.join(SERVICES)}, all")
+    parser.add_argument('--error-rate', action='append', metavar='SERVICE=RATE',
+                        help='注入 503 错误的比例（0~1），可重复')
+    parser.add_argument('--jitter', type=float, default=0.3, help='延迟随机抖动比例（默认 ±30%%）')
+    parser.add_argument('--image-size', type=int, default=300, help='CDN 图片边长（像素）')
+    parser.add_argument('--audio-seconds', type=float, default=8.0, help='视频/TTS 音频时长（秒）')
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(
+        latency=_parse_pairs(args.latency, DEFAULT_LATENCY),
+        error_rate=_parse_pairs(args.error_rate),
+        jitter=args.jitter,
+        image_size=args.image_size,
+        audio_seconds=args.audio_seconds,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    print(f"上游替身服务已启动: http://{args.host}:{args.port}", flush=True)
+    print(f"  延迟: {StubHandler.state.latency}", flush=True)
+    print(f"  错误率: {StubHandler.state.error_rate or '无'}", flush=True)
+    print(f"Web 服务请设置 UPSTREAM_OVERRIDE=http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
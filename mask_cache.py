@@ -0,0 +1,105 @@
+"""
+抠图 mask 缓存模块
+缓存每张图片的原始模型输出（未经阈值/形态学/alpha matting 处理的显著性图），
+调整后处理参数重新渲染时无需再次运行 ONNX 推理
+
+mask 与原图同分辨率（大图单张十几 MB），除条目数外还按总字节数淘汰
+"""
+
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import config
+from metrics import CACHE_REQUESTS
+
+
+class MaskCache:
+    """带 TTL、条目数和总字节数上限的 mask 缓存（LRU 淘汰）"""
+
+    def __init__(self, ttl: int = None, max_entries: int = None, max_bytes: int = None):
+        self.ttl = ttl or config.MASK_CACHE_CONFIG['ttl']
+        self.max_entries = max_entries or config.MASK_CACHE_CONFIG['max_entries']
+        self.max_bytes = max_bytes or config.MASK_CACHE_CONFIG['max_mb'] * 1024 * 1024
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_bytes: bytes, model_name: str) -> str:
+        """根据图片内容和模型名生成缓存键"""
+        digest = hashlib.sha1(image_bytes)
+        digest.update(model_name.encode('utf-8'))
+        return digest.hexdigest()
+
+    def put(self, key: str, image_bytes: bytes, mask, model_name: str):
+        """
+        写入缓存
+
+        缓存在所有会话之间共享（同一张图片、同一模型只推理一次），只保存图片和 mask；
+        处理结果的文件名属于各自的会话，由 /rerender 请求传入
+
+        Args:
+            key: 缓存键
+            image_bytes: 原始图片数据（压缩格式，比解码后的像素占用内存少）
+            mask: 模型输出的原始 mask（uint8 数组）
+            model_name: 使用的模型
+        """
+        size = len(image_bytes) + mask.nbytes
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'image_bytes': image_bytes,
+                'mask': mask,
+                'model': model_name,
+                'size': size,
+                'expires_at': time.time() + self.ttl,
+            }
+            self._total_bytes += size
+            self._evict()
+
+    def get(self, key: str):
+        """读取缓存，过期或不存在返回 None（命中时续期）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                CACHE_REQUESTS.inc(cache='mask', result='miss')
+                return None
+            if entry['expires_at'] < time.time():
+                self._remove(key)
+                CACHE_REQUESTS.inc(cache='mask', result='miss')
+                return None
+            CACHE_REQUESTS.inc(cache='mask', result='hit')
+            entry['expires_at'] = time.time() + self.ttl
+            self._entries.move_to_end(key)
+            return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry['size']
+
+    def _evict(self):
+        """清理过期条目，并按 LRU 淘汰超出条目数或总字节数的条目（至少保留最新的一条）"""
+        now = time.time()
+        for key in [k for k, v in self._entries.items() if v['expires_at'] < now]:
+            self._remove(key)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                          or self._total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# 全局实例
+_mask_cache = None
+
+
+def get_mask_cache() -> MaskCache:
+    """获取全局 mask 缓存实例"""
+    global _mask_cache
+    if _mask_cache is None:
+        _mask_cache = MaskCache()
+    return _mask_cache
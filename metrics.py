@@ -0,0 +1,239 @@
+"""
+运行指标 - Prometheus 文本格式导出（/metrics）
+
+只依赖标准库：每次观测是一次加锁的字典查找 + 计数累加，开销在微秒级，生产环境可以常开。
+指标保存在进程内存中；gunicorn 多 worker 时每个进程各自统计，Prometheus 按实例分别抓取即可。
+
+用法：
+    from metrics import stage, UPSTREAM_ERRORS
+
+    with stage('inference'):
+        mask = predict_mask(image)
+
+    UPSTREAM_ERRORS.inc(service='aliyun_asr')
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+import request_timing
+
+# 延迟直方图默认分桶（秒）：覆盖毫秒级后处理到分钟级的视频解析/语音识别
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _header(self) -> list:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+
+    def render(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self._header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(_Metric):
+    """当前值；可以通过 set_function() 在导出时实时读取（如队列长度）"""
+    type_name = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """导出时调用 function() 取值，出错时跳过"""
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def render(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        lines = self._header()
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram(_Metric):
+    """延迟直方图（累计分桶 + 总和 + 计数）"""
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶计数..., 总和, 总数]
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        lines = self._header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            le = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {state[-1]}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+def render_metrics() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+# ==================== 指标定义 ====================
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', '接口请求耗时（到响应返回为止，流式响应不含发送时间）',
+    ['route', 'method', 'status'])
+
+STAGE_LATENCY = Histogram(
+    'stage_duration_seconds', '内部处理阶段耗时',
+    ['stage'])
+
+VIDEO_PARSE_LATENCY = Histogram(
+    'video_parse_strategy_duration_seconds', '抖音视频解析各策略耗时',
+    ['strategy', 'result'])
+
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', '缓存查询次数',
+    ['cache', 'result'])
+
+UPSTREAM_ERRORS = Counter(
+    'upstream_errors_total', '上游服务调用失败次数',
+    ['service'])
+
+QUEUE_DEPTH = Gauge(
+    'queue_depth', '排队中的任务数',
+    ['queue'])
+
+ADMISSION_REJECTS = Counter(
+    'admission_rejected_total', '因队列已满被拒绝的请求数',
+    ['queue'])
+
+CIRCUIT_STATE = Gauge(
+    'circuit_breaker_state', '上游熔断器状态（0=closed, 1=half_open, 2=open）',
+    ['upstream'])
+
+CIRCUIT_REJECTS = Counter(
+    'circuit_breaker_rejected_total', '熔断期间被直接拒绝的上游调用次数',
+    ['upstream'])
+
+CIRCUIT_TRANSITIONS = Counter(
+    'circuit_breaker_transitions_total', '熔断器状态切换次数',
+    ['upstream', 'state'])
+
+COALESCED_REQUESTS = Counter(
+    'singleflight_coalesced_total', '合并到进行中的相同请求（未重复执行）的次数',
+    ['group'])
+
+
+VIDEO_PARSE_WINS = Counter(
+    'video_parse_strategy_wins_total', '抖音视频解析中最先返回有效结果的策略次数',
+    ['strategy'])
+
+
+@contextmanager
+def stage(name: str):
+    """记录一个内部阶段的耗时：with stage('inference'): ...（同时计入当前请求的 Server-Timing）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=name)
+        request_timing.record(name, elapsed)
@@ -0,0 +1,177 @@
+"""
+输出目录管理 - 按会话隔离处理结果，后台清理过期文件
+
+每个浏览器会话（cookie 中的 sid）拥有独立的输出子目录 web_outputs/<sid>/，
+多个用户同时使用时互不覆盖、互不清空。
+后台清理线程按 TTL 删除长时间未访问的会话目录，总占用超过配额时从最久未访问的会话开始删除。
+清空会话只是把目录改名移走（O(1)），实际删除也交给清理线程，不占用请求时间。
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+import config
+
+_SID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# 已清空、等待清理线程删除的目录前缀
+_TRASH_PREFIX = '.trash_'
+
+
+def new_session_id() -> str:
+    """生成新的会话ID"""
+    return uuid.uuid4().hex
+
+
+def is_valid_session_id(sid) -> bool:
+    """会话ID只允许32位十六进制，防止路径穿越"""
+    return bool(sid) and bool(_SID_PATTERN.match(sid))
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _remove(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class OutputStore:
+    """按会话划分的输出目录 + TTL/配额清理"""
+
+    def __init__(self, root: str, ttl: float, max_total_bytes: int, interval: float):
+        """
+        Args:
+            root: 输出根目录
+            ttl: 会话目录多久未访问后删除（秒）
+            max_total_bytes: 输出目录总大小上限（字节）
+            interval: 清理线程运行间隔（秒）
+        """
+        self.root = root
+        self.ttl = ttl
+        self.max_total_bytes = max_total_bytes
+        self.interval = interval
+        self._janitor = None
+        self._janitor_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def session_dir(self, sid: str) -> str:
+        """获取会话输出目录（不存在时创建），并刷新访问时间"""
+        if not is_valid_session_id(sid):
+            raise ValueError("无效的会话ID")
+        path = os.path.join(self.root, sid)
+        os.makedirs(path, exist_ok=True)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def reset_session(self, sid: str):
+        """清空会话的所有输出：目录改名后由清理线程删除"""
+        if not is_valid_session_id(sid):
+            return
+        path = os.path.join(self.root, sid)
+        if os.path.isdir(path):
+            trash = os.path.join(self.root, f'{_TRASH_PREFIX}{sid}_{uuid.uuid4().hex[:8]}')
+            try:
+                os.rename(path, trash)
+            except OSError:
+                pass
+
+    def cleanup(self) -> dict:
+        """
+        执行一次清理
+
+        Returns:
+            {'removed': 删除的条目数, 'freed': 释放的字节数, 'total': 清理后的总大小}
+        """
+        now = time.time()
+        removed = 0
+        freed = 0
+        entries = []
+
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            size = _dir_size(path) if os.path.isdir(path) else os.path.getsize(path)
+
+            # 已清空的目录、过期的会话（以及旧版本直接放在根目录下的文件）
+            if name.startswith(_TRASH_PREFIX) or now - mtime > self.ttl:
+                _remove(path)
+                removed += 1
+                freed += size
+            else:
+                entries.append((mtime, size, path))
+
+        # 超过配额：从最久未访问的开始删除
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_total_bytes:
+                break
+            _remove(path)
+            removed += 1
+            freed += size
+            total -= size
+
+        return {'removed': removed, 'freed': freed, 'total': total}
+
+    def _run_janitor(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                stats = self.cleanup()
+                if stats['removed']:
+                    print(f"输出目录清理: 删除 {stats['removed']} 项, 释放 {stats['freed'] / 1024 / 1024:.1f}MB, "
+                          f"当前占用 {stats['total'] / 1024 / 1024:.1f}MB", flush=True)
+            except Exception as e:
+                print(f"输出目录清理失败: {e}", flush=True)
+
+    def start_janitor(self):
+        """启动后台清理线程（每个进程一个，fork 后重新启动）"""
+        if self._janitor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._janitor_pid == os.getpid():
+                return
+            self._janitor = threading.Thread(target=self._run_janitor, name='output-janitor', daemon=True)
+            self._janitor.start()
+            self._janitor_pid = os.getpid()
+
+
+# 全局实例
+_output_store = None
+
+
+def get_output_store() -> OutputStore:
+    """获取输出目录管理器（首次调用时启动清理线程）"""
+    global _output_store
+    if _output_store is None:
+        settings = config.OUTPUT_STORE_CONFIG
+        _output_store = OutputStore(
+            settings['root'],
+            ttl=settings['ttl'],
+            max_total_bytes=settings['max_total_mb'] * 1024 * 1024,
+            interval=settings['janitor_interval'],
+        )
+    _output_store.start_janitor()
+    return _output_store
@@ -5,12 +5,13 @@
 
 import re
 import json
-import httpx
 import asyncio
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 from playwright.async_api import async_playwright
 from playwright_stealth import Stealth
+from http_transport import get_async_client
+from short_link import short_code, get_short_link_resolver
 
 
 @dataclass
@@ -70,8 +71,19 @@ class DouyinProductParser:
         product_id = self.extract_product_id(url)
         print(f"解析商品ID: {product_id}", flush=True)
 
-        # 如果是短链接，标记为需要跟随重定向
+        # 短链接先只读取跳转地址（结果按短码缓存），得到商品ID后直接访问商品页
         is_short_link = (product_id == 'SHORT_LINK')
+        if is_short_link and short_code(url):
+            try:
+                real_url = await get_short_link_resolver().resolve(url)
+                resolved_id = self.extract_product_id(real_url)
+                if resolved_id != 'SHORT_LINK':
+                    print(f"短链接跳转到: {real_url}，商品ID: {resolved_id}", flush=True)
+                    url, product_id, is_short_link = real_url, resolved_id, False
+            except Exception as e:
+                print(f"短链接解析失败: {e}", flush=True)
+
+        # 如果仍是短链接，标记为需要跟随重定向
         if is_short_link:
             print("检测到抖音短链接，将跟随重定向...", flush=True)
 
@@ -306,120 +318,120 @@ class DouyinProductParser:
     async def _parse_html(self, url: str, product_id: str) -> Optional[ProductInfo]:
         """从HTML页面解析商品图片"""
         try:
-            async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
-                response = await client.get(url, headers=self.headers)
+            client = get_async_client('douyin_desktop')
+            response = await client.get(url, headers=self.headers)
 
-                if response.status_code != 200:
-                    print(f"页面请求失败: HTTP {response.status_code}", flush=True)
-                    return None
+            if response.status_code != 200:
+                print(f"页面请求失败: HTTP {response.status_code}", flush=True)
+                return None
 
-                html = response.text
-                print(f"获取到HTML，长度: {len(html)} 字符", flush=True)
+            html = response.text
+            print(f"获取到HTML，长度: {len(html)} 字符", flush=True)
+
+            # 尝试从页面中提取JSON数据
+            main_images = []
+            detail_images = []
+            title = ""
+            video_url = None
+
+            # 调试：打印HTML中的关键片段
+            if 'ecombdimg.com' in html:
+                print("HTML中包含ecombdimg.com图片", flush=True)
+            if '_ROUTER_DATA' in html:
+                print("HTML中包含_ROUTER_DATA", flush=True)
+            if '__INITIAL_STATE__' in html:
+                print("HTML中包含__INITIAL_STATE__", flush=True)
+
+            # 查找script中的商品数据
+            # 抖音商品页通常会在script标签中嵌入JSON数据
+            json_patterns = [
+                r'window\._ROUTER_DATA\s*=\s*({.*?})\s*</script>',  # jinritemai格式
+                r'window\.__INITIAL_STATE__\s*=\s*({.*?});?\s*</script>',
+                r'window\.__NUXT__\s*=\s*({.*?});?\s*</script>',
+                r'<script[^>]*>window\.rawData\s*=\s*({.*?})\s*</script>',
+                r'<script[^>]*id="__NEXT_DATA__"[^>]*>({.*?})</script>',
+            ]
+
+            # 特别处理jinritemai的数据结构
+            router_match = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*?\})\s*</script>', html, re.DOTALL)
+            if router_match:
+                try:
+                    router_data = json.loads(router_match.group(1))
+                    print(f"找到_ROUTER_DATA数据", flush=True)
+                    # 递归查找商品数据
+                    product_data = self._find_product_in_router(router_data)
+                    if product_data:
+                        images = self._extract_images_from_json(product_data)
+                        if images:
+                            main_images.extend(images.get('main', []))
+                            detail_images.extend(images.get('detail', []))
+                            title = images.get('title', '')
+                            video_url = images.get('video')
+                except json.JSONDecodeError as e:
+                    print(f"_ROUTER_DATA解析失败: {e}", flush=True)
+
+            for pattern in json_patterns:
+                match = re.search(pattern, html, re.DOTALL)
+                if match:
+                    try:
+                        data = json.loads(match.group(1))
+                        # 尝试从数据中提取图片
+                        images = self._extract_images_from_json(data)
+                        if images:
+                            main_images.extend(images.get('main', []))
+                            detail_images.extend(images.get('detail', []))
+                            title = images.get('title', '')
+                            video_url = images.get('video')
+                    except json.JSONDecodeError:
+                        continue
+
+            # 如果JSON解析失败，尝试直接从HTML提取图片URL
+            if not main_images and not detail_images:
+                # 提取所有图片URL - 特别关注字节跳动CDN
+                img_patterns = [
+                    r'https?://p\d+-aio\.ecombdimg\.com[^"\'<>\s]+',  # 字节跳动商品图CDN
+                    r'https?://lf\d+-[^\.]+\.bytetos\.com[^"\'<>\s]+',  # 字节跳动CDN
+                    r'https?://[^"\'<>\s]+\.douyinpic\.com[^"\'<>\s]+',  # 抖音图片
+                    r'https?://[^"\'<>\s]+\.byteimg\.com[^"\'<>\s]+',  # 字节图片
+                    r'https?://[^"\'<>\s]+\.(?:jpg|jpeg|png|webp)(?:\?[^"\'<>\s]*)?',
+                ]
 
-                # 尝试从页面中提取JSON数据
-                main_images = []
-                detail_images = []
-                title = ""
-                video_url = None
+                all_images = set()
+                for pattern in img_patterns:
+                    matches = re.findall(pattern, html, re.IGNORECASE)
+                    for img_url in matches:
+                        # 过滤掉太小的图片（可能是图标）
+                        if self._is_valid_product_image(img_url):
+                            all_images.add(img_url)
 
-                # 调试：打印HTML中的关键片段
-                if 'ecombdimg.com' in html:
-                    print("HTML中包含ecombdimg.com图片", flush=True)
-                if '_ROUTER_DATA' in html:
-                    print("HTML中包含_ROUTER_DATA", flush=True)
-                if '__INITIAL_STATE__' in html:
-                    print("HTML中包含__INITIAL_STATE__", flush=True)
-
-                # 查找script中的商品数据
-                # 抖音商品页通常会在script标签中嵌入JSON数据
-                json_patterns = [
-                    r'window\._ROUTER_DATA\s*=\s*({.*?})\s*</script>',  # jinritemai格式
-                    r'window\.__INITIAL_STATE__\s*=\s*({.*?});?\s*</script>',
-                    r'window\.__NUXT__\s*=\s*({.*?});?\s*</script>',
-                    r'<script[^>]*>window\.rawData\s*=\s*({.*?})\s*</script>',
-                    r'<script[^>]*id="__NEXT_DATA__"[^>]*>({.*?})</script>',
-                ]
+                # 按URL特征分类
+                for img_url in all_images:
+                    if any(kw in img_url for kw in ['main', 'primary', 'cover', 'thumb']):
+                        main_images.append(img_url)
+                    else:
+                        detail_images.append(img_url)
 
-                # 特别处理jinritemai的数据结构
-                router_match = re.search(r'window\._ROUTER_DATA\s*=\s*(\{.*?\})\s*</script>', html, re.DOTALL)
-                if router_match:
-                    try:
-                        router_data = json.loads(router_match.group(1))
-                        print(f"找到_ROUTER_DATA数据", flush=True)
-                        # 递归查找商品数据
-                        product_data = self._find_product_in_router(router_data)
-                        if product_data:
-                            images = self._extract_images_from_json(product_data)
-                            if images:
-                                main_images.extend(images.get('main', []))
-                                detail_images.extend(images.get('detail', []))
-                                title = images.get('title', '')
-                                video_url = images.get('video')
-                    except json.JSONDecodeError as e:
-                        print(f"_ROUTER_DATA解析失败: {e}", flush=True)
-
-                for pattern in json_patterns:
-                    match = re.search(pattern, html, re.DOTALL)
-                    if match:
-                        try:
-                            data = json.loads(match.group(1))
-                            # 尝试从数据中提取图片
-                            images = self._extract_images_from_json(data)
-                            if images:
-                                main_images.extend(images.get('main', []))
-                                detail_images.extend(images.get('detail', []))
-                                title = images.get('title', '')
-                                video_url = images.get('video')
-                        except json.JSONDecodeError:
-                            continue
-
-                # 如果JSON解析失败，尝试直接从HTML提取图片URL
-                if not main_images and not detail_images:
-                    # 提取所有图片URL - 特别关注字节跳动CDN
-                    img_patterns = [
-                        r'https?://p\d+-aio\.ecombdimg\.com[^"\'<>\s]+',  # 字节跳动商品图CDN
-                        r'https?://lf\d+-[^\.]+\.bytetos\.com[^"\'<>\s]+',  # 字节跳动CDN
-                        r'https?://[^"\'<>\s]+\.douyinpic\.com[^"\'<>\s]+',  # 抖音图片
-                        r'https?://[^"\'<>\s]+\.byteimg\.com[^"\'<>\s]+',  # 字节图片
-                        r'https?://[^"\'<>\s]+\.(?:jpg|jpeg|png|webp)(?:\?[^"\'<>\s]*)?',
-                    ]
-
-                    all_images = set()
-                    for pattern in img_patterns:
-                        matches = re.findall(pattern, html, re.IGNORECASE)
-                        for img_url in matches:
-                            # 过滤掉太小的图片（可能是图标）
-                            if self._is_valid_product_image(img_url):
-                                all_images.add(img_url)
-
-                    # 按URL特征分类
-                    for img_url in all_images:
-                        if any(kw in img_url for kw in ['main', 'primary', 'cover', 'thumb']):
-                            main_images.append(img_url)
-                        else:
-                            detail_images.append(img_url)
-
-                    # 如果没有明确分类，前5张作为主图
-                    if not main_images and detail_images:
-                        main_images = detail_images[:5]
-                        detail_images = detail_images[5:]
+                # 如果没有明确分类，前5张作为主图
+                if not main_images and detail_images:
+                    main_images = detail_images[:5]
+                    detail_images = detail_images[5:]
 
-                # 提取标题
-                if not title:
-                    title_match = re.search(r'<title[^>]*>([^<]+)</title>', html)
-                    if title_match:
-                        title = title_match.group(1).strip()
+            # 提取标题
+            if not title:
+                title_match = re.search(r'<title[^>]*>([^<]+)</title>', html)
+                if title_match:
+                    title = title_match.group(1).strip()
 
-                if main_images or detail_images:
-                    return ProductInfo(
-                        product_id=product_id,
-                        title=title,
-                        main_images=list(set(main_images)),
-                        detail_images=list(set(detail_images)),
-                        video_url=video_url
-                    )
+            if main_images or detail_images:
+                return ProductInfo(
+                    product_id=product_id,
+                    title=title,
+                    main_images=list(set(main_images)),
+                    detail_images=list(set(detail_images)),
+                    video_url=video_url
+                )
 
-                return None
+            return None
 
         except Exception as e:
             print(f"HTML解析失败: {e}", flush=True)
@@ -448,71 +460,71 @@ class DouyinProductParser:
             'Referer': 'https://www.douyin.com/',
         }
 
-        async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
-            for api_url in api_urls:
-                try:
-                    print(f"尝试API: {api_url[:60]}...", flush=True)
-                    response = await client.get(api_url, headers=mobile_headers)
-                    if response.status_code == 200:
-                        content = response.text
-
-                        # 尝试解析JSON
-                        try:
-                            data = response.json()
-                            images = self._extract_images_from_json(data)
-                            if images and (images.get('main') or images.get('detail')):
-                                print(f"从API JSON获取到图片数据", flush=True)
-                                return ProductInfo(
-                                    product_id=product_id,
-                                    title=images.get('title', ''),
-                                    main_images=images.get('main', []),
-                                    detail_images=images.get('detail', []),
-                                    video_url=images.get('video')
-                                )
-                        except json.JSONDecodeError:
-                            pass
-
-                        # 如果不是JSON，尝试从HTML提取图片
-                        if 'ecombdimg.com' in content or len(content) > 10000:
-                            print(f"尝试从HTML提取图片 (长度: {len(content)})", flush=True)
-
-                            # 提取图片URL
-                            img_patterns = [
-                                r'https?://p\d+-aio\.ecombdimg\.com[^"\'<>\s\)\],]+',
-                                r'https?://lf\d+-[^\.]+\.bytetos\.com[^"\'<>\s\)\],]+',
-                                r'https?://[^"\'<>\s\)\],]+\.douyinpic\.com[^"\'<>\s\)\],]+',
-                            ]
-
-                            all_images = set()
-                            for pattern in img_patterns:
-                                matches = re.findall(pattern, content)
-                                for img_url in matches:
-                                    img_url = img_url.rstrip('",;')
-                                    if self._is_valid_product_image(img_url):
-                                        all_images.add(img_url)
-
-                            if all_images:
-                                print(f"从HTML提取到 {len(all_images)} 张图片", flush=True)
-                                images_list = list(all_images)
-                                main_images = images_list[:5]
-                                detail_images = images_list[5:]
-
-                                # 提取标题
-                                title = ""
-                                title_match = re.search(r'<title[^>]*>([^<]+)</title>', content)
-                                if title_match:
-                                    title = title_match.group(1).strip()
-
-                                return ProductInfo(
-                                    product_id=product_id,
-                                    title=title,
-                                    main_images=main_images,
-                                    detail_images=detail_images,
-                                    video_url=None
-                                )
-                except Exception as e:
-                    print(f"API请求失败: {str(e)[:50]}", flush=True)
-                    continue
+        client = get_async_client('douyin_mobile')
+        for api_url in api_urls:
+            try:
+                print(f"尝试API: {api_url[:60]}...", flush=True)
+                response = await client.get(api_url, headers=mobile_headers)
+                if response.status_code == 200:
+                    content = response.text
+
+                    # 尝试解析JSON
+                    try:
+                        data = response.json()
+                        images = self._extract_images_from_json(data)
+                        if images and (images.get('main') or images.get('detail')):
+                            print(f"从API JSON获取到图片数据", flush=True)
+                            return ProductInfo(
+                                product_id=product_id,
+                                title=images.get('title', ''),
+                                main_images=images.get('main', []),
+                                detail_images=images.get('detail', []),
+                                video_url=images.get('video')
+                            )
+                    except json.JSONDecodeError:
+                        pass
+
+                    # 如果不是JSON，尝试从HTML提取图片
+                    if 'ecombdimg.com' in content or len(content) > 10000:
+                        print(f"尝试从HTML提取图片 (长度: {len(content)})", flush=True)
+
+                        # 提取图片URL
+                        img_patterns = [
+                            r'https?://p\d+-aio\.ecombdimg\.com[^"\'<>\s\)\],]+',
+                            r'https?://lf\d+-[^\.]+\.bytetos\.com[^"\'<>\s\)\],]+',
+                            r'https?://[^"\'<>\s\)\],]+\.douyinpic\.com[^"\'<>\s\)\],]+',
+                        ]
+
+                        all_images = set()
+                        for pattern in img_patterns:
+                            matches = re.findall(pattern, content)
+                            for img_url in matches:
+                                img_url = img_url.rstrip('",;')
+                                if self._is_valid_product_image(img_url):
+                                    all_images.add(img_url)
+
+                        if all_images:
+                            print(f"从HTML提取到 {len(all_images)} 张图片", flush=True)
+                            images_list = list(all_images)
+                            main_images = images_list[:5]
+                            detail_images = images_list[5:]
+
+                            # 提取标题
+                            title = ""
+                            title_match = re.search(r'<title[^>]*>([^<]+)</title>', content)
+                            if title_match:
+                                title = title_match.group(1).strip()
+
+                            return ProductInfo(
+                                product_id=product_id,
+                                title=title,
+                                main_images=main_images,
+                                detail_images=detail_images,
+                                video_url=None
+                            )
+            except Exception as e:
+                print(f"API请求失败: {str(e)[:50]}", flush=True)
+                continue
 
         return None
 
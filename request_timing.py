@@ -0,0 +1,116 @@
+"""
+请求阶段耗时记录 - Server-Timing 响应头
+
+每个请求开始时创建一个 SpanRecorder 放进 contextvars，metrics.stage() 等埋点在记录直方图的同时
+把耗时追加到当前请求的记录器中；请求结束时生成 Server-Timing 响应头，
+浏览器开发者工具的 Network → Timing 面板即可看到各阶段耗时。
+请求参数带 timings=1（或请求头 X-Timings: 1）时，JSON 响应中额外返回 timings 对象。
+
+上下文传递：
+- asyncio.to_thread 会自动复制 contextvars
+- async_runtime.run_sync / submit 提交到常驻事件循环时用 bind_context() 带上调用方的上下文
+- 提交到线程池时用 submit_with_context()
+"""
+
+import time
+import threading
+import contextvars
+
+_current = contextvars.ContextVar('request_spans', default=None)
+
+
+class SpanRecorder:
+    """单个请求的阶段耗时记录（线程安全：推理线程、事件循环可能同时写入）"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._spans = {}        # name -> [总耗时, 次数]，保持首次出现的顺序
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration: float):
+        with self._lock:
+            span = self._spans.setdefault(name, [0.0, 0])
+            span[0] += duration
+            span[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def spans(self) -> list:
+        with self._lock:
+            return [(name, total, count) for name, (total, count) in self._spans.items()]
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing 头的值，同名阶段合并（desc 中注明次数）
+
+        并发执行的阶段（如批量抠图的多次推理）耗时会累加，可能超过 total
+        """
+        parts = []
+        for name, total, count in self.spans():
+            part = f'{name};dur={total * 1000:.1f}'
+            if count > 1:
+                part += f';desc="x{count}"'
+            parts.append(part)
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(parts)
+
+    def to_dict(self) -> dict:
+        """JSON 响应中的 timings 对象（毫秒）"""
+        return {
+            'total_ms': round(self.elapsed() * 1000, 1),
+            'stages': [
+                {'name': name, 'ms': round(total * 1000, 1), 'count': count}
+                for name, total, count in self.spans()
+            ],
+        }
+
+
+def start_request():
+    """开始记录当前请求，返回 (recorder, token)，请求结束时调用 end_request(token)"""
+    recorder = SpanRecorder()
+    return recorder, _current.set(recorder)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_recorder():
+    """当前请求的记录器，不在请求中时返回 None"""
+    return _current.get()
+
+
+def record(name: str, duration: float):
+    """把一个阶段的耗时记到当前请求上（不在请求中时忽略）"""
+    recorder = _current.get()
+    if recorder is not None:
+        recorder.add(name, duration)
+
+
+def wants_timings(args, headers) -> bool:
+    """请求是否要求在 JSON 响应中返回 timings"""
+    return args.get('timings') in ('1', 'true') or headers.get('X-Timings') in ('1', 'true')
+
+
+def bind_context(coro):
+    """
+    让协程在调用方的 contextvars 上下文中运行
+
+    run_coroutine_threadsafe 创建的任务使用事件循环线程的上下文；这里先复制调用方的上下文，
+    在任务内部逐个设置回去（只影响该任务自己的上下文副本）
+    """
+    context = contextvars.copy_context()
+
+    async def runner():
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+
+    return runner()
+
+
+def submit_with_context(executor, fn, *args, **kwargs):
+    """提交到线程池，任务在调用方的 contextvars 上下文中执行"""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, fn, *args, **kwargs)
@@ -0,0 +1,120 @@
+"""
+抖音短链接解析缓存 - v.douyin.com 短码 → 跳转后的规范链接（视频ID / 商品ID 所在的URL）
+
+之前解析短链接时跟随全部跳转并下载最终页面的 HTML，只为了读取 response.url。
+现在逐跳读取 Location 响应头（不读取响应体），跳出短链接域名就停止，不请求最终页面；
+结果按短码缓存（视频解析、商品解析共用），同一个链接再次分享时不发起网络请求。
+
+用法：
+    resolver = get_short_link_resolver()
+    real_url = resolver.lookup(url)           # 只查缓存，未命中返回 None
+    real_url = await resolver.resolve(url)    # 未命中时解析并写入缓存
+"""
+
+import re
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urljoin
+import config
+from http_transport import get_async_client
+from single_flight import get_flight
+from metrics import CACHE_REQUESTS
+
+_SHORT_LINK_PATTERN = re.compile(r'(?:https?://)?(v\.douyin\.com|vm\.tiktok\.com)/([A-Za-z0-9_-]+)')
+
+
+def short_code(url: str):
+    """短链接的短码（如 'v.douyin.com/iABCdef'），不是短链接时返回 None"""
+    match = _SHORT_LINK_PATTERN.search(url)
+    if match:
+        return f'{match.group(1)}/{match.group(2)}'
+    return None
+
+
+class ShortLinkResolver:
+    """短码 → 规范链接的 TTL 缓存（LRU 淘汰），未命中时只读取跳转响应头"""
+
+    def __init__(self, ttl: int = None, max_entries: int = None, max_redirects: int = None):
+        settings = config.SHORT_LINK_CACHE_CONFIG
+        self.ttl = ttl or settings['ttl']
+        self.max_entries = max_entries or settings['max_entries']
+        self.max_redirects = max_redirects or settings['max_redirects']
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, url: str):
+        """缓存中的规范链接，不是短链接、未缓存或已过期返回 None"""
+        code = short_code(url)
+        if code is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None or entry['expires_at'] < time.time():
+                if entry is not None:
+                    del self._entries[code]
+                CACHE_REQUESTS.inc(cache='short_link', result='miss')
+                return None
+            CACHE_REQUESTS.inc(cache='short_link', result='hit')
+            self._entries.move_to_end(code)
+            return entry['url']
+
+    def put(self, url: str, real_url: str):
+        code = short_code(url)
+        if code is None:
+            return
+        with self._lock:
+            self._entries[code] = {'url': real_url, 'expires_at': time.time() + self.ttl}
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def resolve(self, url: str, headers: dict = None) -> str:
+        """
+        短链接的规范链接（优先读缓存；同一短码的并发解析只请求一次）
+
+        Args:
+            url: 短链接（不是短链接时原样返回）
+            headers: 额外请求头（如 Cookie）
+        """
+        if short_code(url) is None:
+            return url
+        return self.lookup(url) or await self.fetch(url, headers)
+
+    async def fetch(self, url: str, headers: dict = None) -> str:
+        """不查缓存，通过网络解析短链接并写入缓存（同一短码的并发解析只请求一次）"""
+        code = short_code(url)
+        real_url = await get_flight('short_link').run(code, self._follow, f'https://{code}/', headers)
+        self.put(url, real_url)
+        return real_url
+
+    async def _follow(self, url: str, headers: dict = None) -> str:
+        """逐跳读取 Location，离开短链接域名或不再跳转时停止（不读取响应体）"""
+        client = get_async_client('douyin_mobile')
+        for _ in range(self.max_redirects):
+            async with client.stream('GET', url, headers=headers, follow_redirects=False) as response:
+                location = response.headers.get('location')
+                if not response.is_redirect or not location:
+                    return str(response.url)
+            url = urljoin(url, location)
+            if short_code(url) is None:
+                return url
+        raise Exception(f"Too many redirects: {url}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_short_link_resolver = None
+_short_link_resolver_lock = threading.Lock()
+
+
+def get_short_link_resolver() -> ShortLinkResolver:
+    """获取全局短链接解析缓存"""
+    global _short_link_resolver
+    if _short_link_resolver is None:
+        with _short_link_resolver_lock:
+            if _short_link_resolver is None:
+                _short_link_resolver = ShortLinkResolver()
+    return _short_link_resolver
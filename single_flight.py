@@ -0,0 +1,121 @@
+"""
+请求合并（single-flight）- 相同目标的并发请求只执行一次，其余请求等待同一个结果
+
+直播团队分享同一个链接时，几个运营往往在几秒内同时粘贴解析：
+不合并时每个请求都各自启动 Playwright 抓取 / 下载视频识别 / 合成语音。
+按规范化后的目标（商品ID、视频ID、图片URL、TTS 文本+音色等）合并后，
+第一个请求执行，同时到达的相同请求直接等待它的结果；执行结束后不缓存，之后的请求重新执行。
+
+- 异步：每个事件循环各自合并（Flask 的共享事件循环与 ASGI 的事件循环互不影响）；
+  发起请求的客户端断开（取消）不会中断其他请求正在等待的执行
+- 同步：线程之间合并（用于推理线程池中的抠图）
+- 异常同样共享给所有等待者；等待者拿到的是结果的深拷贝，修改不会互相影响
+
+用法：
+    flight = get_flight('parse_product')
+    data = await flight.run(flight_key(product_id), scrape_product, url)
+    mask = get_flight('inference').run_sync(mask_key, predict_mask, image, model)
+"""
+
+import copy
+import json
+import asyncio
+import hashlib
+import weakref
+import threading
+import concurrent.futures
+from metrics import COALESCED_REQUESTS
+
+
+def flight_key(*parts) -> str:
+    """由若干部分（字符串、数字、字典等）生成合并键"""
+    canonical = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def _consume_result(task: asyncio.Task):
+    """没有等待者时读取异常，避免 'exception was never retrieved' 警告"""
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """一组可合并的操作（如 'parse_video'、'tts'）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._async_flights = weakref.WeakKeyDictionary()   # 事件循环 -> {key: Task}
+        self._sync_flights = {}                             # key -> Future
+
+    async def run(self, key, fn, *args, **kwargs):
+        """
+        执行 await fn(*args, **kwargs)；相同 key 的执行正在进行时等待它的结果
+
+        Args:
+            key: 合并键，None 表示不合并
+        """
+        if key is None:
+            return await fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flights = self._async_flights.setdefault(loop, {})
+        task = flights.get(key)
+        if task is None:
+            task = loop.create_task(fn(*args, **kwargs))
+            flights[key] = task
+
+            def done(finished, key=key):
+                if flights.get(key) is finished:
+                    del flights[key]
+                _consume_result(finished)
+
+            task.add_done_callback(done)
+            # shield：发起者被取消时，执行继续进行（其他请求可能在等待）
+            return await asyncio.shield(task)
+
+        COALESCED_REQUESTS.inc(group=self.name)
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def run_sync(self, key, fn, *args, **kwargs):
+        """同步版本：在当前线程执行 fn(*args, **kwargs)，相同 key 的其他线程等待结果"""
+        if key is None:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            future = self._sync_flights.get(key)
+            leader = future is None
+            if leader:
+                future = concurrent.futures.Future()
+                self._sync_flights[key] = future
+
+        if not leader:
+            COALESCED_REQUESTS.inc(group=self.name)
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._sync_flights[key]
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """获取指定分组的合并器"""
+    with _flights_lock:
+        flight = _flights.get(name)
+        if flight is None:
+            flight = SingleFlight(name)
+            _flights[name] = flight
+        return flight
@@ -0,0 +1,143 @@
+"""
+子系统延迟加载
+
+rembg/onnxruntime、OpenCV、numpy、Whisper/torch、文案模板（templates.docx）等导入或初始化很慢，
+而很多 worker 只处理 TTS、视频解析之类的请求。这里把它们注册为子系统：
+- 首次使用时才加载（线程安全，只加载一次）
+- 可以在后台预热线程中提前加载（config.SUBSYSTEM_CONFIG['warmup']，或环境变量 WARMUP_SUBSYSTEMS）
+- startup_report() 给出进程启动耗时和各子系统的加载状态/耗时（/startup_stats）
+
+用法：
+    subsystems.register('cv2', _load_cv2, 'OpenCV 形态学后处理')
+    cv2 = subsystems.get('cv2')
+
+对比导入耗时：
+    python -X importtime -c "import web_app" 2> importtime.log
+"""
+
+import os
+import time
+import threading
+
+# 进程启动时间（本模块通常在启动早期被导入）
+_process_start = time.perf_counter()
+
+_registry = {}
+_registry_lock = threading.Lock()
+_app_ready = None
+
+
+class Subsystem:
+    """一个可延迟加载的子系统"""
+
+    def __init__(self, name: str, loader, description: str = ''):
+        self.name = name
+        self.loader = loader
+        self.description = description
+        self.value = None
+        self.loaded = False
+        self.load_time = None     # 加载耗时（秒）
+        self.loaded_by = None     # 'request' 或 'warmup'
+        self.error = None
+        self._lock = threading.Lock()
+
+    def get(self, loaded_by: str = 'request'):
+        if self.loaded:
+            return self.value
+        with self._lock:
+            if not self.loaded:
+                start = time.perf_counter()
+                try:
+                    self.value = self.loader()
+                except Exception as e:
+                    self.error = str(e)
+                    raise
+                self.load_time = time.perf_counter() - start
+                self.loaded_by = loaded_by
+                self.error = None
+                self.loaded = True
+                print(f"子系统已加载: {self.name} ({self.load_time:.2f}s, {loaded_by})", flush=True)
+        return self.value
+
+    def status(self) -> dict:
+        return {
+            'name': self.name,
+            'description': self.description,
+            'loaded': self.loaded,
+            'load_time': round(self.load_time, 3) if self.load_time is not None else None,
+            'loaded_by': self.loaded_by,
+            'error': self.error,
+        }
+
+
+def register(name: str, loader, description: str = '') -> Subsystem:
+    """注册子系统（重复注册时保留已有的，避免模块重复导入时丢失加载状态）"""
+    with _registry_lock:
+        subsystem = _registry.get(name)
+        if subsystem is None:
+            subsystem = Subsystem(name, loader, description)
+            _registry[name] = subsystem
+        return subsystem
+
+
+def get(name: str):
+    """获取子系统（首次调用时加载）"""
+    return _registry[name].get()
+
+
+def is_loaded(name: str) -> bool:
+    subsystem = _registry.get(name)
+    return subsystem is not None and subsystem.loaded
+
+
+def warmup_names(default=None) -> list:
+    """需要预热的子系统：环境变量 WARMUP_SUBSYSTEMS（逗号分隔，'none' 表示不预热）优先"""
+    value = os.getenv('WARMUP_SUBSYSTEMS')
+    if value is None:
+        return list(default or [])
+    if value.strip().lower() in ('', 'none'):
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def _warmup(names):
+    start = time.perf_counter()
+    for name in names:
+        subsystem = _registry.get(name)
+        if subsystem is None:
+            print(f"警告: 未知子系统 {name}，跳过预热", flush=True)
+            continue
+        try:
+            subsystem.get(loaded_by='warmup')
+        except Exception as e:
+            print(f"警告: 子系统 {name} 预热失败: {e}", flush=True)
+    print(f"子系统预热完成: {', '.join(names)} ({time.perf_counter() - start:.2f}s)", flush=True)
+
+
+def start_warmup(names) -> threading.Thread:
+    """在后台线程中按顺序预热子系统，不阻塞 worker 接收请求"""
+    if not names:
+        return None
+    thread = threading.Thread(target=_warmup, args=(list(names),), name='subsystem-warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def mark_ready():
+    """记录应用完成初始化（可以开始接收请求）的时间"""
+    global _app_ready
+    _app_ready = time.perf_counter() - _process_start
+    loaded = [name for name, subsystem in _registry.items() if subsystem.loaded]
+    print(f"应用初始化完成: {_app_ready:.2f}s（已加载子系统: {', '.join(loaded) or '无'}）", flush=True)
+
+
+def startup_report() -> dict:
+    """启动耗时与各子系统加载状态"""
+    with _registry_lock:
+        subsystems = list(_registry.values())
+    return {
+        'pid': os.getpid(),
+        'ready_time': round(_app_ready, 3) if _app_ready is not None else None,
+        'uptime': round(time.perf_counter() - _process_start, 1),
+        'subsystems': [subsystem.status() for subsystem in subsystems],
+    }
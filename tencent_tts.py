@@ -7,10 +7,17 @@ import os
 import json
 import uuid
 import base64
+import asyncio
+import threading
+import urllib.parse
 from tencentcloud.common import credential
 from tencentcloud.common.profile.client_profile import ClientProfile
 from tencentcloud.common.profile.http_profile import HttpProfile
 from tencentcloud.tts.v20190823 import tts_client, models
+import config
+from metrics import stage, UPSTREAM_ERRORS
+from job_store import get_job_store
+from circuit_breaker import get_breaker
 
 
 # 腾讯云配置（已内置，无需配置）
@@ -70,13 +77,33 @@ class TencentTTS:
         if not self.secret_id or not self.secret_key:
             print("警告: 腾讯云TTS配置未设置")
 
+    # SDK 客户端内部维护 HTTP 连接池，按密钥缓存复用，保持与腾讯云的连接
+    _clients = {}
+    _clients_lock = threading.Lock()
+
     def _get_client(self):
+        """获取（或创建）腾讯云客户端"""
+        client = self._clients.get(self.secret_id)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(self.secret_id)
+                if client is None:
+                    client = self._create_client()
+                    self._clients[self.secret_id] = client
+        return client
+
+    def _create_client(self):
         """创建腾讯云客户端"""
         cred = credential.Credential(self.secret_id, self.secret_key)
 
         # HTTP配置
         httpProfile = HttpProfile()
         httpProfile.endpoint = "tts.tencentcloudapi.com"
+        if config.UPSTREAM_OVERRIDE:
+            # 压测：发到本地替身服务
+            override = urllib.parse.urlsplit(config.UPSTREAM_OVERRIDE)
+            httpProfile.protocol = override.scheme
+            httpProfile.endpoint = override.netloc
 
         # 客户端配置
         clientProfile = ClientProfile()
@@ -140,7 +167,8 @@ class TencentTTS:
             req.from_json_string(json.dumps(params))
 
             # 发送请求
-            resp = client.TextToVoice(req)
+            with get_breaker('tencent_tts').guard(), stage('tts_segment'):
+                resp = client.TextToVoice(req)
 
             # 获取音频数据（base64编码）
             audio_base64 = resp.Audio
@@ -150,6 +178,7 @@ class TencentTTS:
             return audio_data
 
         except Exception as e:
+            UPSTREAM_ERRORS.inc(service='tencent_tts')
             raise Exception(f"腾讯云TTS合成失败: {str(e)}")
 
 
@@ -179,9 +208,10 @@ async def text_to_speech_tencent(
 
     tts = TencentTTS()
 
-    # 如果文本不超过150字符，直接合成
+    # 如果文本不超过150字符，直接合成（SDK为同步调用，放到线程中执行，避免阻塞事件循环）
     if len(text) <= 150:
-        return tts.synthesize(
+        return await asyncio.to_thread(
+            tts.synthesize,
             text=text,
             voice=voice,
             speed=speed,
@@ -198,12 +228,20 @@ async def text_to_speech_tencent(
     segments = splitter.split(text)
     print(f"分成 {len(segments)} 段")
 
-    # 逐段合成
+    # 逐段合成，每段结果记录到任务记录中（worker 中断后重新提交时跳过已合成的分段）
+    params = {'text': text, 'voice': voice, 'speed': speed, 'volume': volume, 'emotion': emotion}
+    job = await asyncio.to_thread(get_job_store().open, 'tencent_tts', params, len(segments))
     audio_data_list = []
     for i, segment in enumerate(segments, 1):
+        audio_data = await asyncio.to_thread(job.load_blob, i - 1)
+        if audio_data is not None:
+            audio_data_list.append(audio_data)
+            continue
+
         print(f"正在合成第 {i}/{len(segments)} 段（{len(segment)} 字符）...")
         try:
-            audio_data = tts.synthesize(
+            audio_data = await asyncio.to_thread(
+                tts.synthesize,
                 text=segment,
                 voice=voice,
                 speed=speed,
@@ -212,14 +250,17 @@ async def text_to_speech_tencent(
                 codec='mp3'
             )
             audio_data_list.append(audio_data)
+            await asyncio.to_thread(job.save_blob, i - 1, audio_data)
 
         except Exception as e:
             print(f"第 {i} 段合成失败: {e}")
+            await asyncio.to_thread(job.fail, str(e))
             raise
 
     # 简单拼接MP3文件（直接拼接字节流）
     print("正在合并音频...")
     final_audio = b''.join(audio_data_list)
+    await asyncio.to_thread(job.finish, {'size': len(final_audio)})
 
     print(f"✅ 长文本合成完成，总大小: {len(final_audio)} 字节")
     return final_audio
@@ -227,8 +268,6 @@ async def text_to_speech_tencent(
 
 if __name__ == '__main__':
     # 测试代码
-    import asyncio
-
     async def test():
         tts = TencentTTS()
 
@@ -0,0 +1,38 @@
+"""准入控制：队列已满返回 429 + Retry-After，超过队列总容量返回 413（重试也不会成功）"""
+
+import pytest
+from admission import AdmissionGate, Overloaded
+
+
+def make_gate():
+    return AdmissionGate('test', concurrency=1, queue_size=60, initial_seconds=2.0)
+
+
+def test_oversize_request_rejected_without_retry_after():
+    gate = make_gate()
+    with pytest.raises(Overloaded) as info:
+        gate.try_acquire(gate.capacity + 1)
+    assert info.value.status_code == 413
+    assert info.value.retry_after is None
+    assert info.value.to_dict()['retry_after'] is None
+    assert gate.inflight == 0
+
+
+def test_full_queue_rejected_with_retry_after():
+    gate = make_gate()
+    gate.try_acquire(gate.capacity)
+    with pytest.raises(Overloaded) as info:
+        gate.try_acquire(1)
+    assert info.value.status_code == 429
+    assert info.value.retry_after >= 1
+
+    gate.release(gate.capacity)
+    with gate.admit(1):
+        assert gate.inflight == 1
+    assert gate.inflight == 0
+
+
+def test_request_at_capacity_admitted():
+    gate = make_gate()
+    with gate.admit(gate.capacity):
+        assert gate.status()['available'] == 0
@@ -0,0 +1,43 @@
+"""视频代理缓存键与解析缓存失效（浏览器传入的视频ID与播放地址中的 video_id 不同）"""
+
+from video_cache import cache_key
+from video_info_cache import VideoInfoCache
+
+AWEME_ID = '7312345678901234567'
+PLAY_URL = 'https://aweme.snssdk.com/aweme/v1/play/?video_id=v0200fg10000abcdef&ratio=720p&line=0'
+
+
+def test_cache_key_uses_play_url_video_id():
+    assert cache_key(PLAY_URL) == 'v0200fg10000abcdef'
+    assert cache_key(PLAY_URL.replace('line=0', 'line=1')) == 'v0200fg10000abcdef'
+
+
+def test_cache_key_other_hosts_ignore_query():
+    url = 'https://example.com/v/clip.mp4?video_id=v0200fg10000abcdef&sig=1'
+    assert cache_key(url) != 'v0200fg10000abcdef'
+    assert cache_key(url) == cache_key('https://example.com/v/clip.mp4?sig=2')
+
+
+def test_invalidate_url_by_aweme_id():
+    cache = VideoInfoCache(db_path='')
+    cache.put(AWEME_ID, {'video_id': AWEME_ID, 'video_url': PLAY_URL})
+
+    assert not cache.invalidate_url(AWEME_ID, PLAY_URL.replace('line=0', 'line=1'))
+    assert cache._load(AWEME_ID) is not None
+
+    assert cache.invalidate_url(AWEME_ID, PLAY_URL)
+    assert cache._load(AWEME_ID) is None
+
+
+def test_invalidate_url_unknown_video():
+    cache = VideoInfoCache(db_path='')
+    assert not cache.invalidate_url(AWEME_ID, PLAY_URL)
+
+
+def test_invalidate_url_persisted(tmp_path):
+    db_path = str(tmp_path / 'video_info.db')
+    VideoInfoCache(db_path=db_path).put(AWEME_ID, {'video_id': AWEME_ID, 'video_url': PLAY_URL})
+
+    cache = VideoInfoCache(db_path=db_path)
+    assert cache.invalidate_url(AWEME_ID, PLAY_URL)
+    assert VideoInfoCache(db_path=db_path)._load(AWEME_ID) is None
@@ -0,0 +1,184 @@
+"""
+视频代理缓存 - /download_video 最近代理过的视频保存在本地磁盘
+
+- 按视频ID缓存（抖音播放地址中的 video_id 参数；其他地址使用去掉签名参数的 URL 摘要），
+  同一个视频的预览、拖动进度条、下载都从本地文件返回（send_file → sendfile，支持 Range）
+- 未缓存时：不带 Range 或从头请求（bytes=0-）的完整下载一边转发一边写入缓存；
+  其他 Range 请求直接透传给 CDN，不等待完整下载
+- 写入先落到临时文件，完整下载后再原子改名，不会读到半个文件
+- 总大小超过上限时按最近访问时间淘汰
+"""
+
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from urllib.parse import urlsplit, parse_qs
+import config
+from metrics import CACHE_REQUESTS
+
+_KEY_PATTERN = re.compile(r'^[0-9A-Za-z_\-]{1,80}$')
+_TEMP_SUFFIX = '.part'
+# 播放地址中的 video_id 参数可信的主机（其他主机的地址按主机+路径摘要缓存）
+_DOUYIN_HOSTS = ('douyin.com', 'iesdouyin.com', 'snssdk.com', 'amemv.com')
+
+
+def cache_key(video_url: str) -> str:
+    """
+    视频缓存键，只由播放地址本身决定：抖音播放地址中的 video_id 参数，其他地址使用主机+路径的摘要
+
+    不接受调用方传入的ID，否则任何人都可以把任意地址的内容写到热门视频的缓存键下
+    """
+    parts = urlsplit(video_url)
+    host = (parts.hostname or '').lower()
+    query_id = (parse_qs(parts.query).get('video_id') or [''])[0]
+    if _KEY_PATTERN.match(query_id) and any(host == d or host.endswith('.' + d) for d in _DOUYIN_HOSTS):
+        return query_id
+    # 签名、过期时间等参数每次都变，只用主机和路径
+    return hashlib.sha1(f'{parts.netloc}{parts.path}'.encode('utf-8')).hexdigest()
+
+
+def is_full_request(range_header) -> bool:
+    """没有 Range 或从头开始的 Range（浏览器播放器的首个请求）视为完整下载，可以写入缓存"""
+    return not range_header or range_header.replace(' ', '') == 'bytes=0-'
+
+
+def expected_length(upstream_headers):
+    """上游响应体的字节数（有内容编码时 Content-Length 与解码后的大小不一致，返回 None）"""
+    length = upstream_headers.get('Content-Length', '')
+    if upstream_headers.get('Content-Encoding') or not length.isdigit():
+        return None
+    return int(length)
+
+
+def proxy_headers(upstream_headers, inline: bool = False, filename: str = 'douyin_video.mp4') -> dict:
+    """转发给浏览器的响应头（透传长度和 Range 信息）"""
+    headers = {
+        'Content-Disposition': 'inline' if inline else f'attachment; filename="{filename}"',
+        'Accept-Ranges': 'bytes',
+    }
+    length = expected_length(upstream_headers)
+    if length is not None:
+        headers['Content-Length'] = str(length)
+    if upstream_headers.get('Content-Range'):
+        headers['Content-Range'] = upstream_headers['Content-Range']
+    return headers
+
+
+class CacheWriter:
+    """边转发边写入缓存的临时文件，commit() 后才对读取可见"""
+
+    def __init__(self, cache, key: str):
+        self.cache = cache
+        self.key = key
+        self.temp_path = os.path.join(cache.root, f'{key}.{uuid.uuid4().hex[:8]}{_TEMP_SUFFIX}')
+        self._file = open(self.temp_path, 'wb')
+        self.size = 0
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self, expected_size: int = None):
+        """完整下载后改名为正式缓存文件；大小与 Content-Length 不符时丢弃"""
+        self._file.close()
+        if expected_size is not None and expected_size != self.size:
+            print(f"视频缓存写入不完整，丢弃: {self.key} ({self.size}/{expected_size})", flush=True)
+            self.abort()
+            return
+        os.replace(self.temp_path, self.cache.path_for(self.key))
+        self.cache.evict()
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+class VideoCache:
+    """磁盘视频缓存（按访问时间 LRU 淘汰）"""
+
+    def __init__(self, root: str, max_total_bytes: int, ttl: float):
+        self.root = root
+        self.max_total_bytes = max_total_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.root, f'{key}.mp4')
+
+    def get(self, key: str):
+        """返回缓存文件路径（刷新访问时间），未缓存或已过期返回 None"""
+        path = self.path_for(key)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            CACHE_REQUESTS.inc(cache='video', result='miss')
+            return None
+        if mtime + self.ttl < time.time():
+            CACHE_REQUESTS.inc(cache='video', result='miss')
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # 刚好被淘汰删除
+            CACHE_REQUESTS.inc(cache='video', result='miss')
+            return None
+        CACHE_REQUESTS.inc(cache='video', result='hit')
+        return path
+
+    def writer(self, key: str) -> CacheWriter:
+        return CacheWriter(self, key)
+
+    def evict(self):
+        """删除过期文件、遗留的临时文件，总大小超限时从最久未访问的开始删除"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # 临时文件超过一小时还没完成，视为中断遗留
+                expired = stat.st_mtime + (3600 if name.endswith(_TEMP_SUFFIX) else self.ttl) < now
+                if expired:
+                    _remove_file(path)
+                elif not name.endswith(_TEMP_SUFFIX):
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_total_bytes:
+                    break
+                _remove_file(path)
+                total -= size
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+_video_cache = None
+_video_cache_lock = threading.Lock()
+
+
+def get_video_cache() -> VideoCache:
+    """获取全局视频缓存实例"""
+    global _video_cache
+    if _video_cache is None:
+        with _video_cache_lock:
+            if _video_cache is None:
+                settings = config.VIDEO_CACHE_CONFIG
+                _video_cache = VideoCache(settings['root'], settings['max_total_mb'] * 1024 * 1024,
+                                          settings['ttl'])
+    return _video_cache
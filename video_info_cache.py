@@ -0,0 +1,220 @@
+"""
+视频信息缓存 - 按视频ID缓存解析结果（stale-while-revalidate），可选持久化到 SQLite
+
+同一个视频再次解析（重新识别文案、重新下载）时，不再重复多种策略的抓取：
+- 新鲜（播放链接距离过期还早）：直接返回缓存
+- 临近过期（refresh_margin 内）：先返回缓存，同时在后台重新解析刷新播放链接
+- 播放链接已过期：重新解析后返回；解析失败时仍返回缓存（标题、作者等元数据长期有效）
+- 元数据超过 ttl：视为未缓存
+
+播放链接的过期时间从链接参数（x-expires 等）读取，没有时按 play_url_ttl 估算。
+配置了 db_path 时写入 SQLite，进程重启、多个 worker 之间共享；内存中另有一份 LRU 缓存。
+
+用法：
+    data = await get_video_info_cache().get(video_id, fetch)   # fetch: 返回视频信息字典的协程函数
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+import config
+from job_broker import connect
+from single_flight import get_flight
+from metrics import CACHE_REQUESTS
+
+_EXPIRES_PATTERN = re.compile(r'[?&](?:x-expires|expires|expire|deadline)=(\d{10})\b')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS video_info_cache (
+    video_id TEXT PRIMARY KEY,
+    info TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    play_expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_video_info_cache_fetched ON video_info_cache (fetched_at);
+"""
+
+
+def play_url_expires_at(video_url: str, fetched_at: float) -> float:
+    """播放链接的过期时间（链接中带过期时间参数时以参数为准）"""
+    match = _EXPIRES_PATTERN.search(video_url or '')
+    if match:
+        return float(match.group(1))
+    return fetched_at + config.VIDEO_INFO_CACHE_CONFIG['play_url_ttl']
+
+
+class VideoInfoCache:
+    """视频ID → 视频信息字典（线程安全；后台刷新在调用方的事件循环中执行）"""
+
+    def __init__(self, ttl: int = None, refresh_margin: int = None, max_entries: int = None, db_path: str = None):
+        settings = config.VIDEO_INFO_CACHE_CONFIG
+        self.ttl = ttl or settings['ttl']
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings['refresh_margin']
+        self.max_entries = max_entries or settings['max_entries']
+        self.db_path = db_path if db_path is not None else settings['db_path']
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._background = set()    # 后台刷新任务（保持引用，避免被回收）
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if self.db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._connect().executescript(_SCHEMA)
+            self.purge()
+
+    def _connect(self):
+        """每个线程一个连接（fork 后重新连接）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = connect(self.db_path)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _load(self, video_id: str, memory: bool = True):
+        """内存中的条目，没有时（或 memory=False）从数据库读取"""
+        with self._lock:
+            entry = self._entries.get(video_id) if memory else None
+            if entry is not None:
+                self._entries.move_to_end(video_id)
+                return entry
+        if not self.db_path:
+            return None
+        row = self._connect().execute(
+            'SELECT info, fetched_at, play_expires_at FROM video_info_cache WHERE video_id = ?',
+            (video_id,)).fetchone()
+        if row is None:
+            return None
+        entry = {'info': json.loads(row['info']), 'fetched_at': row['fetched_at'],
+                 'play_expires_at': row['play_expires_at']}
+        self._remember(video_id, entry)
+        return entry
+
+    def _remember(self, video_id: str, entry: dict):
+        with self._lock:
+            self._entries[video_id] = entry
+            self._entries.move_to_end(video_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, video_id: str, info: dict):
+        """写入（刷新）一个视频的信息"""
+        now = time.time()
+        entry = {'info': info, 'fetched_at': now, 'play_expires_at': play_url_expires_at(info.get('video_url'), now)}
+        self._remember(video_id, entry)
+        if self.db_path:
+            self._connect().execute(
+                'INSERT OR REPLACE INTO video_info_cache (video_id, info, fetched_at, play_expires_at) '
+                'VALUES (?, ?, ?, ?)',
+                (video_id, json.dumps(info, ensure_ascii=False), now, entry['play_expires_at']))
+
+    def invalidate(self, video_id: str):
+        """删除缓存（如播放链接已失效）"""
+        with self._lock:
+            self._entries.pop(video_id, None)
+        if self.db_path:
+            self._connect().execute('DELETE FROM video_info_cache WHERE video_id = ?', (video_id,))
+
+    def invalidate_url(self, video_id: str, video_url: str) -> bool:
+        """缓存的播放链接就是 video_url 时删除该视频的缓存（返回是否删除）"""
+        entry = self._load(video_id)
+        if entry is None or entry['info'].get('video_url') != video_url:
+            return False
+        self.invalidate(video_id)
+        return True
+
+    async def _fetch(self, video_id: str, fetch):
+        """重新解析并写入缓存（同一视频的并发解析只执行一次）"""
+        async def run():
+            info = await fetch()
+            self.put(video_id, info)
+            return info
+        return await get_flight('video_info').run(video_id, run)
+
+    def _refresh_in_background(self, video_id: str, fetch):
+        with self._lock:
+            if video_id in self._refreshing:
+                return
+            self._refreshing.add(video_id)
+
+        async def refresh():
+            try:
+                await self._fetch(video_id, fetch)
+                print(f"视频信息已在后台刷新: {video_id}", flush=True)
+            except Exception as e:
+                print(f"后台刷新视频信息失败 {video_id}: {e}", flush=True)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(video_id)
+
+        task = asyncio.get_running_loop().create_task(refresh())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _is_fresh(self, entry: dict, now: float) -> bool:
+        return now < entry['play_expires_at'] - self.refresh_margin
+
+    async def get(self, video_id: str, fetch) -> dict:
+        """
+        视频信息字典（按新鲜程度直接返回、返回后后台刷新或重新解析）
+
+        Args:
+            video_id: 视频ID
+            fetch: 无参数的协程函数，重新解析并返回视频信息字典
+        """
+        now = time.time()
+        entry = self._load(video_id)
+        if entry is not None and self.db_path and not self._is_fresh(entry, now):
+            # 其他 worker 可能已经刷新过
+            entry = self._load(video_id, memory=False) or entry
+        if entry is not None and entry['fetched_at'] < now - self.ttl:
+            entry = None
+
+        if entry is None:
+            CACHE_REQUESTS.inc(cache='video_info', result='miss')
+            return await self._fetch(video_id, fetch)
+
+        if self._is_fresh(entry, now):
+            CACHE_REQUESTS.inc(cache='video_info', result='hit')
+            return entry['info']
+
+        if now < entry['play_expires_at']:
+            CACHE_REQUESTS.inc(cache='video_info', result='stale')
+            self._refresh_in_background(video_id, fetch)
+            return entry['info']
+
+        # 播放链接已过期：重新解析，失败时返回缓存的元数据
+        CACHE_REQUESTS.inc(cache='video_info', result='expired')
+        try:
+            return await self._fetch(video_id, fetch)
+        except Exception as e:
+            print(f"重新解析视频失败，返回缓存的视频信息 {video_id}: {e}", flush=True)
+            return entry['info']
+
+    def purge(self) -> int:
+        """删除数据库中超过 ttl 的记录"""
+        cursor = self._connect().execute('DELETE FROM video_info_cache WHERE fetched_at < ?',
+                                         (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_video_info_cache = None
+_video_info_cache_lock = threading.Lock()
+
+
+def get_video_info_cache() -> VideoInfoCache:
+    """获取全局视频信息缓存"""
+    global _video_info_cache
+    if _video_info_cache is None:
+        with _video_info_cache_lock:
+            if _video_info_cache is None:
+                _video_info_cache = VideoInfoCache()
+    return _video_info_cache
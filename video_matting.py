@@ -0,0 +1,304 @@
+"""
+视频抠图模块 - 基于关键帧复用的视频背景去除
+Video Background Removal - keyframe segmentation with temporal mask reuse
+
+思路：
+1. 使用 ffmpeg 把视频解码成原始 RGB 帧流
+2. 只对"关键帧"运行 rembg 推理；与上一关键帧差异很小的帧直接复用
+   （或用光流对齐）上一关键帧的 mask，不再推理
+3. 输出带 alpha 通道的 WebM，或 PNG 序列（zip 打包）
+
+30 秒 30fps 的视频逐帧推理需要约 900 次 u2net，复用后通常只需几十次，
+CPU 上也能在可接受的时间内完成。
+"""
+
+import json
+import math
+import zipfile
+import subprocess
+import numpy as np
+import cv2
+from PIL import Image
+import config
+import subsystems
+from image_processor import get_session
+
+
+class VideoMatting:
+    """视频抠图器"""
+
+    def __init__(self, model_name: str = None, diff_threshold: float = None,
+                 max_reuse_frames: int = None, warp_mask: bool = None):
+        settings = config.VIDEO_MATTING_CONFIG
+        self.model_name = model_name or config.REMBG_CONFIG['model']
+        self.diff_threshold = settings['diff_threshold'] if diff_threshold is None else diff_threshold
+        self.max_reuse_frames = settings['max_reuse_frames'] if max_reuse_frames is None else max_reuse_frames
+        self.warp_mask = settings['warp_mask'] if warp_mask is None else warp_mask
+        self.analysis_width = settings['analysis_width']
+        self.max_side = settings['max_side']
+        self.max_duration = settings['max_duration']
+
+    def probe(self, video_path: str) -> dict:
+        """
+        使用 ffprobe 读取视频宽高、帧率和时长
+
+        宽高为显示方向的尺寸：手机竖拍的视频通常按横向编码并带旋转信息，
+        ffmpeg 解码时会自动旋转，旋转 90/270 度时交换编码宽高
+        """
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,r_frame_rate:stream_tags=rotate:stream_side_data=rotation'
+                             ':format=duration',
+            '-of', 'json',
+            video_path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"ffprobe读取视频失败: {result.stderr}")
+
+        info = json.loads(result.stdout)
+        streams = info.get('streams', [])
+        if not streams:
+            raise ValueError("视频中没有画面")
+
+        stream = streams[0]
+        num, _, den = stream.get('r_frame_rate', '30/1').partition('/')
+        fps = float(num) / float(den or 1) if float(den or 1) else 30.0
+
+        width, height = int(stream['width']), int(stream['height'])
+        if _rotation(stream) % 180 == 90:
+            width, height = height, width
+
+        return {
+            'width': width,
+            'height': height,
+            'fps': fps or 30.0,
+            'duration': float(info.get('format', {}).get('duration', 0) or 0),
+        }
+
+    def check_duration(self, info: dict):
+        """视频超过最长时长时抛出 ValueError（拒绝处理，而不是只处理前 max_duration 秒）"""
+        if info['duration'] > self.max_duration:
+            raise ValueError(f"视频时长 {info['duration']:.1f} 秒，超过上限 {self.max_duration} 秒，请剪辑后再处理")
+
+    def estimate_keyframes(self, info: dict) -> int:
+        """估算需要推理的关键帧数（按连续复用上限计算，画面变化大时实际更多、静止画面更少），用于推理队列准入"""
+        duration = min(info['duration'] or self.max_duration, self.max_duration)
+        return max(1, math.ceil(duration * info['fps'] / (self.max_reuse_frames + 1)))
+
+    def _output_size(self, width: int, height: int) -> tuple:
+        """计算输出尺寸（最长边不超过 max_side，且为偶数以兼容编码器）"""
+        scale = min(1.0, self.max_side / max(width, height))
+        out_w = int(width * scale) // 2 * 2
+        out_h = int(height * scale) // 2 * 2
+        return out_w, out_h
+
+    def iter_frames(self, video_path: str, width: int, height: int):
+        """
+        逐帧解码视频（自动按旋转信息转正），产出 (height, width, 3) 的 RGB 数组
+
+        时长已由 check_duration 检查，-t 只兜底容器中没有时长信息的视频
+        """
+        cmd = [
+            'ffmpeg', '-v', 'error', '-i', video_path,
+            '-t', str(self.max_duration),
+            '-vf', f'scale={width}:{height}',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-'
+        ]
+        frame_size = width * height * 3
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   bufsize=frame_size)
+        try:
+            while True:
+                data = process.stdout.read(frame_size)
+                if len(data) < frame_size:
+                    break
+                yield np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+        finally:
+            process.stdout.close()
+            process.wait()
+
+    def _analysis_gray(self, frame: np.ndarray) -> np.ndarray:
+        """生成用于帧差和光流计算的小尺寸灰度图"""
+        height, width = frame.shape[:2]
+        small_h = max(1, int(height * self.analysis_width / width))
+        small = cv2.resize(frame, (self.analysis_width, small_h), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+    def _segment(self, frame: np.ndarray) -> np.ndarray:
+        """对关键帧运行抠图推理，返回 uint8 mask（rembg 首次推理时才导入，Web 进程只探测视频时不加载）"""
+        mask = subsystems.get('rembg').remove(
+            Image.fromarray(frame),
+            session=get_session(self.model_name),
+            only_mask=True,
+            post_process_mask=config.REMBG_CONFIG.get('post_process_mask', False),
+        )
+        return np.array(mask)
+
+    def _warp(self, key_mask: np.ndarray, key_gray: np.ndarray, cur_gray: np.ndarray) -> np.ndarray:
+        """用稠密光流把关键帧 mask 对齐到当前帧"""
+        # 计算 当前帧 -> 关键帧 的光流，得到当前帧每个像素在关键帧中的位置
+        flow = cv2.calcOpticalFlowFarneback(cur_gray, key_gray, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+
+        height, width = key_mask.shape[:2]
+        scale_x = width / cur_gray.shape[1]
+        scale_y = height / cur_gray.shape[0]
+        flow = cv2.resize(flow, (width, height), interpolation=cv2.INTER_LINEAR)
+
+        grid_x, grid_y = np.meshgrid(np.arange(width, dtype=np.float32),
+                                     np.arange(height, dtype=np.float32))
+        map_x = grid_x + flow[:, :, 0] * scale_x
+        map_y = grid_y + flow[:, :, 1] * scale_y
+        return cv2.remap(key_mask, map_x, map_y, interpolation=cv2.INTER_LINEAR,
+                         borderMode=cv2.BORDER_REPLICATE)
+
+    def iter_rgba(self, video_path: str, width: int, height: int):
+        """
+        逐帧产出抠图后的 RGBA 数组
+
+        Yields:
+            (rgba_frame, is_keyframe)
+        """
+        key_mask = None
+        key_gray = None
+        reused = 0
+
+        for frame in self.iter_frames(video_path, width, height):
+            cur_gray = self._analysis_gray(frame)
+
+            is_keyframe = (
+                key_mask is None
+                or reused >= self.max_reuse_frames
+                or float(np.mean(cv2.absdiff(cur_gray, key_gray))) / 255.0 >= self.diff_threshold
+            )
+
+            if is_keyframe:
+                mask = self._segment(frame)
+                key_mask, key_gray = mask, cur_gray
+                reused = 0
+            else:
+                mask = self._warp(key_mask, key_gray, cur_gray) if self.warp_mask else key_mask
+                reused += 1
+
+            yield np.dstack([frame, mask]), is_keyframe
+
+    def process(self, video_path: str, output_path: str, output_format: str = None) -> dict:
+        """
+        视频抠图
+
+        Args:
+            video_path: 输入视频路径
+            output_path: 输出文件路径（.webm 或 .zip）
+            output_format: 'webm' 或 'png'，默认读取配置
+
+        Returns:
+            处理统计信息
+        """
+        output_format = output_format or config.VIDEO_MATTING_CONFIG['output_format']
+        if output_format not in ('webm', 'png'):
+            raise ValueError(f"不支持的输出格式: {output_format}")
+
+        info = self.probe(video_path)
+        self.check_duration(info)
+        width, height = self._output_size(info['width'], info['height'])
+        print(f"视频抠图: {info['width']}x{info['height']} -> {width}x{height}, "
+              f"{info['fps']:.2f}fps, 时长 {info['duration']:.1f}秒", flush=True)
+
+        if output_format == 'webm':
+            stats = self._write_webm(video_path, output_path, width, height, info['fps'])
+        else:
+            stats = self._write_png_sequence(video_path, output_path, width, height)
+
+        stats.update({'width': width, 'height': height, 'fps': info['fps'], 'format': output_format})
+        print(f"视频抠图完成: 共 {stats['frames']} 帧，推理 {stats['keyframes']} 帧，"
+              f"复用 {stats['frames'] - stats['keyframes']} 帧", flush=True)
+        return stats
+
+    def _write_webm(self, video_path: str, output_path: str, width: int, height: int, fps: float) -> dict:
+        """编码为带 alpha 通道的 VP9 WebM（保留原音轨）"""
+        cmd = [
+            'ffmpeg', '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}', '-r', f'{fps:.3f}', '-i', '-',
+            '-i', video_path,
+            '-map', '0:v', '-map', '1:a?',
+            '-t', str(self.max_duration),
+            '-c:v', 'libvpx-vp9', '-pix_fmt', 'yuva420p', '-auto-alt-ref', '0',
+            '-b:v', '0', '-crf', '32', '-row-mt', '1',
+            '-c:a', 'libopus',
+            '-shortest',
+            output_path
+        ]
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+        frames = keyframes = 0
+        broken = False
+        try:
+            for rgba, is_keyframe in self.iter_rgba(video_path, width, height):
+                try:
+                    process.stdin.write(rgba.tobytes())
+                except BrokenPipeError:
+                    # 编码器已退出，错误原因在 stderr 中
+                    broken = True
+                    break
+                frames += 1
+                keyframes += int(is_keyframe)
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                broken = True
+            stderr = process.stderr.read().decode('utf-8', errors='ignore')
+            process.wait()
+
+        if process.returncode != 0 or broken:
+            raise Exception(f"ffmpeg编码WebM失败 (exitcode={process.returncode}): {stderr.strip()}")
+
+        return {'frames': frames, 'keyframes': keyframes}
+
+    def _write_png_sequence(self, video_path: str, output_path: str, width: int, height: int) -> dict:
+        """导出 PNG 序列并打包为 zip（PNG 已压缩，使用 ZIP_STORED）"""
+        frames = keyframes = 0
+        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_STORED) as zf:
+            for rgba, is_keyframe in self.iter_rgba(video_path, width, height):
+                frames += 1
+                keyframes += int(is_keyframe)
+                ok, encoded = cv2.imencode('.png', cv2.cvtColor(rgba, cv2.COLOR_RGBA2BGRA),
+                                           [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                if not ok:
+                    raise Exception(f"第 {frames} 帧PNG编码失败")
+                zf.writestr(f'frame_{frames:05d}.png', encoded.tobytes())
+
+        return {'frames': frames, 'keyframes': keyframes}
+
+
+def _rotation(stream: dict) -> int:
+    """视频流的旋转角度（旧格式在 rotate 标签中，新版 ffprobe 在 Display Matrix 附加数据中），归一化到 0~359"""
+    rotate = stream.get('tags', {}).get('rotate')
+    if rotate is None:
+        for side_data in stream.get('side_data_list', []):
+            if 'rotation' in side_data:
+                rotate = side_data['rotation']
+                break
+    try:
+        return int(float(rotate or 0)) % 360
+    except ValueError:
+        return 0
+
+
+def remove_video_background(video_path: str, output_path: str, output_format: str = None,
+                            model_name: str = None) -> dict:
+    """
+    便捷函数：视频抠图
+
+    Args:
+        video_path: 输入视频路径
+        output_path: 输出文件路径
+        output_format: 'webm' 或 'png'
+        model_name: 抠图模型
+
+    Returns:
+        处理统计信息
+    """
+    matting = VideoMatting(model_name=model_name)
+    return matting.process(video_path, output_path, output_format)
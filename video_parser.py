@@ -5,8 +5,18 @@ Douyin Video Parser - Extract video without watermark and transcript
 
 import re
 import json
+import time
+import asyncio
+import threading
 import httpx
 from typing import Optional
+import config
+from http_transport import get_async_client
+from metrics import VIDEO_PARSE_LATENCY, VIDEO_PARSE_WINS, UPSTREAM_ERRORS
+from circuit_breaker import get_breaker, CircuitOpen
+from short_link import short_code, get_short_link_resolver
+from video_info_cache import get_video_info_cache
+import request_timing
 
 
 class VideoInfo:
@@ -25,6 +35,12 @@ class VideoInfo:
         self.create_time = create_time
         self.statistics = statistics or {}
 
+    @classmethod
+    def from_dict(cls, data: dict) -> 'VideoInfo':
+        return cls(data['video_id'], data['title'], data['author'], data['author_id'],
+                   data['cover_url'], data['video_url'], data.get('music_url', ''),
+                   data.get('duration', 0), data.get('create_time', 0), dict(data.get('statistics') or {}))
+
     def to_dict(self):
         return {
             'video_id': self.video_id,
@@ -40,38 +56,102 @@ class VideoInfo:
         }
 
 
+class StrategyStats:
+    """
+    各解析策略的成功率、耗时（EWMA）和胜出次数，用于调整策略的尝试顺序
+
+    期望耗时 = 平均成功耗时 / 成功率，越小越靠前；样本数不足的策略保持默认位置。
+    """
+
+    def __init__(self, min_samples: int, alpha: float):
+        self.min_samples = min_samples
+        self.alpha = alpha
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, name: str) -> dict:
+        return self._stats.setdefault(name, {'calls': 0, 'ok': 0, 'wins': 0, 'latency': None})
+
+    def record(self, name: str, ok: bool, elapsed: float):
+        with self._lock:
+            entry = self._entry(name)
+            entry['calls'] += 1
+            if ok:
+                entry['ok'] += 1
+                latency = entry['latency']
+                entry['latency'] = elapsed if latency is None else latency + self.alpha * (elapsed - latency)
+
+    def record_win(self, name: str):
+        VIDEO_PARSE_WINS.inc(strategy=name)
+        with self._lock:
+            self._entry(name)['wins'] += 1
+
+    def _expected_cost(self, entry: dict) -> float:
+        if not entry['ok']:
+            return float('inf')
+        return entry['latency'] / (entry['ok'] / entry['calls'])
+
+    def order(self, names: list) -> list:
+        """调整后的尝试顺序（names 为默认顺序）"""
+        if not config.VIDEO_PARSE_CONFIG['adaptive_order']:
+            return names
+        with self._lock:
+            sampled = [name for name in names
+                       if name in self._stats and self._stats[name]['calls'] >= self.min_samples]
+            ranked = iter(sorted(sampled, key=lambda name: self._expected_cost(self._stats[name])))
+        # 样本足够的策略在它们原来占据的位置之间重新排序
+        return [next(ranked) if name in sampled else name for name in names]
+
+    def report(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    'calls': entry['calls'],
+                    'success_rate': round(entry['ok'] / entry['calls'], 3) if entry['calls'] else None,
+                    'wins': entry['wins'],
+                    'latency_ms': round(entry['latency'] * 1000) if entry['latency'] is not None else None,
+                }
+                for name, entry in self._stats.items()
+            }
+
+
+_strategy_stats = None
+_strategy_stats_lock = threading.Lock()
+
+
+def get_strategy_stats() -> StrategyStats:
+    """获取全局解析策略统计"""
+    global _strategy_stats
+    if _strategy_stats is None:
+        with _strategy_stats_lock:
+            if _strategy_stats is None:
+                settings = config.VIDEO_PARSE_CONFIG
+                _strategy_stats = StrategyStats(settings['min_samples'], settings['latency_alpha'])
+    return _strategy_stats
+
+
 class DouyinVideoParser:
     """抖音视频解析器"""
 
     def __init__(self, cookie: str = None):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': 'https://www.douyin.com/',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache',
-            'Sec-Ch-Ua': '"Not_A Brand";v="8", "Chromium";v="120", "Google Chrome";v="120"',
-            'Sec-Ch-Ua-Mobile': '?0',
-            'Sec-Ch-Ua-Platform': '"Windows"',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Upgrade-Insecure-Requests': '1',
-        }
+        # 默认请求头在 config.HTTP_CLIENT_PROFILES（douyin_mobile / douyin_desktop）中配置
+        self.headers = {}
         if cookie:
             self.headers['Cookie'] = cookie
-        self.client = httpx.AsyncClient(
-            headers=self.headers,
-            follow_redirects=True,
-            timeout=30.0
-        )
+
+    @property
+    def mobile_client(self) -> httpx.AsyncClient:
+        """共享的抖音移动端客户端（分享页、iteminfo 接口；连接池和 Cookie 在多次解析之间复用）"""
+        return get_async_client('douyin_mobile')
+
+    @property
+    def desktop_client(self) -> httpx.AsyncClient:
+        """共享的抖音桌面端客户端（Web 接口、网页；与移动端共用 Cookie）"""
+        return get_async_client('douyin_desktop')
 
     async def close(self):
-        """关闭客户端"""
-        await self.client.aclose()
+        """共享客户端由 http_transport 统一管理，这里无需关闭"""
+        pass
 
     def extract_video_id(self, url: str) -> Optional[str]:
         """
@@ -100,16 +180,11 @@ class DouyinVideoParser:
 
     async def get_real_url(self, short_url: str) -> str:
         """
-        获取短链接的真实URL（使用移动端UA以获取分享页面）
+        获取短链接的真实URL（只读取跳转的 Location，不下载最终页面；结果按短码缓存）
         """
         try:
-            # 使用移动端 User-Agent 来获取 iesdouyin.com 分享页面
-            mobile_headers = {
-                'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-            }
-            async with httpx.AsyncClient(headers=mobile_headers, follow_redirects=True, timeout=30.0) as client:
-                response = await client.get(short_url)
-                return str(response.url)
+            # 使用移动端 User-Agent，跳转到 iesdouyin.com 分享页面
+            return await get_short_link_resolver().fetch(short_url, headers=self.headers)
         except Exception as e:
             raise Exception(f"Failed to resolve short URL: {e}")
 
@@ -119,32 +194,131 @@ class DouyinVideoParser:
         """
         # 处理短链接
         real_url = url
-        if 'v.douyin.com' in url or 'vm.tiktok.com' in url:
-            real_url = await self.get_real_url(url)
+        if short_code(url):
+            # 缓存命中时不经过熔断器（不发起网络请求）
+            real_url = get_short_link_resolver().lookup(url) or \
+                await self._run_strategy('short_url', self.get_real_url(url))
+
+        video_id = self.extract_video_id(real_url)
+        if not video_id:
+            return await self._parse_uncached(real_url, None)
+
+        # 按视频ID缓存：播放链接未临近过期时直接返回，临近过期时返回缓存并在后台刷新
+        async def fetch():
+            return (await self._parse_uncached(real_url, video_id)).to_dict()
+        return VideoInfo.from_dict(await get_video_info_cache().get(video_id, fetch))
 
-        # 如果是分享页面，直接解析
+    async def _parse_uncached(self, real_url: str, video_id: Optional[str]) -> VideoInfo:
+        """按各解析策略获取视频信息（不经过缓存）"""
+        strategies = {}
+        # 如果是分享页面，可以直接解析
         if 'iesdouyin.com/share/video/' in real_url:
-            try:
-                result = await self._parse_from_share_page(real_url)
-                if result:
-                    return result
-            except Exception:
-                pass
+            strategies['share_page'] = lambda: self._parse_from_share_page(real_url)
+        if video_id:
+            strategies['mobile_api'] = lambda: self._parse_from_mobile_api(video_id)   # 移动端API（限制较少）
+            strategies['web_api'] = lambda: self._parse_from_web_api(video_id)         # Web API
+            strategies['webpage'] = lambda: self._parse_from_webpage(video_id)         # 从网页中提取数据
+        if not strategies:
+            raise ValueError(f"Cannot extract video ID from URL: {real_url}")
 
-        # 提取视频ID
-        video_id = self.extract_video_id(real_url)
+        order = get_strategy_stats().order(list(strategies))
+        result, error = await self._race([(name, strategies[name]) for name in order])
+        if result:
+            return result
         if not video_id:
             raise ValueError(f"Cannot extract video ID from URL: {real_url}")
+        raise error or Exception(f"Failed to parse video: {video_id}")
+
+    async def _race(self, strategies: list):
+        """
+        按顺序启动各解析策略，返回 (最先得到的有效结果, 最后一个异常)
 
-        # 方法1: 尝试移动端API（限制较少）
+        - sequential：上一种策略失败或无结果后才启动下一种
+        - hedged：当前策略 hedge_delay 秒内没有结果就提前启动下一种（上一种继续执行），失败时立即启动下一种
+        - parallel：同时启动所有策略
+        拿到有效结果后取消其余仍在执行的策略（取消不计入熔断器和成功率统计）。
+        """
+        settings = config.VIDEO_PARSE_CONFIG
+        mode = settings['mode']
+        hedge_delay = None if mode == 'sequential' else settings['hedge_delay']
+        stats = get_strategy_stats()
+        waiting = list(strategies)
+        running = {}
+        error = None
+
+        def launch():
+            name, factory = waiting.pop(0)
+            running[asyncio.ensure_future(self._run_strategy(name, factory()))] = name
+
+        launch()
+        while mode == 'parallel' and waiting:
+            launch()
+        try:
+            while running:
+                done, _ = await asyncio.wait(list(running), timeout=hedge_delay if waiting else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()    # 当前策略较慢，提前启动下一种
+                    continue
+                winner = None
+                for task in done:
+                    name = running.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if result and winner is None:
+                        winner = (name, result)
+                if winner:
+                    stats.record_win(winner[0])
+                    return winner[1], None
+                if waiting:
+                    launch()
+            return None, error
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _run_strategy(self, name: str, coro):
+        """
+        执行一种解析策略，记录耗时和结果（ok / empty / error / cancelled）
+
+        每种策略一个熔断器：熔断中直接抛出 CircuitOpen（调用方跳到下一种策略），
+        单次执行超过熔断器配置的时间上限按失败处理，不再等满 HTTP 超时
+        """
+        breaker = get_breaker(f'douyin_{name}')
         try:
-            result = await self._parse_from_mobile_api(video_id)
-            if result:
-                return result
-        except Exception:
-            pass
+            breaker.acquire()
+        except CircuitOpen:
+            coro.close()
+            raise
 
-        # 方法2: 尝试Web API
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await asyncio.wait_for(coro, breaker.timeout())
+            outcome = 'ok' if result else 'empty'
+            return result
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if outcome == 'cancelled':
+                breaker.release()
+            else:
+                breaker.record(outcome == 'error', elapsed)
+                get_strategy_stats().record(name, outcome == 'ok', elapsed)
+            VIDEO_PARSE_LATENCY.observe(elapsed, strategy=name, result=outcome)
+            request_timing.record(f'parse_{name}', elapsed)
+            if outcome == 'error':
+                UPSTREAM_ERRORS.inc(service='douyin')
+
+    async def _parse_from_web_api(self, video_id: str) -> Optional[VideoInfo]:
+        """
+        使用Web API获取视频信息
+        """
         api_url = f"https://www.douyin.com/aweme/v1/web/aweme/detail/"
         params = {
             'aweme_id': video_id,
@@ -153,31 +327,21 @@ class DouyinVideoParser:
             'platform': 'PC',
         }
 
-        try:
-            response = await self.client.get(api_url, params=params)
-            data = response.json()
-            if data.get('status_code') == 0:
-                aweme_detail = data.get('aweme_detail', {})
-                if aweme_detail:
-                    return self._extract_video_info(aweme_detail)
-        except Exception:
-            pass
-
-        # 方法3: 从网页中提取数据
-        return await self._parse_from_webpage(video_id)
+        response = await self.desktop_client.get(api_url, params=params, headers=self.headers)
+        data = response.json()
+        if data.get('status_code') == 0:
+            aweme_detail = data.get('aweme_detail', {})
+            if aweme_detail:
+                return self._extract_video_info(aweme_detail)
+        return None
 
     async def _parse_from_share_page(self, share_url: str) -> Optional[VideoInfo]:
         """
         从 iesdouyin.com 分享页面解析视频信息
         """
         # 使用移动端 User-Agent
-        mobile_headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-        }
-
-        async with httpx.AsyncClient(headers=mobile_headers, follow_redirects=True, timeout=30.0) as client:
-            response = await client.get(share_url)
-            html = response.text
+        response = await self.mobile_client.get(share_url, headers=self.headers)
+        html = response.text
 
         # 提取视频ID
         video_id_match = re.search(r'/video/(\d+)', share_url)
@@ -246,14 +410,9 @@ class DouyinVideoParser:
         }
 
         # 使用移动端 User-Agent
-        mobile_headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-            'Referer': 'https://www.douyin.com/',
-        }
-
-        async with httpx.AsyncClient(headers=mobile_headers, follow_redirects=True, timeout=30.0) as client:
-            response = await client.get(api_url, params=params)
-            data = response.json()
+        response = await self.mobile_client.get(api_url, params=params,
+                                                headers={'Referer': 'https://www.douyin.com/', **self.headers})
+        data = response.json()
 
         if data.get('status_code') != 0:
             return None
@@ -333,7 +492,7 @@ class DouyinVideoParser:
         page_url = f"https://www.douyin.com/video/{video_id}"
 
         try:
-            response = await self.client.get(page_url)
+            response = await self.desktop_client.get(page_url, headers=self.headers)
             html = response.text
 
             # 方法1: 从页面中提取 RENDER_DATA
@@ -6,46 +6,109 @@ Web版抠图工具 - 基于Flask
 3. 下载处理后的图片
 """
 
+# 启动计时（见 subsystems.startup_report）
+import subsystems
+
 # 加载环境变量
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, render_template, request, send_file, jsonify
+# 按主机调优结果限制 OpenMP/BLAS 线程池（必须在导入 numpy/cv2 之前）
+import host_tuning
+host_tuning.apply_thread_limits()
+
+from flask import Flask, Response, render_template, request, send_file, send_from_directory, jsonify, g
 import os
 import re
-import requests
 import base64
-import zipfile
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageEnhance
-from rembg import remove
-from rembg.session_factory import new_session
+from PIL import Image, ImageEnhance, ImageOps
 import io
-import config
-import numpy as np
-import cv2
+import uuid
+import time
 import asyncio
-from content_generator import ContentGenerator
-from video_parser import DouyinVideoParser
+from concurrent.futures import as_completed
+import tempfile
+import config
+from async_runtime import run_sync, submit
+from http_transport import get_client, pool_stats
+from image_fetcher import fetch_image
+from video_parser import DouyinVideoParser, get_strategy_stats
+from image_processor import (get_inference_executor, render_params, render_cutout, save_thumbnail,
+                             remove_background_single, remove_background_bytes)
+from mask_cache import get_mask_cache
+from audio_cache import get_audio_cache
+from video_cache import get_video_cache, cache_key, is_full_request, expected_length, proxy_headers
+from output_store import get_output_store, new_session_id, is_valid_session_id
+from zip_stream import stream_zip
+import metrics
+from metrics import stage
+import request_timing
+from admission import Overloaded, get_gate, limited, queue_status
+from job_broker import JobFuture, JobFailed, get_job_broker
+from job_store import get_job_store
+from single_flight import get_flight, flight_key
+from short_link import get_short_link_resolver
+from video_info_cache import get_video_info_cache
+from circuit_breaker import breaker_status
 # 语音识别方式：'aliyun', 'baidu' 或 'whisper'
 ASR_ENGINE = 'aliyun'
 
-if ASR_ENGINE == 'aliyun':
-    from aliyun_asr import transcribe_video_aliyun as transcribe_video
-elif ASR_ENGINE == 'baidu':
-    from baidu_asr import transcribe_video_baidu as transcribe_video
-else:
-    from audio_transcriber import transcribe_video
 
-app = Flask(__name__)
+# ==================== 延迟加载的子系统 ====================
+# 重量级依赖在首次使用（或后台预热）时才导入，只处理 TTS/解析请求的 worker 不需要加载
 
-# 初始化文案生成器（全局单例，避免重复加载模板）
-content_generator = ContentGenerator()
+def _load_content_generator():
+    # 全局单例，避免重复解析模板
+    from content_generator import ContentGenerator
+    return ContentGenerator()
+
+
+def _load_asr():
+    if ASR_ENGINE == 'aliyun':
+        from aliyun_asr import transcribe_video_aliyun
+        return transcribe_video_aliyun
+    if ASR_ENGINE == 'baidu':
+        from baidu_asr import transcribe_video_baidu
+        return transcribe_video_baidu
+    if config.INFERENCE_BACKEND == 'broker':
+        return transcribe_video_broker
+    from audio_transcriber import transcribe_video as transcribe_video_whisper
+    return transcribe_video_whisper
+
+
+async def transcribe_video_broker(video_url):
+    """Whisper 识别交给推理 worker 进程（INFERENCE_BACKEND=broker）"""
+    future = JobFuture(get_job_broker(), get_job_broker().enqueue('transcribe', {'video_url': video_url}))
+    try:
+        result = await asyncio.to_thread(future.result, config.JOB_BROKER_CONFIG['timeout'])
+    except TimeoutError as e:
+        future.cancel()
+        print(f"语音识别任务失败: {e}", flush=True)
+        return None
+    except JobFailed as e:
+        print(f"语音识别任务失败: {e}", flush=True)
+        return None
+    return result['text']
+
+
+subsystems.register('content_generator', _load_content_generator, '文案模板（templates.docx）')
+subsystems.register('asr', _load_asr, f'语音识别（{ASR_ENGINE}）')
+
+
+async def transcribe_video(video_url):
+    """语音识别（首次调用时在线程中加载识别模块，不阻塞事件循环；同一视频正在识别时等待同一个结果）"""
+    if not subsystems.is_loaded('asr'):
+        await asyncio.to_thread(subsystems.get, 'asr')
+    return await get_flight('asr').run(cache_key(video_url), subsystems.get('asr'), video_url)
+
+
+app = Flask(__name__)
 
 # 配置
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 最大50MB
 app.config['UPLOAD_FOLDER'] = 'web_uploads'
-app.config['OUTPUT_FOLDER'] = 'web_outputs'
+app.config['OUTPUT_FOLDER'] = config.OUTPUT_STORE_CONFIG['root']
 
 # 确保目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -53,6 +116,96 @@ os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'bmp'}
 
+# 会话cookie：处理结果按会话保存在 web_outputs/<sid>/ 下
+SESSION_COOKIE = 'sid'
+
+
+def current_session_id():
+    """获取当前请求的会话ID，没有时生成新的（响应中写入cookie）"""
+    sid = request.cookies.get(SESSION_COOKIE)
+    if not is_valid_session_id(sid):
+        sid = g.get('new_session_id') or new_session_id()
+        g.new_session_id = sid
+    return sid
+
+
+def session_output_dir():
+    """当前会话的输出目录"""
+    return get_output_store().session_dir(current_session_id())
+
+
+def zip_response(entries, download_name):
+    """流式返回ZIP压缩包（条目边生成边发送，见 zip_stream）"""
+    return Response(
+        stream_zip(entries),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{download_name}"'}
+    )
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.timing_recorder, g.timing_token = request_timing.start_request()
+
+
+@app.teardown_request
+def end_request_timer(exc=None):
+    token = g.pop('timing_token', None)
+    if token is not None:
+        try:
+            request_timing.end_request(token)
+        except ValueError:
+            # 不在同一个上下文中（理论上不会发生），忽略
+            pass
+
+
+@app.after_request
+def add_server_timing(response):
+    """写入 Server-Timing 响应头；请求带 timings=1 时在 JSON 响应中附加 timings"""
+    recorder = g.get('timing_recorder')
+    if recorder is None:
+        return response
+    response.headers['Server-Timing'] = recorder.server_timing()
+    if (response.is_json and not response.is_streamed
+            and request_timing.wants_timings(request.args, request.headers)):
+        data = response.get_json(silent=True)
+        if isinstance(data, dict):
+            data['timings'] = recorder.to_dict()
+            response.set_data(app.json.dumps(data))
+    return response
+
+
+@app.after_request
+def record_request_latency(response):
+    """按路由模板统计请求耗时（使用模板而不是实际路径，避免标签数量膨胀）"""
+    start = g.get('request_start')
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method,
+                                        status=response.status_code)
+    return response
+
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(e):
+    """队列已满：快速返回 429，前端按 Retry-After 提示用户稍后重试；超过队列容量返回 413，不带 Retry-After"""
+    response = jsonify(e.to_dict())
+    response.status_code = e.status_code
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+@app.after_request
+def set_session_cookie(response):
+    """新会话写入cookie"""
+    sid = g.get('new_session_id')
+    if sid:
+        response.set_cookie(SESSION_COOKIE, sid, max_age=config.OUTPUT_STORE_CONFIG['ttl'],
+                            httponly=True, samesite='Lax')
+    return response
+
 
 def allowed_file(filename):
     """检查文件类型是否允许"""
@@ -76,70 +229,119 @@ def preprocess_image(image):
     return image
 
 
-def postprocess_mask(image_with_alpha):
-    """后处理：填补mask中的小空洞，修复误删的前景"""
-    # 转换为numpy数组
-    img_array = np.array(image_with_alpha)
-
-    # 提取alpha通道
-    if img_array.shape[2] == 4:
-        alpha = img_array[:, :, 3]
+def thumbnail_name(output_filename):
+    """处理结果文件对应的缩略图文件名"""
+    return os.path.splitext(output_filename)[0] + '_thumb.webp'
 
-        # 使用形态学闭操作填补小空洞
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-        alpha_closed = cv2.morphologyEx(alpha, cv2.MORPH_CLOSE, kernel, iterations=2)
 
-        # 使用开操作去除小噪点
-        kernel_open = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
-        alpha_processed = cv2.morphologyEx(alpha_closed, cv2.MORPH_OPEN, kernel_open, iterations=1)
+class BrokerMaskFuture:
+    """队列模式下的抠图结果：worker 完成后把原始 mask 载入本进程的 mask 缓存，/rerender 照常可用"""
 
-        # 替换alpha通道
-        img_array[:, :, 3] = alpha_processed
+    def __init__(self, job_id, image_path, model_name, spooled):
+        self.job_id = job_id
+        self.image_path = image_path
+        self.model_name = model_name
+        self.spooled = spooled
 
-        # 转回PIL Image
-        return Image.fromarray(img_array)
+    def result(self):
+        """
+        等待 worker 完成，返回 mask 缓存键（与 remove_background_bytes 一致）
 
-    return image_with_alpha
-
-
-def remove_background_single(input_path, output_path, model_name=None):
-    """去除单张图片背景"""
-    try:
-        # 读取图片
-        input_image = Image.open(input_path)
-
-        # 创建模型 session - 使用指定的模型或默认模型
-        selected_model = model_name if model_name else config.REMBG_CONFIG['model']
-        session = new_session(selected_model)
-
-        # 去除背景
-        output_image = remove(
-            input_image,
-            session=session,
-            alpha_matting=config.REMBG_CONFIG['alpha_matting'],
-            alpha_matting_foreground_threshold=config.REMBG_CONFIG['alpha_matting_foreground_threshold'],
-            alpha_matting_background_threshold=config.REMBG_CONFIG['alpha_matting_background_threshold'],
-            alpha_matting_erode_size=config.REMBG_CONFIG['alpha_matting_erode_size'],
-            post_process_mask=config.REMBG_CONFIG.get('post_process_mask', False),
+        任务失败抛出 JobFailed（带 worker 中的错误信息）；等待超时时取消任务（还在排队的不再执行）并抛出 TimeoutError
+        """
+        future = JobFuture(get_job_broker(), self.job_id)
+        mask_path = None
+        try:
+            with stage('inference_queue'):
+                try:
+                    outcome = future.result(config.JOB_BROKER_CONFIG['timeout'])
+                except TimeoutError:
+                    future.cancel()
+                    raise
+            mask_path = outcome['mask_path']
+            with open(self.image_path, 'rb') as f:
+                image_bytes = f.read()
+            raw_mask = subsystems.get('numpy').array(Image.open(mask_path))
+            get_mask_cache().put(outcome['mask_key'], image_bytes, raw_mask, self.model_name)
+            return outcome['mask_key']
+        finally:
+            for path in (mask_path, self.image_path if self.spooled else None):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+
+def submit_remove_background(image_source, output_path, model_name=None, thumbnail_path=None):
+    """
+    提交抠图任务，返回带 result() 的 future（结果为 mask 缓存键，失败时 result() 抛出异常）
+
+    INFERENCE_BACKEND=local 时在本进程的推理线程池执行；
+    broker 时写入任务队列由 inference_worker.py 执行（图片数据先落盘，路径使用绝对路径）
+
+    Args:
+        image_source: 图片文件路径或图片数据（bytes）
+    """
+    if config.INFERENCE_BACKEND != 'broker':
+        fn = remove_background_bytes if isinstance(image_source, bytes) else remove_background_single
+        return request_timing.submit_with_context(
+            get_inference_executor(), fn, image_source, output_path,
+            model_name=model_name, thumbnail_path=thumbnail_path
         )
 
-        # 后处理：填补小空洞（轻度修复）
-        output_image = postprocess_mask(output_image)
+    spool_dir = config.JOB_BROKER_CONFIG['spool_dir']
+    os.makedirs(spool_dir, exist_ok=True)
+    spooled = isinstance(image_source, bytes)
+    if spooled:
+        image_path = os.path.join(spool_dir, f'{uuid.uuid4().hex}.img')
+        with open(image_path, 'wb') as f:
+            f.write(image_source)
+    else:
+        image_path = os.path.abspath(image_source)
+
+    selected_model = model_name if model_name else config.REMBG_CONFIG['model']
+    job_id = get_job_broker().enqueue('remove_bg', {
+        'image_path': image_path,
+        'output_path': os.path.abspath(output_path),
+        'thumbnail_path': os.path.abspath(thumbnail_path) if thumbnail_path else None,
+        'model_name': selected_model,
+        'mask_path': os.path.join(spool_dir, f'{uuid.uuid4().hex}_mask.png'),
+    })
+    return BrokerMaskFuture(job_id, image_path, selected_model, spooled)
 
-        # 保存 - PNG无损格式，最高质量
-        output_image.save(output_path, format='PNG', compress_level=1, optimize=True)
-        return True
 
-    except Exception as e:
-        print(f"处理图片失败: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
+def run_remove_video_background(video_path, output_path, output_format, model_name=None):
+    """
+    执行视频抠图，返回处理统计信息
+
+    INFERENCE_BACKEND=local 时在本进程的推理线程池执行；
+    broker 时写入任务队列由 inference_worker.py 执行（Web 进程不加载模型），等待超时时取消任务
+    """
+    if config.INFERENCE_BACKEND != 'broker':
+        from video_matting import remove_video_background
+        future = request_timing.submit_with_context(
+            get_inference_executor(), remove_video_background, video_path, output_path, output_format,
+            model_name=model_name
+        )
+        return future.result()
+
+    broker = get_job_broker()
+    future = JobFuture(broker, broker.enqueue('remove_video_bg', {
+        'video_path': os.path.abspath(video_path),
+        'output_path': os.path.abspath(output_path),
+        'output_format': output_format,
+        'model_name': model_name,
+    }))
+    with stage('inference_queue'):
+        try:
+            return future.result(config.JOB_BROKER_CONFIG['timeout'])
+        except TimeoutError:
+            future.cancel()
+            raise
 
 
 @app.route('/')
 def index():
     """主页"""
+    current_session_id()
     return render_template('index.html')
 
 
@@ -158,34 +360,52 @@ def upload_files():
     selected_model = request.form.get('model', 'u2net')
     print(f"使用模型: {selected_model}")
 
-    # ✨ 每次上传新图片时，自动清空之前的输出文件
-    # 这样下载时只包含当前这一批的图片
-    for filename in os.listdir(app.config['OUTPUT_FOLDER']):
-        file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-        try:
-            os.remove(file_path)
-        except:
-            pass
-
-    processed_files = []
-    failed_files = []
-
-    for file in files:
-        if file and allowed_file(file.filename):
-            # 保存原始文件
-            filename = secure_filename(file.filename)
-            upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(upload_path)
-
-            # 处理图片 - 传递选择的模型
-            output_filename = os.path.splitext(filename)[0] + '_nobg.png'
-            output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-
-            if remove_background_single(upload_path, output_path, model_name=selected_model):
+    # 按图片数占用推理队列名额，队列已满时直接返回 429、超过队列容量返回 413（在清空旧结果之前检查）
+    units = sum(1 for file in files if file and allowed_file(file.filename))
+    with get_gate('inference').admit(units):
+        # ✨ 每次上传新图片时，清空当前会话之前的输出文件（不影响其他用户）
+        # 这样下载时只包含当前这一批的图片
+        get_output_store().reset_session(current_session_id())
+        output_dir = session_output_dir()
+
+        processed_files = []
+        failed_files = []
+
+        # 保存上传文件后提交到推理线程池（或推理 worker）并发处理
+        jobs = []
+        for file in files:
+            if file and allowed_file(file.filename):
+                # 保存原始文件
+                filename = secure_filename(file.filename)
+                # 上传目录是共享的，加随机前缀避免并发上传同名文件互相覆盖
+                upload_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{uuid.uuid4().hex[:8]}_{filename}')
+                file.save(upload_path)
+
+                # 处理图片 - 传递选择的模型
+                output_filename = os.path.splitext(filename)[0] + '_nobg.png'
+                output_path = os.path.join(output_dir, output_filename)
+                thumb_filename = thumbnail_name(output_filename)
+                thumb_path = os.path.join(output_dir, thumb_filename)
+
+                future = submit_remove_background(
+                    upload_path, output_path, model_name=selected_model, thumbnail_path=thumb_path
+                )
+                jobs.append((filename, upload_path, output_filename, thumb_filename, future))
+
+        for filename, upload_path, output_filename, thumb_filename, future in jobs:
+            try:
+                mask_key = future.result()
+            except Exception as e:
+                print(f"处理图片失败 {filename}: {e}", flush=True)
+                mask_key = None
+            if mask_key:
                 processed_files.append({
                     'original': filename,
                     'processed': output_filename,
-                    'download_url': f'/download/{output_filename}'
+                    'mask_key': mask_key,
+                    'download_url': f'/download/{output_filename}',
+                    'result_url': f'/outputs/{output_filename}',
+                    'thumbnail_url': f'/outputs/{thumb_filename}'
                 })
             else:
                 failed_files.append(filename)
@@ -204,36 +424,122 @@ def upload_files():
 @app.route('/download/<filename>')
 def download_file(filename):
     """下载单个处理后的文件"""
-    file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
+    file_path = os.path.join(session_output_dir(), secure_filename(filename))
     if os.path.exists(file_path):
         return send_file(file_path, as_attachment=True)
     return "文件不存在", 404
 
 
+@app.route('/rerender', methods=['POST'])
+def rerender():
+    """
+    使用缓存的模型输出，以新的后处理参数重新渲染（无需重新推理）
+
+    参数: mask_key；processed 为 /upload、/batch_remove_bg 返回的处理结果文件名（当前会话中要覆盖的文件）
+    """
+    try:
+        data = request.get_json() or {}
+        mask_key = data.get('mask_key', '')
+
+        # mask 缓存在会话之间共享，要覆盖的文件由请求指定，且必须是当前会话已有的处理结果
+        output_filename = data.get('processed') or ''
+        output_dir = session_output_dir()
+        if (secure_filename(output_filename) != output_filename or not output_filename.endswith('_nobg.png')
+                or not os.path.isfile(os.path.join(output_dir, output_filename))):
+            return jsonify({'success': False, 'error': '处理结果不存在，请重新处理图片'}), 404
+
+        entry = get_mask_cache().get(mask_key)
+        if entry is None:
+            return jsonify({'success': False, 'error': '缓存已过期，请重新处理图片'}), 404
+
+        params = render_params(data.get('params', {}))
+        input_image = ImageOps.exif_transpose(Image.open(io.BytesIO(entry['image_bytes'])))
+        output_image = render_cutout(input_image, entry['mask'], params)
+
+        # 覆盖原处理结果，下载链接保持不变；返回的预览地址带版本号避免浏览器缓存
+        thumb_filename = thumbnail_name(output_filename)
+        output_image.save(os.path.join(output_dir, output_filename),
+                          format='PNG', compress_level=1, optimize=True)
+        save_thumbnail(output_image, os.path.join(output_dir, thumb_filename))
+
+        version = uuid.uuid4().hex[:8]
+        return jsonify({
+            'success': True,
+            'processed': output_filename,
+            'mask_key': mask_key,
+            'params': params,
+            'download_url': f'/download/{output_filename}',
+            'result_url': f'/outputs/{output_filename}?v={version}',
+            'thumbnail_url': f'/outputs/{thumb_filename}?v={version}'
+        })
+
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        print(f"重新渲染失败: {e}", flush=True)
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': f'渲染失败: {str(e)}'}), 500
+
+
+@app.route('/outputs/<filename>')
+def view_output(filename):
+    """在浏览器中直接查看处理结果或缩略图（不作为附件下载）"""
+    return send_from_directory(session_output_dir(), filename, max_age=3600)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus 指标"""
+    return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route('/http_stats')
+def http_stats():
+    """共享 HTTP 客户端的连接池与 DNS 缓存统计、各上游熔断器状态，以及抖音解析策略统计"""
+    return jsonify({'success': True, 'stats': pool_stats(), 'circuit_breakers': breaker_status(),
+                    'parse_strategies': get_strategy_stats().report()})
+
+
+@app.route('/startup_stats')
+def startup_stats():
+    """worker 启动耗时与各子系统的加载状态"""
+    return jsonify({'success': True, 'stats': subsystems.startup_report()})
+
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """长任务（批量抠图、分段识别、分段合成）的状态与进度"""
+    job = get_job_store().get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job})
+
+
+@app.route('/queue_status')
+def queue_status_endpoint():
+    """各类任务队列的占用情况与预计等待时间（前端用于显示排队提示）"""
+    return jsonify({'success': True, 'queues': queue_status()})
+
+
 @app.route('/download_all')
 def download_all():
-    """打包下载所有处理后的文件"""
-    output_files = os.listdir(app.config['OUTPUT_FOLDER'])
+    """打包下载当前会话所有处理后的文件"""
+    output_dir = session_output_dir()
+    # 缩略图只用于页面预览，不打包
+    output_files = [f for f in os.listdir(output_dir) if not f.endswith('_thumb.webp')]
 
     if not output_files:
         return "没有文件可下载", 404
 
-    # 创建ZIP文件
-    zip_path = 'all_processed.zip'
-    with zipfile.ZipFile(zip_path, 'w') as zipf:
-        for filename in output_files:
-            file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-            zipf.write(file_path, filename)
-
-    return send_file(zip_path, as_attachment=True, download_name='processed_images.zip')
+    entries = ((filename, os.path.join(output_dir, filename)) for filename in output_files)
+    return zip_response(entries, 'processed_images.zip')
 
 
 @app.route('/clear')
 def clear_files():
-    """清空输出目录"""
-    for filename in os.listdir(app.config['OUTPUT_FOLDER']):
-        file_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
-        os.remove(file_path)
+    """清空当前会话的输出文件"""
+    get_output_store().reset_session(current_session_id())
 
     return jsonify({'success': True, 'message': '已清空所有文件'})
 
@@ -256,7 +562,7 @@ def generate_content():
         print(f"生成文案 - 商品: {product_name}, 描述长度: {len(description)}")
 
         # 生成文案
-        result = content_generator.generate_content(
+        result = subsystems.get('content_generator').generate_content(
             product_name=product_name,
             description=description,
             template_index=template_index
@@ -280,19 +586,42 @@ def generate_content():
         })
 
 
-@app.route('/parse_video', methods=['POST'])
-def parse_video():
-    """解析抖音视频，提取视频链接和文案"""
+def douyin_target(url):
+    """
+    链接对应的目标（用于合并相同请求）：视频ID、商品ID、短链接短码，其他链接去掉查询参数
+
+    同一个分享链接在不同人手里只有末尾的追踪参数不同，规范化后得到相同的键；
+    已经解析过的短链接按跳转后的链接计算（与直接粘贴长链接的请求合并）
+    """
+    url = get_short_link_resolver().lookup(url) or url
+    match = re.search(r'/(?:video|note)/(\d+)|[?&](?:modal_id|aweme_id|item_ids)=(\d+)', url)
+    if match:
+        return f'video:{match.group(1) or match.group(2)}'
+    match = re.search(r'[?&](?:id|product_id)=(\d+)', url)
+    if match:
+        return f'product:{match.group(1)}'
+    match = re.search(r'v\.douyin\.com/([A-Za-z0-9_-]+)', url)
+    if match:
+        return f'short:{match.group(1)}'
+    return url.split('?', 1)[0].split('#', 1)[0].rstrip('/')
+
+
+@limited('asr')
+async def parse_video_data(text):
+    """
+    解析抖音视频并识别语音文案（Flask 与 ASGI 路由共用）
+
+    Returns:
+        响应字典 {'success': bool, 'data'/'error': ...}
+    """
     try:
-        import re
-        data = request.get_json()
-        text = data.get('url', '').strip()
+        text = (text or '').strip()
 
         if not text:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '请输入抖音视频链接'
-            })
+            }
 
         # 从文本中提取URL（支持从抖音分享文本中提取）
         url_pattern = r'https?://[^\s<>"{}|\\^`\[\]]+'
@@ -310,82 +639,87 @@ def parse_video():
             if any(domain in text for domain in ['douyin.com', 'iesdouyin.com']):
                 url = text
             else:
-                return jsonify({
+                return {
                     'success': False,
                     'error': '未找到有效的抖音视频链接，请检查输入'
-                })
+                }
 
         print(f"解析视频链接: {url}", flush=True)
 
-        # 使用异步函数解析视频
-        async def do_parse():
-            parser = DouyinVideoParser()
-            try:
-                result = await parser.parse(url)
-                return result
-            finally:
-                await parser.close()
-
-        # 运行异步函数
-        result = asyncio.run(do_parse())
+        # 同一视频正在解析时（多人同时粘贴同一个分享链接），等待同一个解析和识别结果
+        video_data = await get_flight('parse_video').run(douyin_target(url), parse_and_transcribe, url)
 
-        video_data = result.to_dict()
-
-        # 尝试进行语音识别（如果有视频链接）
-        transcript = ""
-        if video_data.get('video_url'):
-            try:
-                print("开始语音识别...", flush=True)
-
-                async def do_transcribe():
-                    return await transcribe_video(video_data['video_url'])
-
-                transcript = asyncio.run(do_transcribe())
-                print(f"语音识别完成，文字长度: {len(transcript)}", flush=True)
-            except Exception as e:
-                import traceback
-                error_msg = str(e)
-                print(f"语音识别失败: {error_msg}", flush=True)
-                traceback.print_exc()
-                transcript = f"[语音识别失败: {error_msg}]"
-
-        video_data['transcript'] = transcript
-
-        return jsonify({
+        return {
             'success': True,
             'data': video_data
-        })
+        }
 
     except ValueError as e:
         print(f"解析失败 (ValueError): {e}")
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        })
+        }
     except Exception as e:
         print(f"解析视频失败: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': f'解析失败: {str(e)}'
-        })
+        }
 
 
-@app.route('/parse_product', methods=['POST'])
-def parse_product():
-    """解析抖音商品页面，提取所有图片"""
+async def parse_and_transcribe(url):
+    """解析视频信息并识别语音文案，返回视频信息字典（含 transcript）"""
+    parser = DouyinVideoParser()
     try:
-        from product_parser import DouyinProductParser
+        result = await parser.parse(url)
+    finally:
+        await parser.close()
 
-        data = request.get_json()
-        input_text = data.get('url', '').strip()
+    video_data = result.to_dict()
+
+    # 尝试进行语音识别（如果有视频链接）
+    transcript = ""
+    if video_data.get('video_url'):
+        try:
+            print("开始语音识别...", flush=True)
+            transcript = await transcribe_video(video_data['video_url'])
+            print(f"语音识别完成，文字长度: {len(transcript)}", flush=True)
+        except Exception as e:
+            import traceback
+            error_msg = str(e)
+            print(f"语音识别失败: {error_msg}", flush=True)
+            traceback.print_exc()
+            transcript = f"[语音识别失败: {error_msg}]"
+
+    video_data['transcript'] = transcript
+    return video_data
+
+
+@app.route('/parse_video', methods=['POST'])
+def parse_video():
+    """解析抖音视频，提取视频链接和文案"""
+    data = request.get_json(silent=True) or {}
+    return jsonify(run_sync(parse_video_data(data.get('url', ''))))
+
+
+async def parse_product_data(input_text):
+    """
+    解析抖音商品页面，提取所有图片（Flask 与 ASGI 路由共用）
+
+    Returns:
+        响应字典 {'success': bool, 'data'/'error': ...}
+    """
+    try:
+        input_text = (input_text or '').strip()
 
         if not input_text:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '请输入商品链接'
-            })
+            }
 
         print(f"输入文本: {input_text}", flush=True)
 
@@ -419,35 +753,46 @@ def parse_product():
 
             print(f"提取到URL: {url}", flush=True)
 
-        # 使用异步函数解析商品
-        async def do_parse():
-            parser = DouyinProductParser()
-            return await parser.parse(url)
-
-        result = asyncio.run(do_parse())
-        product_data = result.to_dict()
+        # 同一商品正在抓取时（直播团队多人同时粘贴同一个链接），等待同一个 Playwright 抓取结果
+        product_data = await get_flight('parse_product').run(douyin_target(url), scrape_product, url)
 
         print(f"提取到 {product_data['total_images']} 张图片", flush=True)
 
-        return jsonify({
+        return {
             'success': True,
             'data': product_data
-        })
+        }
 
     except ValueError as e:
         print(f"解析失败: {e}", flush=True)
-        return jsonify({
+        return {
             'success': False,
             'error': str(e)
-        })
+        }
     except Exception as e:
         print(f"解析商品失败: {e}", flush=True)
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': f'解析失败: {str(e)}'
-        })
+        }
+
+
+async def scrape_product(url):
+    """抓取商品页面，返回商品信息字典"""
+    from product_parser import DouyinProductParser
+
+    parser = DouyinProductParser()
+    result = await parser.parse(url)
+    return result.to_dict()
+
+
+@app.route('/parse_product', methods=['POST'])
+def parse_product():
+    """解析抖音商品页面，提取所有图片"""
+    data = request.get_json(silent=True) or {}
+    return jsonify(run_sync(parse_product_data(data.get('url', ''))))
 
 
 @app.route('/batch_remove_bg', methods=['POST'])
@@ -465,86 +810,97 @@ def batch_remove_bg():
 
         print(f"批量处理 {len(image_urls)} 张图片", flush=True)
 
-        results = []
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-            'Referer': 'https://haohuo.jinritemai.com/',
-            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Origin': 'https://haohuo.jinritemai.com',
-            'Sec-Fetch-Dest': 'image',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'cross-site',
-        }
-
-        for i, img_url in enumerate(image_urls):
-            try:
-                print(f"处理第 {i+1}/{len(image_urls)} 张: {img_url[:80]}...", flush=True)
-
-                # 下载图片，带重试逻辑
-                response = None
-                max_retries = 3
-                for retry in range(max_retries):
-                    try:
-                        response = requests.get(img_url, headers=headers, timeout=30, allow_redirects=True)
-                        if response.status_code == 200:
-                            break
-                    except (requests.exceptions.Timeout, requests.exceptions.SSLError, requests.exceptions.ConnectionError) as e:
-                        if retry < max_retries - 1:
-                            wait_time = (retry + 1) * 2  # 2, 4, 6秒
-                            print(f"  网络错误，{wait_time}秒后重试 ({retry + 1}/{max_retries}): {str(e)[:50]}", flush=True)
-                            import time
-                            time.sleep(wait_time)
-                        else:
-                            raise e
-
-                if response is None:
-                    print(f"  下载失败: 无响应", flush=True)
-                    results.append({'url': img_url, 'error': '下载失败: 无响应'})
-                    continue
+        # 按图片数占用推理队列名额，队列已满时直接返回 429、超过队列容量返回 413
+        with get_gate('inference').admit(len(image_urls)):
+            # 进度写入任务记录：worker 中断后重新提交同一批图片时，已完成的图片直接返回原结果
+            job = get_job_store().open('batch_remove_bg', {'session': current_session_id(), 'images': image_urls},
+                                       total=len(image_urls))
+            batch_id = job.id[:12]
+            output_dir = session_output_dir()
+            pending = []
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+                'Referer': 'https://haohuo.jinritemai.com/',
+                'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+                'Origin': 'https://haohuo.jinritemai.com',
+                'Sec-Fetch-Dest': 'image',
+                'Sec-Fetch-Mode': 'cors',
+                'Sec-Fetch-Site': 'cross-site',
+            }
 
-                print(f"  HTTP状态码: {response.status_code}, 内容长度: {len(response.content)}", flush=True)
+            # 结果按输入顺序占位；图片在共享事件循环中并发下载，下载完成一张就提交一张抠图
+            results = [{'url': img_url} for img_url in image_urls]
+            todo = []
+            for i, img_url in enumerate(image_urls):
+                done = job.item(i)
+                if done and os.path.exists(os.path.join(output_dir, done['processed'])):
+                    results[i] = done
+                else:
+                    todo.append(i)
+            downloads = {submit(fetch_image(image_urls[i], headers)): i for i in todo}
+
+            for download in as_completed(downloads):
+                i = downloads[download]
+                result = results[i]
+                try:
+                    fetched = download.result()
+                    result['fetch_time'] = round(fetched.elapsed, 3)
+                    if not fetched.ok:
+                        print(f"  第 {i+1} 张{fetched.error}", flush=True)
+                        result['error'] = fetched.error
+                        continue
+
+                    # 去除背景，并在同一次处理中生成缩略图（页面网格只加载缩略图）
+                    output_filename = f'batch_{batch_id}_{i+1}_nobg.png'
+                    thumb_filename = thumbnail_name(output_filename)
+                    future = submit_remove_background(
+                        fetched.content,
+                        os.path.join(output_dir, output_filename),
+                        thumbnail_path=os.path.join(output_dir, thumb_filename)
+                    )
+                    pending.append((i, result, output_filename, thumb_filename, future))
 
-                if response.status_code != 200:
-                    print(f"  下载失败: HTTP {response.status_code}", flush=True)
-                    results.append({'url': img_url, 'error': f'下载失败: HTTP {response.status_code}'})
-                    continue
+                except Exception as e:
+                    print(f"  处理失败: {str(e)}", flush=True)
+                    import traceback
+                    traceback.print_exc()
+                    result['error'] = str(e)
 
-                if len(response.content) < 1000:
-                    print(f"  内容过小，可能不是有效图片", flush=True)
-                    results.append({'url': img_url, 'error': '下载内容无效'})
+            # 等待所有抠图任务完成
+            for i, result, output_filename, thumb_filename, future in pending:
+                try:
+                    mask_key = future.result()
+                except Exception as e:
+                    print(f"  第 {i+1} 张抠图失败: {e}", flush=True)
+                    result['error'] = f'抠图失败: {e}'
                     continue
 
-                # 转换为PIL Image
-                img = Image.open(io.BytesIO(response.content))
-
-                # 去除背景
-                output = remove(img)
-
-                # 转换为base64
-                buffered = io.BytesIO()
-                output.save(buffered, format="PNG")
-                img_base64 = base64.b64encode(buffered.getvalue()).decode()
-
-                results.append({
-                    'url': img_url,
-                    'result': f'data:image/png;base64,{img_base64}'
+                result.update({
+                    'processed': output_filename,
+                    'mask_key': mask_key,
+                    'result_url': f'/outputs/{output_filename}',
+                    'thumbnail_url': f'/outputs/{thumb_filename}',
+                    'download_url': f'/download/{output_filename}'
                 })
+                job.save_item(i, result)
 
-            except Exception as e:
-                print(f"  处理失败: {str(e)}", flush=True)
-                import traceback
-                traceback.print_exc()
-                results.append({'url': img_url, 'error': str(e)})
-
-        print(f"批量处理完成，成功 {len([r for r in results if 'result' in r])} 张", flush=True)
+            succeeded = len([r for r in results if 'processed' in r])
+            print(f"批量处理完成，成功 {succeeded} 张", flush=True)
+            # 有失败的图片时保留进度，再次提交只重试失败的图片
+            if succeeded == len(image_urls):
+                job.finish({'processed': succeeded})
+            else:
+                job.fail(f'{len(image_urls) - succeeded} 张图片处理失败')
 
         return jsonify({
             'success': True,
+            'job_id': job.id,
             'results': results
         })
 
+    except Overloaded:
+        raise
     except Exception as e:
         print(f"批量处理失败: {e}", flush=True)
         return jsonify({
@@ -571,37 +927,31 @@ def download_originals():
             'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
         }
 
-        # 创建内存中的ZIP文件
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for i, img_url in enumerate(image_urls):
-                try:
-                    print(f"下载第 {i+1}/{len(image_urls)} 张", flush=True)
-
-                    # 下载图片
-                    response = requests.get(img_url, headers=headers, timeout=30)
-                    if response.status_code == 200:
-                        # 获取文件扩展名
-                        ext = '.jpg'
-                        if 'png' in img_url.lower():
-                            ext = '.png'
-                        elif 'webp' in img_url.lower():
-                            ext = '.webp'
-
-                        zf.writestr(f'original_{i+1}{ext}', response.content)
-                    else:
-                        print(f"  下载失败: HTTP {response.status_code}", flush=True)
-                except Exception as e:
-                    print(f"  下载失败: {str(e)}", flush=True)
+        # 所有图片在共享事件循环中并发下载；按顺序打包，前面的图片下载完成即开始输出
+        downloads = [submit(fetch_image(img_url, headers)) for img_url in image_urls]
 
-        memory_file.seek(0)
+        def entries():
+            try:
+                for i, (img_url, download) in enumerate(zip(image_urls, downloads)):
+                    fetched = download.result()
+                    if not fetched.ok:
+                        print(f"  第 {i+1} 张{fetched.error}", flush=True)
+                        continue
+
+                    # 获取文件扩展名
+                    ext = '.jpg'
+                    if 'png' in img_url.lower():
+                        ext = '.png'
+                    elif 'webp' in img_url.lower():
+                        ext = '.webp'
+
+                    yield f'original_{i+1}{ext}', fetched.content
+            finally:
+                # 客户端中途断开时取消剩余下载
+                for download in downloads:
+                    download.cancel()
 
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='original_images.zip'
-        )
+        return zip_response(entries(), 'original_images.zip')
 
     except Exception as e:
         print(f"下载原图失败: {e}", flush=True)
@@ -613,30 +963,29 @@ def download_batch_processed():
     """打包下载批量处理后的图片"""
     try:
         data = request.get_json()
+        # files: 服务端已保存的处理结果文件名；images: 旧版前端提交的base64数据
+        files = data.get('files', [])
         images = data.get('images', [])
 
-        if not images:
+        if not files and not images:
             return jsonify({'success': False, 'error': '没有图片可下载'}), 400
 
-        # 创建内存中的ZIP文件
-        memory_file = io.BytesIO()
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        output_dir = session_output_dir()
+
+        def entries():
+            for i, filename in enumerate(files):
+                file_path = os.path.join(output_dir, secure_filename(filename))
+                if os.path.exists(file_path):
+                    yield f'processed_{i+1}.png', file_path
+
             for i, img_data in enumerate(images):
                 # 解码base64图片数据
                 if img_data.startswith('data:image/png;base64,'):
                     img_data = img_data.replace('data:image/png;base64,', '')
 
-                img_bytes = base64.b64decode(img_data)
-                zf.writestr(f'processed_{i+1}.png', img_bytes)
+                yield f'processed_{len(files) + i + 1}.png', base64.b64decode(img_data)
 
-        memory_file.seek(0)
-
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='processed_images.zip'
-        )
+        return zip_response(entries(), 'processed_images.zip')
 
     except Exception as e:
         print(f"打包下载失败: {e}", flush=True)
@@ -645,13 +994,24 @@ def download_batch_processed():
 
 @app.route('/download_video', methods=['GET'])
 def download_video():
-    """代理下载抖音视频（避免403错误）"""
-    import requests
-    from flask import Response
+    """
+    代理下载抖音视频（避免403错误）
 
+    参数: url 视频地址；video_id 可选，解析结果中的视频ID（播放链接失效时清除该视频的解析缓存）；inline=1 时在页面中预览而不是下载
+    最近代理过的视频从本地缓存返回（支持 Range），未缓存时透传 Range 给 CDN
+    """
     video_url = request.args.get('url', '')
     if not video_url:
         return jsonify({'success': False, 'error': '缺少视频URL'}), 400
+    inline = request.args.get('inline') == '1'
+
+    cache = get_video_cache()
+    key = cache_key(video_url)
+    cached_path = cache.get(key)
+    if cached_path:
+        # 本地文件：Range/条件请求由 send_file 处理，gunicorn 下通过 sendfile 发送
+        return send_file(cached_path, mimetype='video/mp4', as_attachment=not inline,
+                         download_name='douyin_video.mp4', conditional=True)
 
     try:
         # 使用正确的请求头
@@ -660,41 +1020,235 @@ def download_video():
             'Referer': 'https://www.douyin.com/',
             'Accept': '*/*',
         }
+        range_header = request.headers.get('Range')
+        full_request = is_full_request(range_header)
+        if not full_request:
+            headers['Range'] = range_header
 
         # 流式下载视频
-        response = requests.get(video_url, headers=headers, stream=True, timeout=180)
-
-        if response.status_code != 200:
+        client = get_client('cdn')
+        response = client.send(client.build_request('GET', video_url, headers=headers), stream=True)
+
+        if response.status_code not in (200, 206):
+            response.close()
+            video_id = request.args.get('video_id')
+            if response.status_code in (403, 404, 410) and video_id:
+                # 播放链接已失效（缓存的正是这个链接时），下次解析该视频时重新获取
+                get_video_info_cache().invalidate_url(video_id, video_url)
             return jsonify({'success': False, 'error': f'下载失败: HTTP {response.status_code}'}), 400
 
-        # 获取文件名
-        filename = 'douyin_video.mp4'
+        # 完整下载时边转发边写入缓存
+        writer = cache.writer(key) if full_request and response.status_code == 200 else None
 
         # 流式返回视频
         def generate():
-            for chunk in response.iter_content(chunk_size=8192):
-                yield chunk
+            completed = False
+            try:
+                for chunk in response.iter_bytes(config.VIDEO_CACHE_CONFIG['chunk_size']):
+                    if writer:
+                        writer.write(chunk)
+                    yield chunk
+                completed = True
+            finally:
+                response.close()
+                if writer:
+                    if completed:
+                        writer.commit(expected_length(response.headers))
+                    else:
+                        # 客户端中途断开，丢弃不完整的缓存
+                        writer.abort()
 
         return Response(
             generate(),
+            status=response.status_code,
             mimetype='video/mp4',
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Content-Length': response.headers.get('Content-Length', '')
-            }
+            headers=proxy_headers(response.headers, inline)
         )
 
     except Exception as e:
         return jsonify({'success': False, 'error': f'下载失败: {str(e)}'}), 500
 
 
-@app.route('/synthesize_speech', methods=['POST'])
-def synthesize_speech():
-    """文字转语音"""
+@app.route('/video_remove_bg', methods=['POST'])
+def video_remove_bg():
+    """
+    视频抠图：上传视频文件，或提供抖音视频链接/视频直链
+
+    按估算的关键帧数占用推理队列名额（最多占一半，避免一个视频挡住所有图片请求），
+    在推理线程池中执行，与 /upload、/batch_remove_bg 共享推理并发；
+    超过最长时长（VIDEO_MATTING_CONFIG['max_duration']）的视频返回 400，不截断处理
+    """
+    from video_matting import VideoMatting
+
+    video_path = None
+    try:
+        # 参数可以来自表单（上传文件时）或 JSON
+        data = request.get_json(silent=True) or request.form
+        output_format = data.get('format') or config.VIDEO_MATTING_CONFIG['output_format']
+        if output_format not in ('webm', 'png'):
+            return jsonify({'success': False, 'error': '输出格式只支持 webm 或 png'}), 400
+
+        model_name = data.get('model')
+
+        if 'video' in request.files and request.files['video'].filename:
+            # 上传的视频文件
+            temp_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+            temp_file.close()
+            video_path = temp_file.name
+            request.files['video'].save(video_path)
+        else:
+            text = (data.get('url') or '').strip()
+            if not text:
+                return jsonify({'success': False, 'error': '请上传视频或输入视频链接'}), 400
+
+            urls = re.findall(r'https?://[^\s<>"{}|\\^`\[\]]+', text)
+            url = urls[0] if urls else text
+
+            # 抖音分享链接需要先解析出无水印视频地址
+            if any(domain in url for domain in ['douyin.com', 'iesdouyin.com']):
+                async def do_parse():
+                    parser = DouyinVideoParser()
+                    try:
+                        return await parser.parse(url)
+                    finally:
+                        await parser.close()
+
+                url = run_sync(do_parse()).video_url
+
+            video_path = _download_video_to_temp(url)
+
+        output_ext = '.webm' if output_format == 'webm' else '.zip'
+        output_filename = f'video_{uuid.uuid4().hex[:12]}_nobg{output_ext}'
+        output_path = os.path.join(session_output_dir(), output_filename)
+
+        gate = get_gate('inference')
+        matting = VideoMatting(model_name=model_name)
+        video_info = matting.probe(video_path)
+        matting.check_duration(video_info)
+        units = min(matting.estimate_keyframes(video_info), max(1, gate.capacity // 2))
+        with gate.admit(units):
+            stats = run_remove_video_background(video_path, output_path, output_format, model_name=model_name)
+
+        return jsonify({
+            'success': True,
+            'processed': output_filename,
+            'download_url': f'/download/{output_filename}',
+            'stats': stats
+        })
+
+    except Overloaded:
+        raise
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"视频抠图失败: {e}", flush=True)
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': f'处理失败: {str(e)}'}), 500
+    finally:
+        if video_path and os.path.exists(video_path):
+            os.remove(video_path)
+
+
+def _download_video_to_temp(video_url):
+    """下载视频到临时文件，返回文件路径"""
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15',
+        'Referer': 'https://www.douyin.com/',
+        'Accept': '*/*',
+    }
+
+    temp_file = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False)
+    try:
+        with get_client('cdn').stream('GET', video_url, headers=headers) as response:
+            if response.status_code != 200:
+                raise Exception(f"下载视频失败: HTTP {response.status_code}")
+            for chunk in response.iter_bytes(1024 * 1024):
+                temp_file.write(chunk)
+        temp_file.close()
+        return temp_file.name
+    except Exception:
+        temp_file.close()
+        os.remove(temp_file.name)
+        raise
+
+
+def tts_json_result(result: dict) -> dict:
+    """旧版 JSON 响应：音频转为 base64 字符串（不含 data URI 前缀）"""
+    result = dict(result)
+    audio_data = result.pop('audio_data')
+    result['audio'] = base64.b64encode(audio_data).decode()
+    result['size'] = len(audio_data)
+    result['format'] = 'mp3'
+    return result
+
+
+def tts_audio_headers(result: dict, audio_id: str) -> dict:
+    """二进制音频响应的元数据头"""
+    return {
+        'X-Audio-Id': audio_id,
+        'X-Audio-Url': f'/tts_audio/{audio_id}',
+        'X-Audio-Size': str(len(result['audio_data'])),
+        'X-TTS-Engine': result.get('engine', ''),
+        'X-TTS-Voice': str(result.get('voice', '')),
+    }
+
+
+def wants_json_audio(data: dict, args, accept_mimetypes) -> bool:
+    """旧客户端兼容：format=json，或 Accept 中 JSON 优先于音频时返回 base64 JSON"""
+    if (data.get('format') or args.get('format')) == 'json':
+        return True
+    return accept_mimetypes.best_match(['audio/mpeg', 'application/json']) == 'application/json'
+
+
+def audio_file_response(audio_data: bytes, audio_id: str):
+    """以 audio/mpeg 返回音频，支持 Range 分段请求和条件请求"""
+    return send_file(
+        io.BytesIO(audio_data),
+        mimetype='audio/mpeg',
+        download_name=f'tts_{audio_id[:8]}.mp3',
+        conditional=True,
+        etag=audio_id,
+        max_age=config.AUDIO_CACHE_CONFIG['ttl']
+    )
+
+
+def tts_response(result: dict, data: dict):
+    """TTS 接口响应：默认直接返回 MP3 字节（元数据在响应头中），失败或旧客户端返回 JSON"""
+    if not result.get('success'):
+        return jsonify(result)
+    if wants_json_audio(data, request.args, request.accept_mimetypes):
+        return jsonify(tts_json_result(result))
+
+    audio_id = get_audio_cache().put(result['audio_data'], {
+        'engine': result.get('engine'),
+        'voice': result.get('voice'),
+    })
+    response = audio_file_response(result['audio_data'], audio_id)
+    response.headers.update(tts_audio_headers(result, audio_id))
+    return response
+
+
+@app.route('/tts_audio/<audio_id>')
+def tts_audio(audio_id):
+    """读取最近合成的音频（支持 Range，播放器拖动进度条时按需分段读取）"""
+    entry = get_audio_cache().get(audio_id)
+    if entry is None:
+        return jsonify({'success': False, 'error': '音频已过期，请重新合成'}), 404
+    return audio_file_response(entry['audio'], audio_id)
+
+
+@limited('tts')
+async def synthesize_speech_data(data):
+    """
+    文字转语音（阿里云），Flask 与 ASGI 路由共用
+
+    Returns:
+        响应字典 {'success': bool, 'audio_data'/'error': ...}，音频为原始 MP3 字节（见 tts_response）
+    """
     try:
         from aliyun_tts import text_to_speech, AliyunTTS
 
-        data = request.get_json()
         text = data.get('text', '').strip()
         voice = data.get('voice', 'xiaoyun')
         speech_rate = int(data.get('speech_rate', 0))
@@ -702,48 +1256,52 @@ def synthesize_speech():
         volume = int(data.get('volume', 50))
 
         if not text:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '请输入要合成的文本'
-            })
+            }
 
         if len(text) > 1000:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '文本长度不能超过1000字符'
-            })
+            }
 
         print(f"TTS合成 - 文本: {text[:50]}..., 声音: {voice}")
 
-        # 异步合成语音
-        async def do_synthesize():
-            return await text_to_speech(
-                text=text,
-                voice=voice,
-                speech_rate=speech_rate,
-                pitch_rate=pitch_rate,
-                volume=volume
-            )
-
-        audio_data = asyncio.run(do_synthesize())
-
-        # 转换为base64返回（只返回纯base64字符串，不包含data URI前缀）
-        audio_base64 = base64.b64encode(audio_data).decode()
+        # 相同文本和音色参数正在合成时，等待同一个合成结果
+        audio_data = await get_flight('tts').run(
+            flight_key('aliyun', text, voice, speech_rate, pitch_rate, volume),
+            text_to_speech,
+            text=text,
+            voice=voice,
+            speech_rate=speech_rate,
+            pitch_rate=pitch_rate,
+            volume=volume
+        )
 
-        return jsonify({
+        return {
             'success': True,
-            'audio': audio_base64,
-            'size': len(audio_data)
-        })
+            'audio_data': audio_data,
+            'engine': 'aliyun',
+            'voice': voice
+        }
 
     except Exception as e:
         print(f"TTS合成失败: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': f'合成失败: {str(e)}'
-        })
+        }
+
+
+@app.route('/synthesize_speech', methods=['POST'])
+def synthesize_speech():
+    """文字转语音"""
+    data = request.get_json(silent=True) or {}
+    return tts_response(run_sync(synthesize_speech_data(data)), data)
 
 
 @app.route('/get_voices', methods=['GET'])
@@ -771,13 +1329,17 @@ def get_voices():
         })
 
 
-@app.route('/synthesize_speech_tencent', methods=['POST'])
-def synthesize_speech_tencent():
-    """文字转语音（腾讯云）"""
+@limited('tts')
+async def synthesize_speech_tencent_data(data):
+    """
+    文字转语音（腾讯云），Flask 与 ASGI 路由共用
+
+    Returns:
+        响应字典 {'success': bool, 'audio_data'/'error': ...}，音频为原始 MP3 字节（见 tts_response）
+    """
     try:
         from tencent_tts import text_to_speech_tencent
 
-        data = request.get_json()
         text = data.get('text', '').strip()
         voice = data.get('voice', '502004')  # 默认营销女声
         speed = float(data.get('speed', 0))
@@ -785,48 +1347,51 @@ def synthesize_speech_tencent():
         emotion = data.get('emotion', None)
 
         if not text:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '请输入要合成的文本'
-            })
+            }
 
         if len(text) > 1000:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '文本长度不能超过1000字符'
-            })
+            }
 
         print(f"腾讯云TTS合成 - 文本: {text[:50]}..., 音色: {voice}")
 
-        # 异步合成语音
-        async def do_synthesize():
-            return await text_to_speech_tencent(
-                text=text,
-                voice=voice,
-                speed=speed,
-                volume=volume,
-                emotion=emotion
-            )
-
-        audio_data = asyncio.run(do_synthesize())
-
-        # 转换为base64返回（只返回纯base64字符串，不包含data URI前缀）
-        audio_base64 = base64.b64encode(audio_data).decode()
+        audio_data = await get_flight('tts').run(
+            flight_key('tencent', text, voice, speed, volume, emotion),
+            text_to_speech_tencent,
+            text=text,
+            voice=voice,
+            speed=speed,
+            volume=volume,
+            emotion=emotion
+        )
 
-        return jsonify({
+        return {
             'success': True,
-            'audio': audio_base64,
-            'size': len(audio_data)
-        })
+            'audio_data': audio_data,
+            'engine': 'tencent',
+            'voice': voice
+        }
 
     except Exception as e:
         print(f"腾讯云TTS合成失败: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': f'合成失败: {str(e)}'
-        })
+        }
+
+
+@app.route('/synthesize_speech_tencent', methods=['POST'])
+def synthesize_speech_tencent():
+    """文字转语音（腾讯云）"""
+    data = request.get_json(silent=True) or {}
+    return tts_response(run_sync(synthesize_speech_tencent_data(data)), data)
 
 
 @app.route('/get_voices_tencent', methods=['GET'])
@@ -863,59 +1428,71 @@ def get_voices_tencent():
         })
 
 
-@app.route('/synthesize_speech_custom', methods=['POST'])
-def synthesize_speech_custom():
-    """文字转语音（腾讯云自定义音色 - 专业声音复刻）"""
+@limited('tts')
+async def synthesize_speech_custom_data(data):
+    """
+    文字转语音（腾讯云自定义音色），Flask 与 ASGI 路由共用
+
+    Returns:
+        响应字典 {'success': bool, 'audio_data'/'error': ...}，音频为原始 MP3 字节（见 tts_response）
+    """
     try:
         from tencent_custom_voice_tts import text_to_speech_custom_voice
 
-        data = request.get_json()
         text = data.get('text', '').strip()
         voice_id = data.get('voice_id', 'WCHN-add2502611834078ac62ba7dd8d2458e')  # 你的自定义音色ID
         speed = float(data.get('speed', 1.5))
         volume = float(data.get('volume', 10))
 
         if not text:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '请输入要合成的文本'
-            })
+            }
 
         if len(text) > 1000:
-            return jsonify({
+            return {
                 'success': False,
                 'error': '文本长度不能超过1000字符'
-            })
+            }
 
         print(f"自定义音色TTS合成 - 文本: {text[:50]}..., 音色ID: {voice_id}")
 
-        # 异步合成语音
-        async def do_synthesize():
-            return await text_to_speech_custom_voice(
-                text=text,
-                voice_id=voice_id,
-                speed=speed,
-                volume=volume
-            )
-
-        audio_data = asyncio.run(do_synthesize())
-
-        # 返回Base64编码的音频
-        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        audio_data = await get_flight('tts').run(
+            flight_key('tencent_custom', text, voice_id, speed, volume),
+            text_to_speech_custom_voice,
+            text=text,
+            voice_id=voice_id,
+            speed=speed,
+            volume=volume
+        )
 
-        return jsonify({
+        return {
             'success': True,
-            'audio': audio_base64,
-            'format': 'mp3'
-        })
+            'audio_data': audio_data,
+            'engine': 'tencent_custom',
+            'voice': voice_id
+        }
 
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({
+        return {
             'success': False,
             'error': f'合成失败: {str(e)}'
-        })
+        }
+
+
+@app.route('/synthesize_speech_custom', methods=['POST'])
+def synthesize_speech_custom():
+    """文字转语音（腾讯云自定义音色 - 专业声音复刻）"""
+    data = request.get_json(silent=True) or {}
+    return tts_response(run_sync(synthesize_speech_custom_data(data)), data)
+
+
+# 后台预热常用子系统，完成前到达的请求在首次使用时自行加载
+subsystems.start_warmup(subsystems.warmup_names(config.SUBSYSTEM_CONFIG['warmup']))
+subsystems.mark_ready()
 
 
 if __name__ == '__main__':
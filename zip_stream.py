@@ -0,0 +1,130 @@
+"""
+流式 ZIP 打包
+
+边生成边输出 ZIP 数据：每写完一块就把字节交给响应，不需要先在内存或磁盘上拼出完整的压缩包，
+首字节立即返回，峰值内存与单个分块大小相当。
+PNG/JPEG/WebP 等本身已压缩的格式使用 ZIP_STORED 直接存储，避免无意义的二次压缩。
+"""
+
+import io
+import os
+import time
+import zipfile
+
+# 已压缩格式：直接存储
+STORED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif', '.mp4', '.webm', '.mp3', '.zip'}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamBuffer(io.RawIOBase):
+    """只写、不可 seek 的缓冲区；zipfile 会为每个条目写数据描述符（data descriptor）"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        """取出目前已写入的数据"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(arcname: str) -> int:
+    """按扩展名选择压缩方式"""
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _iter_source(source):
+    """把条目内容统一为字节分块：bytes、文件路径或字节分块的可迭代对象"""
+    if isinstance(source, (bytes, bytearray)):
+        for start in range(0, len(source), CHUNK_SIZE):
+            yield source[start:start + CHUNK_SIZE]
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    else:
+        yield from source
+
+
+class ZipStreamWriter:
+    """
+    增量 ZIP 写入器：每次 add() 返回该条目对应的 ZIP 字节，close() 返回中央目录
+
+    供异步代码使用（条目内容需要 await 获取时，无法直接交给 stream_zip 的同步迭代）
+    """
+
+    def __init__(self):
+        self._buffer = _StreamBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, 'w', allowZip64=True)
+
+    def iter_add(self, arcname: str, source):
+        """写入一个条目，逐块产出 ZIP 数据"""
+        zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+        zinfo.compress_type = compress_type_for(arcname)
+        zinfo.external_attr = 0o644 << 16
+        if isinstance(source, (bytes, bytearray)):
+            zinfo.file_size = len(source)
+        elif isinstance(source, str):
+            zinfo.file_size = os.path.getsize(source)
+
+        with self._zip.open(zinfo, 'w') as dest:
+            for chunk in _iter_source(source):
+                dest.write(chunk)
+                data = self._buffer.drain()
+                if data:
+                    yield data
+
+        data = self._buffer.drain()
+        if data:
+            yield data
+
+    def add(self, arcname: str, source) -> bytes:
+        """写入一个条目，返回该条目的全部 ZIP 数据"""
+        return b''.join(self.iter_add(arcname, source))
+
+    def close(self) -> bytes:
+        """写入中央目录，返回剩余数据"""
+        self._zip.close()
+        return self._buffer.drain()
+
+
+def stream_zip(entries):
+    """
+    生成 ZIP 数据流
+
+    Args:
+        entries: 可迭代的 (压缩包内文件名, 内容)，内容可以是 bytes、文件路径或字节分块迭代器；
+                 可以是惰性生成器（例如边下载边打包），内容为 None 的条目会被跳过
+
+    Yields:
+        ZIP 数据块
+    """
+    writer = ZipStreamWriter()
+    for arcname, source in entries:
+        if source is None:
+            continue
+        yield from writer.iter_add(arcname, source)
+
+    # 中央目录
+    data = writer.close()
+    if data:
+        yield data